@@ -0,0 +1,56 @@
+"""
+Encode cost per order of the pre-encoded order templates compared to
+Order.as_dict with the stdlib json encoder used by requests' json= argument.
+
+    python3 benchmarks/bench_encode.py -n 100000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rest_client"))
+
+import rest_client
+from rest_client import Client, Order
+from encoding import OrderEncoder, json_dumps, orjson
+from utils import Side
+
+
+def requests_json(order: Order) -> bytes:
+    # what requests does for json=order.as_dict()
+    return json.dumps(order.as_dict(), allow_nan=False).encode("utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order encoding benchmark")
+    parser.add_argument("-n", dest="number", type=int, default=100000, help="Orders encoded per measurement")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    config = rest_client.config
+    client = Client(config, Order(side="buy"))
+    encoder = OrderEncoder(use_templates=True)
+
+    for side, settings in ((Side.BUY, config.buyer), (Side.SELL, config.seller)):
+        order, _, _ = client.set_random_order_parameters(settings, side, config)
+        assert json.loads(encoder.encode(order)) == json.loads(requests_json(order))
+
+        candidates = {
+            "as_dict + json": lambda: requests_json(order),
+            f"as_dict + {'orjson' if orjson else 'json'}": lambda: json_dumps(order.as_dict()),
+            "template": lambda: encoder.encode(order),
+        }
+        print(f"{side.value} order, {len(requests_json(order))} bytes")
+        baseline = None
+        for name, func in candidates.items():
+            per_order = min(timeit.repeat(func, number=args.number, repeat=3)) / args.number
+            baseline = baseline or per_order
+            print(f"  {name:20s} {per_order * 1e6:7.2f} us/order  {baseline / per_order:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
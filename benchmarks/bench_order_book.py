@@ -0,0 +1,78 @@
+"""
+Order book updates per second, replaying a recorded orderbook feed.
+
+The feed is recorded from the orderbook endpoint of the stub marketplace
+into a JSON lines file, or an existing recording of the live feed is used.
+
+    python3 benchmarks/bench_order_book.py -n 10000 -r 10
+    python3 benchmarks/bench_order_book.py --feed orderbook.jsonl
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ws_client"))
+
+import ws_client
+from order_book import OrderBook
+from stub_server import StubMarketplace
+
+
+def record_feed(stub: StubMarketplace, path: str, messages: int) -> None:
+    """Record `messages` messages of the stub orderbook endpoint as JSON lines."""
+    stub.ws_messages = messages
+    url = f"wss://{stub.host}/api/v1/ws/orderbook/"
+    with open(path, "w") as f, contextlib.redirect_stdout(io.StringIO()):
+        client = ws_client.WebSocketClient(url, token="stub-token", fast=True,
+                                           on_parsed=lambda channel, message: f.write(json.dumps(message) + "\n"))
+        client.receive_thread.join()
+        client.consumer.stop()
+
+
+def load_feed(path: str) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(feed: list[dict], book: OrderBook = None, repeat: int = 1) -> float:
+    """Updates per second of OrderBook.apply for the parsed feed, the best of `repeat` replays."""
+    book = book or OrderBook()
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in feed:
+            book.apply(message)
+            book.spread()
+        best = max(best, len(feed) / (time.perf_counter() - start))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order book replay benchmark")
+    parser.add_argument("-n", dest="number", type=int, default=10000, help="Messages recorded from the stub")
+    parser.add_argument("-r", dest="repeat", type=int, default=10, help="Number of replays of the feed")
+    parser.add_argument("--feed", default=None, help="Replay this recorded JSON lines feed instead of recording one")
+    args = parser.parse_args()
+
+    if args.feed:
+        feed = load_feed(args.feed)
+    else:
+        with tempfile.TemporaryDirectory() as tmpdir, StubMarketplace() as stub:
+            path = os.path.join(tmpdir, "orderbook.jsonl")
+            record_feed(stub, path, args.number)
+            feed = load_feed(path)
+
+    book = OrderBook()
+    rate = replay(feed, book, args.repeat)
+    print(f"{len(feed)} messages, {rate:.0f} updates/s, {1e6 / rate:.2f} us/update")
+    print(f"final book {book.summary()}, mid price {book.mid_price()}")
+
+
+if __name__ == "__main__":
+    main()
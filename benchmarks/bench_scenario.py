@@ -0,0 +1,73 @@
+"""
+Orders generated per second by Client.set_random_order_parameters, one at a time,
+compared to the NumPy batches of scenario.ScenarioGenerator.
+
+    python3 benchmarks/bench_scenario.py -n 1000000
+"""
+
+import argparse
+import datetime as dt
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rest_client"))
+
+import rest_client
+from rest_client import Client, Order
+from batch import order_from_record, read_records
+from scenario import ScenarioGenerator
+from utils import Side
+
+
+def per_order_rate(client: Client, orders: int) -> float:
+    config = client.config
+    start = time.perf_counter()
+    for _ in range(orders):
+        client.set_random_order_parameters(config.buyer, Side.BUY, config)
+    return orders / (time.perf_counter() - start)
+
+
+def scenario_orders_rate(generator: ScenarioGenerator, orders: int) -> float:
+    """Order objects per second of ScenarioGenerator.orders, as sent with AsyncOrderEngine."""
+    start = time.perf_counter()
+    for _ in generator.orders(orders):
+        pass
+    return orders / (time.perf_counter() - start)
+
+
+def scenario_file_rate(generator: ScenarioGenerator, orders: int, path: str) -> float:
+    """Orders per second written to a batch file by ScenarioGenerator.write."""
+    start = time.perf_counter()
+    generator.write(path, orders)
+    return orders / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order generation benchmark")
+    parser.add_argument("-n", dest="number", type=int, default=1000000, help="Orders generated per measurement, the per order loop generates n/10")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    config = rest_client.config
+    client = Client(config, Order(side="buy"))
+    generator = ScenarioGenerator(config.buyer, Side.BUY, dt.datetime.now(dt.timezone.utc), seed=1)
+
+    baseline = per_order_rate(client, max(1, args.number // 10))
+    print(f"{'set_random_order_parameters':28s} {baseline:12.0f} orders/s")
+    rate = scenario_orders_rate(generator, args.number)
+    print(f"{'ScenarioGenerator.orders':28s} {rate:12.0f} orders/s  {rate / baseline:6.1f}x")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "orders.jsonl")
+        rate = scenario_file_rate(generator, args.number, path)
+        print(f"{'ScenarioGenerator.write':28s} {rate:12.0f} orders/s  {rate / baseline:6.1f}x, {os.path.getsize(path) / 1e6:.0f} MB")
+        # the written file is valid input of the batch mode
+        for _, record in itertools.islice(read_records(path), 1000):
+            order_from_record(record, "buy")
+
+
+if __name__ == "__main__":
+    main()
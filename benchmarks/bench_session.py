@@ -0,0 +1,59 @@
+"""
+Compare orders per second with and without the keep-alive connection pool.
+
+    python3 benchmarks/bench_session.py -n 200
+"""
+
+import argparse
+import dataclasses
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rest_client"))
+
+import rest_client
+from rest_client import Client, Order
+from utils import Side
+from stub_server import StubMarketplace
+
+
+def run(host: str, orders: int, keep_alive: bool) -> float:
+    """Send orders to the stub and return the achieved orders per second."""
+    # a copy, the runs with and without keep alive do not share settings
+    config = rest_client.config
+    config = dataclasses.replace(config,
+                                 market=dataclasses.replace(config.market, host=host, ssl_verify=False),
+                                 session=dataclasses.replace(config.session, keep_alive=keep_alive))
+
+    client = Client(config, Order(side="buy"))
+    client.auth.token_new()
+
+    start = time.perf_counter()
+    for _ in range(orders):
+        order, _, _ = client.set_random_order_parameters(config.buyer, Side.BUY, config)
+        response = client.send_order(order.as_dict())
+        response.raise_for_status()
+    elapsed = time.perf_counter() - start
+    client.session.close()
+    return orders / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connection pooling benchmark")
+    parser.add_argument("-n", dest="orders", type=int, default=200, help="Number of orders per run")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with StubMarketplace() as stub:
+        without_pool = run(stub.host, args.orders, keep_alive=False)
+        with_pool = run(stub.host, args.orders, keep_alive=True)
+
+    print(f"without pooling: {without_pool:8.1f} orders/s")
+    print(f"with pooling:    {with_pool:8.1f} orders/s")
+    print(f"speedup:         {with_pool / without_pool:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Cold start cost of the client entry points: import time per module and wall time of short-lived processes.
+
+    python3 benchmarks/bench_startup.py -r 20
+    # side by side with the tree of another commit, e.g. the one before a change
+    python3 benchmarks/bench_startup.py -r 20 --baseline <commit>
+
+The import times are read from `python -X importtime`, the wall times are
+the fastest of `-r` fresh interpreter processes, for --help and for one
+order sent with --run-once to the stub marketplace. The baseline tree is
+extracted with `git archive` and measured the same way.
+"""
+
+import argparse
+import compileall
+import contextlib
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+REST_CLIENT_DIR = os.path.join(ROOT, "rest_client")
+WS_CLIENT_DIR = os.path.join(ROOT, "ws_client")
+
+# the stub has a self signed certificate, so the one-shot order runs main() with ssl verify disabled
+ONE_SHOT_ORDER = ("import sys, rest_client; rest_client.config.market.ssl_verify = False; "
+                  "sys.argv = ['rest_client.py', 'buy', '--host', sys.argv[1], '-u', 'user', '-p', 'password', '--run-once']; "
+                  "rest_client.main()")
+
+
+def import_times(directory: str, module: str) -> list[tuple[int, int, str]]:
+    """(self us, cumulative us, module) of every module imported by `import module` in a fresh interpreter."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=directory, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times.append((int(own), int(cumulative), name.strip()))
+    return times
+
+
+def wall_time(command: list[str], directory: str, repeat: int) -> float:
+    """Fastest wall time in seconds of `repeat` runs of command."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def one_shot_order_seconds(host: str, repeat: int, directory: str = REST_CLIENT_DIR) -> float:
+    """Fastest wall time of a process sending one order to host with rest_client.py --run-once."""
+    return wall_time([sys.executable, "-c", ONE_SHOT_ORDER, host], directory, repeat)
+
+
+@contextlib.contextmanager
+def checkout(commit: str):
+    """Temporary directory with the tree of commit, without touching the working tree."""
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as directory:
+        archive = subprocess.run(["git", "archive", commit], cwd=ROOT, capture_output=True, check=True).stdout
+        subprocess.run(["tar", "-x", "-C", directory], input=archive, check=True)
+        yield directory
+
+
+def startup_times(root: str, repeat: int, host: str = None, top: int = 0) -> dict[str, float]:
+    """Milliseconds of the imports and short-lived processes of the entry points in the tree at root.
+
+    The `top` slowest modules of every import are printed, the one-shot
+    order is only sent with a host.
+    """
+    times = {}
+    for module in ("rest_client", "ws_client"):
+        directory = os.path.join(root, module)
+        # measured with an up to date bytecode cache, also with PYTHONDONTWRITEBYTECODE set
+        compileall.compile_dir(directory, quiet=1)
+        modules = import_times(directory, module)
+        times[f"import {module}"] = next(cumulative for _, cumulative, name in modules if name == module) / 1000
+        if top:
+            print(f"import {module}: {times[f'import {module}']:.1f}ms, {len(modules)} modules, slowest:")
+            for own, cumulative, name in sorted(modules, reverse=True)[:top]:
+                print(f"    {name:40s} {own / 1000:6.1f}ms self {cumulative / 1000:6.1f}ms cumulative")
+    times["python -c pass"] = wall_time([sys.executable, "-c", "pass"], root, repeat) * 1000
+    for module in ("rest_client", "ws_client"):
+        times[f"{module}.py --help"] = wall_time([sys.executable, f"{module}.py", "--help"], os.path.join(root, module), repeat) * 1000
+    if host is not None:
+        times["rest_client.py --run-once"] = one_shot_order_seconds(host, repeat, os.path.join(root, "rest_client")) * 1000
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark of the client entry points")
+    parser.add_argument("-r", dest="repeat", type=int, default=10, help="Processes per wall time measurement")
+    parser.add_argument("--top", type=int, default=10, help="Number of the slowest modules listed per entry point")
+    parser.add_argument("--no-stub", dest="stub", action="store_false", help="Skip the one-shot order against the stub marketplace")
+    parser.add_argument("--baseline", metavar="COMMIT", help="Also measure the tree of this commit, e.g. the one before a change")
+    args = parser.parse_args()
+
+    with contextlib.ExitStack() as stack:
+        host = None
+        if args.stub:
+            from stub_server import StubMarketplace
+            host = stack.enter_context(StubMarketplace()).host
+        current = startup_times(ROOT, args.repeat, host, args.top)
+        baseline = None
+        if args.baseline:
+            baseline = startup_times(stack.enter_context(checkout(args.baseline)), args.repeat, host)
+
+    if baseline is None:
+        for name, ms in current.items():
+            print(f"{name:32s} {ms:8.1f}ms")
+        return
+    print(f"{'':32s} {args.baseline[:12]:>10s} {'current':>10s}")
+    for name, ms in current.items():
+        print(f"{name:32s} {baseline[name]:8.1f}ms {ms:8.1f}ms {(ms / baseline[name] - 1) * 100:+6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
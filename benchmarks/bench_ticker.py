@@ -0,0 +1,47 @@
+"""
+Per tick cost of TickerAnalytics for growing windows, and the cost of the statistics queries.
+
+    python3 benchmarks/bench_ticker.py -n 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ws_client"))
+
+from ticker_analytics import TickerAnalytics
+from stub_server import ws_message
+
+
+def ticks_per_s(analytics: TickerAnalytics, ticks: list[dict]) -> float:
+    start = time.perf_counter()
+    for tick in ticks:
+        analytics.on_message("ticker", tick)
+    return len(ticks) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ticker analytics benchmark")
+    parser.add_argument("-n", dest="number", type=int, default=100000, help="Ticks per measurement")
+    args = parser.parse_args()
+
+    ticks = [ws_message("/api/v1/ws/ticker/", seq) for seq in range(args.number)]
+    for capacity in (1000, 10000, 100000, 1000000):
+        analytics = TickerAnalytics(capacity)
+        rate = ticks_per_s(analytics, ticks)
+        queries = {
+            "vwap": lambda: analytics.vwap(),
+            "volatility": lambda: analytics.volatility(),
+            "by country": lambda: analytics.volume_by_country(),
+            "by slot": lambda: analytics.volume_by_slot(),
+        }
+        timings = ", ".join(f"{name} {min(timeit.repeat(query, number=10, repeat=3)) / 10 * 1e6:.0f}us"
+                            for name, query in queries.items())
+        print(f"capacity {capacity:8d}: {rate:9.0f} ticks/s, {1e6 / rate:.2f} us/tick, window {len(analytics)}: {timings}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Benchmark suite running the REST and websocket clients against the local stub marketplace.
+
+    # run all benchmarks and save the results
+    python3 benchmarks/run_benchmarks.py --save results.json
+
+    # run again and fail if a result is more than 20% worse than the saved one
+    python3 benchmarks/run_benchmarks.py --compare results.json --tolerance 0.2
+
+Every benchmark returns a value where higher is better, so results of
+two runs can be compared without knowing the unit.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "rest_client"))
+sys.path.insert(0, os.path.join(ROOT, "ws_client"))
+# token_cache.py, imported by const
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+
+import const
+import rest_client
+from rest_client import Client, Order
+from engine import AsyncOrderEngine
+from utils import Side
+import ws_client
+from multiplex import MultiplexClient
+from message_store import SegmentWriter
+from replay import FeedReplayer
+from bench_order_book import load_feed, record_feed, replay
+from stub_server import StubMarketplace, ws_message
+
+
+def make_client(host: str, pool_size: int = const.DEFAULT_POOL_SIZE) -> Client:
+    """Client of the stub with a copy of the default config, so the benchmarks do not change each other's settings."""
+    config = rest_client.config
+    config = dataclasses.replace(config,
+                                 market=dataclasses.replace(config.market, host=host, ssl_verify=False),
+                                 user=dataclasses.replace(config.user, token_cache=None),
+                                 params=dataclasses.replace(config.params, rate=0, max_rate=0, runtime=0),
+                                 session=dataclasses.replace(config.session, pool_size=pool_size))
+    return Client(config, Order(side="buy"))
+
+
+def bench_serial_orders(stub: StubMarketplace, orders: int) -> float:
+    """Orders per second of Client.send_order in a loop."""
+    client = make_client(stub.host)
+    client.auth.token_new()
+    start = time.perf_counter()
+    for _ in range(orders):
+        order, _, _ = client.set_random_order_parameters(client.config.buyer, Side.BUY, client.config)
+        client.send_order(client.encoder.encode(order))
+    return orders / (time.perf_counter() - start)
+
+
+def bench_engine_orders(stub: StubMarketplace, orders: int, concurrency: int = 10) -> float:
+    """Orders per second of the asyncio engine with `concurrency` orders in flight."""
+    # every order in flight needs its own connection, like main() of rest_client.py
+    client = make_client(stub.host, pool_size=concurrency)
+    order, _, _ = client.set_random_order_parameters(client.config.buyer, Side.BUY, client.config)
+    engine = AsyncOrderEngine(client, concurrency, orders=(order for _ in range(orders)))
+    start = time.perf_counter()
+    asyncio.run(engine.run())
+    return orders / (time.perf_counter() - start)
+
+
+def bench_token_refresh(stub: StubMarketplace, refreshes: int) -> float:
+    """Token refreshes per second, the inverse of the refresh overhead."""
+    client = make_client(stub.host)
+    client.auth.token_new()
+    start = time.perf_counter()
+    for _ in range(refreshes):
+        client.auth.token_refresh()
+    return refreshes / (time.perf_counter() - start)
+
+
+def bench_websocket_messages(stub: StubMarketplace, messages: int, fast: bool = False) -> float:
+    """Messages per second received and parsed by WebSocketClient from the ticker endpoint."""
+    stub.ws_messages = messages
+    url = f"wss://{stub.host}/api/v1/ws/ticker/"
+    # console output is part of what is measured
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        client = ws_client.WebSocketClient(url, token="stub-token", fast=fast)
+        client.receive_thread.join()
+        if fast:
+            client.consumer.stop()
+        elapsed = time.perf_counter() - start
+    received = len(client.received_messages)
+    if received != messages:
+        raise RuntimeError(f"received {received} of {messages} messages")
+    return received / elapsed
+
+
+def bench_idle_listeners(stub: StubMarketplace, listeners: int) -> float:
+    """Idle WebSocketClient listeners started, connected and shut down again per second."""
+    saved = stub.ws_messages, stub.ws_rate
+    # one message, the next one would follow after 1000s
+    stub.ws_messages, stub.ws_rate = 2, 0.001
+    url = f"wss://{stub.host}/api/v1/ws/ticker/"
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            clients = [ws_client.WebSocketClient(url, token="stub-token", fast=True) for _ in range(listeners)]
+            for client in clients:
+                client.connected.wait()
+            for client in clients:
+                client.stop()
+            for client in clients:
+                client.closed.wait()
+                client.consumer.stop()
+            elapsed = time.perf_counter() - start
+    finally:
+        stub.ws_messages, stub.ws_rate = saved
+    return listeners / elapsed
+
+
+def bench_multiplex_messages(stub: StubMarketplace, messages: int) -> float:
+    """Messages per second of MultiplexClient subscribed to the trade, ticker and orderbook endpoints."""
+    stub.ws_messages = messages // 3
+    address, port = stub.host.split(":")
+    client = MultiplexClient(address, int(port), token="stub-token")
+    for endpoint in stub.ws_endpoints:
+        client.subscribe(endpoint)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        asyncio.run(client.run())
+        elapsed = time.perf_counter() - start
+    received = len(client.received_messages)
+    expected = min(stub.ws_messages * 3, client.received_messages.capacity)
+    if received != expected:
+        raise RuntimeError(f"received {received} of {expected} messages")
+    return stub.ws_messages * 3 / elapsed
+
+
+def bench_replay(stub: StubMarketplace, messages: int, compress: bool = False) -> float:
+    """Messages per second replayed from a recording of the ticker feed into the fast mode pipeline."""
+    stub.ws_messages = messages
+    url = f"wss://{stub.host}/api/v1/ws/ticker/"
+    with tempfile.TemporaryDirectory() as tmpdir, contextlib.redirect_stdout(io.StringIO()):
+        recorder = SegmentWriter(tmpdir, prefix="ticker", compress=compress)
+        client = ws_client.WebSocketClient(url, token="stub-token", fast=True, recorder=recorder)
+        client.receive_thread.join()
+        client.consumer.stop()
+        recorder.close()
+
+        client = ws_client.WebSocketClient(url, fast=True, connect=False)
+        start = time.perf_counter()
+        replayed = FeedReplayer(tmpdir, "ticker").run(client.enqueue_message)
+        client.consumer.stop()
+        elapsed = time.perf_counter() - start
+    if replayed != messages or len(client.received_messages) != min(messages, client.received_messages.capacity):
+        raise RuntimeError(f"replayed {replayed} of {messages} messages")
+    return replayed / elapsed
+
+
+def bench_ticker_analytics(stub: StubMarketplace, ticks: int) -> float:
+    """Ticks per second added to TickerAnalytics with a window of 100000 ticks."""
+    from ticker_analytics import TickerAnalytics
+    from bench_ticker import ticks_per_s
+    return ticks_per_s(TickerAnalytics(100000), [ws_message("/api/v1/ws/ticker/", seq) for seq in range(ticks)])
+
+
+def bench_scenario(stub: StubMarketplace, orders: int) -> float:
+    """Orders per second generated by ScenarioGenerator and written to a batch file."""
+    import datetime as dt
+    from scenario import ScenarioGenerator
+    from bench_scenario import scenario_file_rate
+    generator = ScenarioGenerator(rest_client.config.buyer, Side.BUY, dt.datetime.now(dt.timezone.utc), seed=1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        return scenario_file_rate(generator, orders, os.path.join(tmpdir, "orders.jsonl"))
+
+
+def bench_order_book(stub: StubMarketplace, messages: int) -> float:
+    """Order book updates per second replaying a feed recorded from the orderbook endpoint."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "orderbook.jsonl")
+        record_feed(stub, path, messages)
+        feed = load_feed(path)
+    return replay(feed, repeat=5)
+
+
+BENCHMARKS = {
+    "serial_orders_per_s": lambda stub, n: bench_serial_orders(stub, n),
+    "engine_orders_per_s": lambda stub, n: bench_engine_orders(stub, n),
+    "token_refresh_per_s": lambda stub, n: bench_token_refresh(stub, max(1, n // 10)),
+    "ws_messages_per_s": lambda stub, n: bench_websocket_messages(stub, n * 10),
+    "ws_fast_messages_per_s": lambda stub, n: bench_websocket_messages(stub, n * 10, fast=True),
+    "ws_multiplex_messages_per_s": lambda stub, n: bench_multiplex_messages(stub, n * 10),
+    "ws_idle_listeners_per_s": lambda stub, n: bench_idle_listeners(stub, max(1, n // 10)),
+    "replay_messages_per_s": lambda stub, n: bench_replay(stub, n * 20),
+    "replay_compressed_messages_per_s": lambda stub, n: bench_replay(stub, n * 20, compress=True),
+    "ticker_ticks_per_s": lambda stub, n: bench_ticker_analytics(stub, n * 100),
+    "order_book_updates_per_s": lambda stub, n: bench_order_book(stub, n * 10),
+    "scenario_orders_per_s": lambda stub, n: bench_scenario(stub, n * 1000),
+}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Names of the benchmarks that got worse than baseline by more than tolerance."""
+    return [name for name, value in results.items()
+            if name in baseline and value < baseline[name] * (1 - tolerance)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GLocalFlex client benchmark suite")
+    parser.add_argument("-n", dest="number", type=int, default=500, help="Orders per benchmark, token refreshes are n/10, websocket messages n*10")
+    parser.add_argument("-k", dest="select", default=None, help="Only run benchmarks containing this string")
+    parser.add_argument("--latency", type=float, default=0, help="Stub response latency in seconds")
+    parser.add_argument("--concurrency", default="10", help="Orders in flight of the engine benchmark, several values give one result each, e.g. 1,10,50")
+    parser.add_argument("--errors", default="", help="Share of order error responses of the stub, e.g. 401=0.01,429=0.05")
+    parser.add_argument("--save", default=None, help="Save the results as JSON to this file")
+    parser.add_argument("--compare", default=None, help="Compare with results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown for --compare")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = {}
+    error_rates = {int(code): float(rate) for code, rate in (item.split("=") for item in args.errors.split(",") if item)}
+    concurrencies = [int(value) for value in args.concurrency.split(",")]
+    benchmarks = {}
+    for name, bench in BENCHMARKS.items():
+        if name == "engine_orders_per_s" and concurrencies != [10]:
+            # more orders in flight only pay off when the round trips dominate, see --latency
+            for concurrency in concurrencies:
+                benchmarks[f"engine_orders_c{concurrency}_per_s"] = \
+                    lambda stub, n, concurrency=concurrency: bench_engine_orders(stub, n, concurrency)
+        else:
+            benchmarks[name] = bench
+    with StubMarketplace(latency=args.latency, error_rates=error_rates) as stub:
+        for name, bench in benchmarks.items():
+            if args.select and args.select not in name:
+                continue
+            results[name] = bench(stub, args.number)
+            print(f"{name:32s} {results[name]:12.1f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name in regressions:
+            print(f"REGRESSION {name}: {results[name]:.1f} < {baseline[name]:.1f}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Local stub of the GLocalFlex marketplace used by the benchmarks.
+
+Serves the token, order and websocket endpoints over TLS with a self signed
+certificate, so the clients can run against it unchanged with ssl verify
+disabled. Requires the openssl command line tool to create the certificate.
+
+Response latency, the share of 401/422/429 order responses and the number
+and rate of websocket messages are configurable:
+
+    with StubMarketplace(latency=0.005, error_rates={429: 0.01}, ws_messages=1000) as stub:
+        ...
+
+Accepted orders get an id, the trade feed sends the updates of the
+accepted orders first, in the order they were accepted. An order resent
+with the Idempotency-Key of an accepted order gets the id of the first
+one and is not accepted twice; with `drop_rate` the responses of some
+accepted orders are lost, like on a read timeout.
+"""
+
+import base64
+import collections
+import hashlib
+import itertools
+import json
+import os
+import random
+import select
+import ssl
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AUTH_ENDPOINT = "/auth/oauth/v2/token"
+ORDER_ENDPOINT = "/api/v1/order/"
+WS_ENDPOINTS = ("/api/v1/ws/trade/", "/api/v1/ws/ticker/", "/api/v1/ws/orderbook/")
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+ERROR_BODIES = {
+    401: {"detail": "Invalid or expired token"},
+    422: {"detail": [{"loc": ["body", "power"], "msg": "value is not a valid float", "type": "type_error.float"}]},
+    429: {"detail": "Too many requests"},
+    500: {"detail": "Internal server error"},
+    503: {"detail": "Service unavailable"},
+}
+
+
+def create_certificate(directory: str) -> tuple[str, str]:
+    """Create a self signed certificate for localhost, returns (certfile, keyfile)."""
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+         "-keyout", keyfile, "-out", certfile, "-days", "1", "-subj", "/CN=localhost"],
+        check=True,
+        capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def ws_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """Encode an unmasked server to client websocket frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def book_level(low_cents: int, high_cents: int) -> list:
+    """Random order book level update on a 0.01 price grid, a quantity of 0 removes the level."""
+    quantity = 0 if random.random() < 0.2 else random.randrange(100, 10000, 100)
+    return [round(random.randrange(low_cents, high_cents) / 100, 2), quantity]
+
+
+def ws_message(endpoint: str, seq: int) -> dict:
+    """Example message of a websocket endpoint."""
+    now = time.time()
+    if endpoint.endswith("/ticker/"):
+        return {"seq": seq, "timestamp": now, "price": round(random.uniform(0.1, 1.5), 2),
+                "quantity": random.randrange(100, 10000, 100), "country_code": random.choice(["DE", "FI", "CH"]),
+                "delivery_start": "2025-01-31T14:45:00.000Z", "delivery_end": "2025-01-31T15:45:00.000Z"}
+    if endpoint.endswith("/orderbook/"):
+        if seq == 0:
+            return {"seq": seq, "timestamp": now, "type": "snapshot",
+                    "bids": [[round(0.79 - i * 0.01, 2), random.randrange(100, 10000, 100)] for i in range(20)],
+                    "asks": [[round(0.80 + i * 0.01, 2), random.randrange(100, 10000, 100)] for i in range(20)]}
+        return {"seq": seq, "timestamp": now, "type": "update",
+                "bids": [book_level(10, 80) for _ in range(random.randint(0, 2))],
+                "asks": [book_level(80, 150) for _ in range(random.randint(0, 2))]}
+    return {"seq": seq, "timestamp": now, "order_id": seq, "status": random.choice(["matched", "expired"]),
+            "price": round(random.uniform(0.1, 1.5), 2), "quantity": random.randrange(100, 10000, 100)}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection open between requests
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        stub = self.server.stub
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        if self.path == AUTH_ENDPOINT:
+            stub.count("token")
+            self.send_json(200, stub.token_response())
+        elif self.path == ORDER_ENDPOINT:
+            stub.count("order")
+            code = stub.order_status()
+            if code in ERROR_BODIES:
+                headers = {"Retry-After": str(stub.retry_after)} if code == 429 else {}
+                self.send_json(code, ERROR_BODIES[code], headers)
+                return
+            order_id = stub.accept_order(self.headers.get("Idempotency-Key"))
+            if stub.drop_rate and random.random() < stub.drop_rate:
+                # accepted, but the connection is closed before the response
+                self.close_connection = True
+                return
+            self.send_json(code, {"id": order_id, "status": "accepted"})
+        else:
+            self.send_json(404, {"detail": "Not Found"})
+
+    def do_GET(self):
+        if self.path not in self.server.stub.ws_endpoints or "Sec-WebSocket-Key" not in self.headers:
+            self.send_json(404, {"detail": "Not Found"})
+            return
+        self.server.stub.count("ws")
+        accept = base64.b64encode(hashlib.sha1((self.headers["Sec-WebSocket-Key"] + WS_GUID).encode()).digest())
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode())
+        self.end_headers()
+        self.wfile.flush()
+        self.stream_messages()
+        self.close_connection = True
+
+    def stream_messages(self):
+        stub = self.server.stub
+        interval = 1 / stub.ws_rate if stub.ws_rate else 0
+        next_send = time.perf_counter()
+        try:
+            for seq in range(stub.ws_messages):
+                if seq and random.random() < stub.ws_drop_rate:
+                    continue  # lost message, the client sees a gap in seq
+                if interval:
+                    delay = next_send - time.perf_counter()
+                    if delay > 0 and self.wait_client_close(delay):
+                        return
+                    next_send += interval
+                message = ws_message(self.path, seq)
+                if self.path.endswith("/trade/"):
+                    # updates of the accepted orders first, then of orders of other participants
+                    message["order_id"] = stub.next_open_order(default=f"other-{seq}")
+                self.wfile.write(ws_frame(json.dumps(message).encode()))
+            # close frame with status 1000
+            self.wfile.write(ws_frame(struct.pack("!H", 1000), opcode=0x8))
+            self.wfile.flush()
+            self.connection.settimeout(1)
+            # closing with unread pings would reset the connection
+            while self.read_client_frame() not in (None, 0x8):
+                pass
+        except (BrokenPipeError, ConnectionResetError, ssl.SSLError, TimeoutError):
+            pass
+
+    def recv_exactly(self, size: int) -> bytes | None:
+        # from the socket, not the buffered rfile, so select() sees all unread data
+        data = b""
+        while len(data) < size:
+            chunk = self.connection.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def read_client_frame(self) -> int | None:
+        """Read a client frame, returns its opcode or None if the connection is closed."""
+        header = self.recv_exactly(2)
+        if header is None:
+            return None
+        length = header[1] & 0x7F
+        if length == 126:
+            length, = struct.unpack("!H", self.recv_exactly(2))
+        elif length == 127:
+            length, = struct.unpack("!Q", self.recv_exactly(8))
+        # client frames are masked
+        self.recv_exactly(4 + length)
+        return header[0] & 0x0F
+
+    def wait_client_close(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for the next message, returns True if the client closed the connection."""
+        deadline = time.perf_counter() + timeout
+        while (remaining := deadline - time.perf_counter()) > 0:
+            if not self.connection.pending() and not select.select([self.connection], [], [], remaining)[0]:
+                return False
+            opcode = self.read_client_frame()
+            if opcode is None:
+                return True
+            if opcode == 0x9:
+                self.wfile.write(ws_frame(b"", opcode=0xA))
+                self.wfile.flush()
+            elif opcode == 0x8:
+                self.wfile.write(ws_frame(struct.pack("!H", 1000), opcode=0x8))
+                self.wfile.flush()
+                return True
+        return False
+
+    def send_json(self, code: int, body: dict, headers: dict = None) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    # the default listen backlog of 5 drops the SYNs of concurrent clients, which retry after 1s
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class StubMarketplace:
+    """Stub marketplace running in a background thread on a free local port.
+
+    latency      seconds every http response is delayed
+    error_rates  share of order requests answered with a status code, e.g. {401: 0.01, 429: 0.05}
+    retry_after  Retry-After header of 429 responses in seconds
+    ws_messages  messages sent on every websocket connection before it is closed
+    ws_rate      websocket messages per second, 0 sends as fast as possible
+    ws_drop_rate share of websocket messages skipped, to test the gap detection of the client
+    expires_in   lifetime of the granted tokens in seconds
+    drop_rate    share of accepted orders whose response is lost
+    """
+    def __init__(self,
+                latency: float = 0,
+                error_rates: dict = None,
+                retry_after: float = 1,
+                ws_messages: int = 100,
+                ws_rate: float = 0,
+                ws_drop_rate: float = 0,
+                expires_in: int = 300,
+                drop_rate: float = 0,
+                ) -> None:
+        self.latency = latency
+        self.error_rates = error_rates or {}
+        self.retry_after = retry_after
+        self.ws_messages = ws_messages
+        self.ws_rate = ws_rate
+        self.ws_drop_rate = ws_drop_rate
+        self.ws_endpoints = WS_ENDPOINTS
+        self.expires_in = expires_in
+        self.drop_rate = drop_rate
+        self.requests = {"token": 0, "order": 0, "ws": 0}
+        # ids of the accepted orders without trade update yet
+        self.open_orders = collections.deque()
+        # order ids by idempotency key, and the resent orders answered from it
+        self.idempotency_keys = {}
+        self.replayed = 0
+        self._order_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self._tmpdir = tempfile.TemporaryDirectory()
+        certfile, keyfile = create_certificate(self._tmpdir.name)
+
+        self.server = StubServer(("127.0.0.1", 0), StubHandler)
+        self.server.stub = self
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def host(self) -> str:
+        address, port = self.server.server_address
+        return f"{address}:{port}"
+
+    @property
+    def orders_received(self) -> int:
+        return self.requests["order"]
+
+    def count(self, kind: str) -> None:
+        with self._lock:
+            self.requests[kind] += 1
+
+    def accept_order(self, idempotency_key: str = None) -> int:
+        with self._lock:
+            if idempotency_key in self.idempotency_keys:
+                self.replayed += 1
+                return self.idempotency_keys[idempotency_key]
+            order_id = next(self._order_ids)
+            if idempotency_key is not None:
+                self.idempotency_keys[idempotency_key] = order_id
+        self.open_orders.append(order_id)
+        return order_id
+
+    def next_open_order(self, default: int) -> int:
+        try:
+            return self.open_orders.popleft()
+        except IndexError:
+            return default
+
+    def token_response(self) -> dict:
+        token = base64.b64encode(os.urandom(12)).decode()
+        return {"access_token": f"stub-{token}", "refresh_token": f"stub-refresh-{token}", "expires_in": self.expires_in}
+
+    def order_status(self) -> int:
+        draw = random.random()
+        for code, rate in self.error_rates.items():
+            if draw < rate:
+                return code
+            draw -= rate
+        return 200
+
+    def start(self) -> "StubMarketplace":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self._tmpdir.cleanup()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
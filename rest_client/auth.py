@@ -1,7 +1,13 @@
-
-import requests
+import contextlib
 import datetime as dt
 import logging
+import threading
+import time
+
+import const
+from metrics import RequestStats
+from session import HttpSession
+from token_cache import TokenCache, cache_key, is_fresh
 
 class Auth:
     """Authentication methods for getting new access token and refreshing it with a refresh token."""
@@ -12,19 +18,29 @@ class Auth:
                 host: str, 
                 auth_endpoint: str,  
                 timezone, 
-                verify = True
+                verify = True,
+                session: HttpSession = None,
+                token_cache: TokenCache = None
                 ) -> None:
 
         """Initialize user with login data"""
         self.client_id = client_id
         self.timezone = timezone
         self.verify = verify
+        self.session = session if session is not None else HttpSession(verify=verify)
 
         self.auth_url = f"https://{host}{auth_endpoint}"   
+        # tokens shared with other runs of the clients, None requests a token on every start
+        self.token_cache = token_cache
+        self.cache_key = cache_key(host, client_id, username)
 
         self.access_token  = None
         self.refresh_token = None
         self.token_expires_in = None
+        self.time_granted = None
+        self.stats = RequestStats()
+        # guards the token fields, which are read by several sender threads
+        self._lock = threading.Lock()
 
         #make payload for new access token request
         self.new_token_payload = {
@@ -37,18 +53,17 @@ class Auth:
     def token_new(self) -> bool:
         """Request a new access token. """
         logging.info("Authenticate user, request new access token")
-        self.time_granted = dt.datetime.now(self.timezone)
-        response = requests.post(
+        time_granted = dt.datetime.now(self.timezone)
+        request_start = time.perf_counter()
+        response = self.session.post(
                             self.auth_url,
                             data=self.new_token_payload, 
                             headers={"Content-Type": "application/x-www-form-urlencoded"},
                             verify=self.verify
                             )
+        self.stats.record(response.status_code, time.perf_counter() - request_start)
         if response.status_code == 200:
-            token_data = response.json()
-            self.access_token  = token_data["access_token"]
-            self.refresh_token = token_data["refresh_token"]
-            self.token_expires_in = token_data["expires_in"]
+            self._set_token(response.json(), time_granted, cache=True)
             logging.info("Authentication success")
             return True
         else:
@@ -65,25 +80,69 @@ class Auth:
                 "refresh_token": self.refresh_token,
                 }
         
-        self.time_granted = dt.datetime.now(self.timezone)
-        response = requests.post(
+        time_granted = dt.datetime.now(self.timezone)
+        request_start = time.perf_counter()
+        response = self.session.post(
                 self.auth_url, 
                 data=refresh_token_payload,
                 headers={"Content-Type": "application/x-www-form-urlencoded"},
                 verify=self.verify
                 )
+        self.stats.record(response.status_code, time.perf_counter() - request_start)
 
         if response.status_code == 200:
-            token_data = response.json()
-            self.access_token  = token_data["access_token"]
-            self.refresh_token = token_data["refresh_token"]
-            self.token_expires_in = token_data["expires_in"]
+            self._set_token(response.json(), time_granted, cache=True)
             return True
         else:
            logging.error(f"Request failed with code: {response.status_code}")
            logging.error(f"Failed to refresh token: {response.reason}")
            return False
 
+    def token_load(self, rejected: str = None, ratio: float = const.TOKEN_REFRESH_RATIO) -> bool:
+        """Use the cached token of an earlier run if it is valid until the next refresh and not the rejected one.
+
+        A cached token past its refresh time still provides its refresh token.
+        """
+        if self.token_cache is None:
+            return False
+        entry = self.token_cache.get(self.cache_key)
+        if entry is None or entry["access_token"] == rejected:
+            return False
+        if not is_fresh(entry, ratio):
+            if entry.get("refresh_token") and self.refresh_token is None:
+                with self._lock:
+                    self.refresh_token = entry["refresh_token"]
+            return False
+        self._set_token(entry, dt.datetime.fromtimestamp(entry["granted_at"], self.timezone))
+        logging.info("Using cached access token")
+        return True
+
+    def cache_lock(self):
+        """Held while a token is renewed, other processes sharing the cache wait and load the renewed token."""
+        return self.token_cache.lock() if self.token_cache is not None else contextlib.nullcontext()
+
+    def _set_token(self, token_data: dict, time_granted: dt.datetime, cache: bool = False) -> None:
+        with self._lock:
+            self.access_token  = token_data["access_token"]
+            self.refresh_token = token_data["refresh_token"]
+            self.token_expires_in = token_data["expires_in"]
+            self.time_granted = time_granted
+        if cache and self.token_cache is not None:
+            self.token_cache.put(self.cache_key, token_data, time_granted.timestamp())
+
+    def token(self) -> str:
+        """Return the current access token, safe to call from any thread."""
+        with self._lock:
+            return self.access_token
+
+    def seconds_until_refresh(self, ratio: float = const.TOKEN_REFRESH_RATIO) -> float:
+        """Seconds until `ratio` of the token lifetime has passed, 0 if there is no token."""
+        with self._lock:
+            if self.token_expires_in is None:
+                return 0
+            refresh_at = self.time_granted + dt.timedelta(seconds=self.token_expires_in * ratio)
+        return max(0.0, (refresh_at - dt.datetime.now(self.timezone)).total_seconds())
+
     def token_check_expiry(self) -> bool:
         """Check if the token is about to expire. """
         if self.token_expires_in is None:
@@ -95,5 +154,88 @@ class Auth:
         return token_expires_soon
 
 
+class TokenRefresher:
+    """Background thread that keeps the token of an Auth valid.
+
+    The token is renewed after TOKEN_REFRESH_RATIO of its lifetime, well
+    before it expires, so senders only read it with Auth.token() and never
+    wait on the marketplace. A 401 reported with invalidate() wakes the
+    thread for an immediate renewal; several 401s for the same token result
+    in one renewal.
+    """
+    def __init__(self, auth: Auth, ratio: float = const.TOKEN_REFRESH_RATIO) -> None:
+        self.auth = auth
+        self.ratio = ratio
+        self.ready = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._rejected = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "TokenRefresher":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Block until the first token was granted."""
+        return self.ready.wait(timeout)
+
+    def invalidate(self, rejected_token: str) -> None:
+        """Report a token rejected with 401, renews it once unless it was already replaced."""
+        if rejected_token != self.auth.token() or rejected_token == self._rejected:
+            return
+        self._rejected = rejected_token
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self._wake.is_set():
+                self._wake.wait(self.auth.seconds_until_refresh(self.ratio))
+            # cleared before the stop flag and the rejected token are read, an
+            # invalidate() from here on sets it again and wakes the next round
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.renew()
 
+    def renew(self) -> None:
+        """Refresh the token, fall back to a new token with exponential backoff.
 
+        Called by the refresher thread, or directly by a scheduler that keeps
+        the tokens of many Auths valid without a thread each (see simulation.py).
+        Unexpected errors, e.g. a malformed token response or an unwritable
+        cache, are retried like failed requests, and ready is set in any case
+        so wait_ready() never blocks on a dead refresher.
+        """
+        # imported here and in HttpSession, not at startup
+        import requests
+        rejected = self._rejected
+        backoff = 1
+        try:
+            while not self._stop.is_set():
+                try:
+                    # several processes with the same token cache renew it only once
+                    with self.auth.cache_lock():
+                        if self.auth.token_load(rejected, self.ratio):
+                            break
+                        if self.auth.refresh_token is not None and rejected is None and self.auth.token_refresh():
+                            break
+                        if self.auth.token_new():
+                            break
+                except requests.exceptions.RequestException as e:
+                    logging.error(f"Token request failed: {e}")
+                    self.auth.stats.record_error()
+                except Exception:
+                    logging.exception("Token renewal failed")
+                    self.auth.stats.record_error()
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, const.TOKEN_RETRY_MAX_WAIT)
+        finally:
+            # a token rejected while this renewal ran is renewed in the next round
+            if self._rejected == rejected:
+                self._rejected = None
+            self.ready.set()
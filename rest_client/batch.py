@@ -0,0 +1,137 @@
+import asyncio
+import csv
+import json
+import logging
+import math
+import time
+from collections import Counter
+from typing import Iterator
+
+import const
+from engine import AsyncOrderEngine
+from utils import Order
+
+ORDER_FIELDS = ("side", "power", "price", "delivery_start", "delivery_end", "expiry_time", "location_ids", "country_code", "baseline")
+REQUIRED_FIELDS = ("power", "price", "delivery_start", "delivery_end", "expiry_time")
+
+
+def read_records(path: str) -> Iterator[tuple[int, dict]]:
+    """Stream (line number, record) pairs from a JSONL or CSV file one line at a time.
+
+    JSONL lines that fail to parse are passed on as the raw string, so they are
+    rejected by order_from_record instead of ending the stream.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        else:
+            for line_num, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_num, json.loads(line)
+                except ValueError:
+                    yield line_num, line
+
+
+def order_from_record(record: dict, side: str) -> Order:
+    """Validate a batch record and convert it to an Order, raises ValueError if invalid."""
+    if not isinstance(record, dict):
+        raise ValueError("record is not a JSON object")
+    unknown = set(record) - set(ORDER_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown fields {sorted(unknown)}")
+    missing = [name for name in REQUIRED_FIELDS if record.get(name) in (None, "")]
+    if missing:
+        raise ValueError(f"missing fields {missing}")
+
+    order_side = record.get("side") or side
+    if order_side not in ("buy", "sell"):
+        raise ValueError(f"invalid side {order_side!r}")
+
+    try:
+        power = float(record["power"])
+        price = float(record["price"])
+    except (TypeError, ValueError):
+        raise ValueError("power and price must be numbers")
+    # nan and inf parse as floats but are not valid JSON
+    if not math.isfinite(power) or not math.isfinite(price):
+        raise ValueError(f"power and price must be finite, got {power} and {price}")
+    if power <= 0:
+        raise ValueError(f"power must be positive, got {power}")
+
+    country_code = record.get("country_code") or ""
+    if country_code not in const.COUNTRY_CODES_ALLOWED:
+        raise ValueError(f"country code {country_code!r} not in {const.COUNTRY_CODES_ALLOWED}")
+
+    location_ids = record.get("location_ids")
+    if isinstance(location_ids, str):
+        location_ids = location_ids.split(",") if location_ids else None
+
+    baseline = record.get("baseline")
+    if isinstance(baseline, str):
+        baseline = json.loads(baseline) if baseline else None
+
+    return Order(side=order_side,
+                 location_ids=location_ids or [None],
+                 country_code=country_code,
+                 power=power,
+                 price=price,
+                 delivery_start=record["delivery_start"],
+                 delivery_end=record["delivery_end"],
+                 expiry_time=record["expiry_time"],
+                 baseline=baseline,
+                 )
+
+
+class BatchRun:
+    """Submit orders from a batch file and write one result line per record.
+
+    Records are read lazily, so only the orders in flight are held in memory.
+    Invalid records are written to the result file and not sent.
+    """
+    def __init__(self, input_path: str, result_path: str, side: str) -> None:
+        self.input_path = input_path
+        self.result_path = result_path
+        self.side = side
+        self.invalid = 0
+        self._lines = {}
+
+    def orders(self) -> Iterator[Order]:
+        for line_num, record in read_records(self.input_path):
+            try:
+                order = order_from_record(record, self.side)
+            except ValueError as e:
+                self.invalid += 1
+                logging.error(f"Invalid record on line {line_num}: {e}")
+                self._write(line_num, None, f"invalid: {e}")
+                continue
+            self._lines[id(order)] = line_num
+            yield order
+
+    def on_result(self, order: Order, code: int | None, text: str) -> None:
+        self._write(self._lines.pop(id(order)), code, text)
+
+    def _write(self, line_num: int, code: int | None, text: str) -> None:
+        result = {"line": line_num, "status_code": code, "response": text}
+        self._results.write(json.dumps(result) + "\n")
+
+    def run(self, client, concurrency: int) -> None:
+        """Send all orders of the batch file with `concurrency` orders in flight."""
+        starttime = time.time()
+        engine = AsyncOrderEngine(client, concurrency, orders=self.orders(), on_result=self.on_result)
+        with open(self.result_path, "w", encoding="utf-8") as self._results:
+            asyncio.run(engine.run())
+        elapsed = time.time() - starttime
+
+        stats = engine.stats
+        codes = Counter(stats.status_codes)
+        if stats.errors:
+            codes["connection_error"] = stats.errors
+        if self.invalid:
+            codes["invalid"] = self.invalid
+        logging.info(f"Batch finished, {stats.sent} orders sent in {elapsed:.1f}s, "
+                     f"{stats.sent / elapsed if elapsed else 0:.1f} orders/s, latency {stats.latency.summary()}, "
+                     f"results: {dict(codes)}, written to {self.result_path}")
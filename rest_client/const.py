@@ -1,3 +1,8 @@
+# defined with the token cache in ../shared, which rest_client.py puts on sys.path:
+# the file shared with ws_client.py, and the share of the token lifetime after
+# which it is renewed, the same share a cached token is reused for
+from token_cache import DEFAULT_TOKEN_CACHE as TOKEN_CACHE_FILE, DEFAULT_REUSE_RATIO as TOKEN_REFRESH_RATIO
+
 CLIENT_ID = "glocalflexmarket_public_api"
 AUTH_ENDPOINT = "/auth/oauth/v2/token"
 ORDER_ENDPOINT = "/api/v1/order/"
@@ -5,4 +10,32 @@ SSL_VERIFY = True
 DEFAULT_SLEEP_TIME = 1 # sleep time between cycles
 DEFAULT_RUN_TIME = 0 # run time in seconds, 0 runs forever
 COUNTRY_CODES_ALLOWED = ["CZ", "DE", "CH", "ES", "FI", "FR", ""]
-HTTP_AUTHENTICATION_ERROR = 401
\ No newline at end of file
+HTTP_AUTHENTICATION_ERROR = 401
+DEFAULT_POOL_SIZE = 10 # max keep-alive connections per host
+DEFAULT_CONNECT_TIMEOUT = 5 # seconds
+DEFAULT_READ_TIMEOUT = 30 # seconds
+DEFAULT_BATCH_CONCURRENCY = 10 # orders in flight in batch mode
+DEFAULT_BATCH_RESULTS = "batch_results.jsonl"
+DEFAULT_MIN_RATE = 0.1 # lowest orders per second the rate limiter backs off to
+DEFAULT_RATE_DECREASE = 0.5 # rate multiplier on 429 responses
+DEFAULT_RATE_INCREASE = 1 # orders per second added after sustained success
+DEFAULT_RATE_INCREASE_INTERVAL = 5 # seconds without 429 before the rate is raised
+TOKEN_RETRY_MAX_WAIT = 60 # seconds, max backoff between failed token requests
+ORDER_LOG_FILE = "client_orders.log"
+MAX_ORDER_TEMPLATES = 256 # cached pre-encoded order templates
+TRADE_WS_ENDPOINT = "/api/v1/ws/trade/"
+TRADE_FEED_RECONNECT = 5 # seconds before the trade feed reconnects
+MAX_TRACKED_ORDERS = 100000 # orders kept by the order tracker
+DEFAULT_SCENARIO_SLOTS = 96 # quarter hour delivery slots of a generated scenario, one day
+DEFAULT_SCENARIO_BATCH = 100000 # orders generated per NumPy batch
+DEFAULT_SIMULATION_CONCURRENCY = 50 # orders in flight of all simulated agents
+SIMULATION_AUTH_WORKERS = 4 # threads renewing the tokens of the simulated users
+WORKER_METRICS_INTERVAL = 1 # seconds between the stats the workers send for --metrics-port and --metrics-file
+DEFAULT_RETRY_ATTEMPTS = 5 # attempts per order, including the first
+RETRY_BASE_DELAY = 0.5 # seconds, max backoff before the second attempt, doubled per attempt
+RETRY_MAX_DELAY = 30 # seconds, max backoff between attempts
+RETRY_EXPIRY_MARGIN = 5 # seconds before expiry_time after which an order is not resent
+RETRY_STATUS_CODES = (401, 408, 429, 503) # the order was not processed
+AMBIGUOUS_STATUS_CODES = (500, 502, 504) # the order may have been created, only resent with --retry-ambiguous
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+DEFAULT_DEAD_LETTER_FILE = "dead_letter_orders.jsonl"
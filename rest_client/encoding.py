@@ -0,0 +1,84 @@
+import json
+from json.encoder import encode_basestring_ascii
+
+import const
+from utils import Order
+
+# orjson is optional, it is used for the order bodies when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def json_dumps(obj) -> bytes:
+    """Encode obj as compact JSON bytes with the fastest available backend."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def _encode_json(obj) -> str:
+    # pre-encoded parts end up in a %-format string
+    return json_dumps(obj).decode().replace("%", "%%")
+
+
+class OrderTemplate:
+    """Order body with the fields that are constant within a run encoded once.
+
+    Side, location and baseline are serialised into a format string when the
+    template is built, only power, price and the three timestamps are
+    formatted per order. The output is the same JSON document as
+    Order.as_dict.
+    """
+    def __init__(self, side: str, location_ids: list[str], country_code: str, baseline: dict) -> None:
+        self.baseline = baseline
+        self._format = (
+            '{"side":' + _encode_json(side)
+            + ',"power":%r,"price":%r,"delivery_start":%s,"delivery_end":%s,"expiry_time":%s'
+            + ',"location":' + _encode_json({"location_id": location_ids, "country_code": country_code})
+            + ',"baseline":' + _encode_json(baseline) + '}'
+        )
+
+    def encode(self, order: Order) -> bytes:
+        power = float(order.power)
+        price = float(order.price)
+        # nan and inf are not valid JSON, x - x is only 0 for finite numbers
+        if power - power or price - price:
+            raise ValueError(f"Out of range float value in power {power} or price {price}")
+        return (self._format % (
+            power,
+            price,
+            encode_basestring_ascii(order.delivery_start),
+            encode_basestring_ascii(order.delivery_end),
+            encode_basestring_ascii(order.expiry_time),
+        )).encode()
+
+
+class OrderEncoder:
+    """Encode orders to JSON request bodies.
+
+    With orjson installed the orders are encoded with orjson, which is faster
+    than patching a template in Python (see benchmarks/bench_encode.py).
+    Otherwise a cache of order templates is used, one per side, location and
+    baseline combination. The cache is cleared when it reaches
+    MAX_ORDER_TEMPLATES, which only happens if most orders have their own
+    location or baseline.
+    """
+    def __init__(self, use_templates: bool = orjson is None) -> None:
+        self.use_templates = use_templates
+        self._templates = {}
+
+    def encode(self, order: Order) -> bytes:
+        if not self.use_templates:
+            return json_dumps(order.as_dict())
+        location_ids = tuple(order.location_ids) if order.location_ids is not None else None
+        key = (order.side, location_ids, order.country_code, id(order.baseline))
+        template = self._templates.get(key)
+        # the id of a freed baseline can be reused by another dict
+        if template is None or template.baseline is not order.baseline:
+            if len(self._templates) >= const.MAX_ORDER_TEMPLATES:
+                self._templates.clear()
+            template = OrderTemplate(order.side, order.location_ids, order.country_code, order.baseline)
+            self._templates[key] = template
+        return template.encode(order)
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+from retry import retry_errors
+from utils import Side
+
+
+class AsyncOrderEngine:
+    """Asyncio order engine keeping up to `concurrency` orders in flight.
+
+    Orders are built with Client.set_random_order_parameters and posted with
+    Client.post_order on a thread pool, so the engine shares the pooled
+    session, the token refresher and the rate limiter of the client. The rate
+    limiter paces the order starts, with an unlimited rate orders are sent as
+    fast as the concurrency allows.
+
+    Failed attempts are resent by the order retry of the client, the order
+    keeps its slot while it waits for the backoff, so a marketplace that is
+    down is not flooded with new orders.
+
+    If `orders` is given the engine sends those orders instead of random ones
+    and stops when the iterable is exhausted. `on_result` is called with the
+    order, the http status code of the last attempt (None on connection
+    errors) and the response text or error message of every submitted order.
+    """
+    def __init__(self,
+                client,
+                concurrency: int,
+                orders: Iterable = None,
+                on_result: Callable = None
+                ) -> None:
+        self.client = client
+        self.config = client.config
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = client.rate_limiter
+        self.orders = iter(orders) if orders is not None else None
+        self.on_result = on_result
+        self.stats = client.stats
+        self.retry = client.retry
+        self.sent = 0
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _next_order(self):
+        if self.orders is not None:
+            return next(self.orders, None)
+        if self.config.params.side == Side.BUY:
+            order, _, _ = self.client.set_random_order_parameters(self.config.buyer, Side.BUY, self.config)
+        else:
+            order, _, _ = self.client.set_random_order_parameters(self.config.seller, Side.SELL, self.config)
+        return order
+
+    async def _submit(self, order) -> None:
+        try:
+            submission = self.retry.submission(order)
+            try:
+                body = self.client.encoder.encode(order)
+            except (TypeError, ValueError) as e:
+                # e.g. a nan or inf power, the order fails without an attempt
+                self.retry.not_sent(submission, e)
+                self._result(order, None, str(e))
+                return
+            while True:
+                response, error = None, None
+                try:
+                    response = await self._call(self.client.post_order, body, submission.key)
+                except retry_errors() as e:
+                    self.client.log_error(e)
+                    error = e
+                delay = self.retry.next_delay(submission, response.status_code if response is not None else None, error)
+                if delay is None:
+                    break
+                await asyncio.sleep(delay)
+                await self.rate_limiter.acquire_async()
+            if response is None:
+                self._result(order, None, str(error))
+            else:
+                self._result(order, response.status_code, response.text)
+                self.client.log_response(response.status_code, response.text, order)
+        finally:
+            self._slots.release()
+
+    def _done(self, task: asyncio.Task, order, tasks: set) -> None:
+        """Forget a finished order, one that failed with an unexpected error is its result."""
+        tasks.discard(task)
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        logging.error(f"Order failed: {error!r}")
+        self._result(order, None, repr(error))
+
+    def _result(self, order, code: int | None, text: str) -> None:
+        # status codes, connection errors and latency of every attempt are recorded by the client
+        if self.on_result is not None:
+            self.on_result(order, code, text)
+
+    async def run(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._slots = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+
+        logging.info(f"Target url {self.config.market.host}, concurrency {self.concurrency}, rate {self.rate_limiter.rate or 'unlimited'}")
+        refresher = self.client.token_refresher.start()
+        await self._call(refresher.wait_ready)
+
+        tasks = set()
+        starttime = loop.time()
+        try:
+            while True:
+                if self.config.params.runtime > 0: #setting to 0 runs forever
+                    if loop.time() > starttime + self.config.params.runtime:
+                        break
+                if self.sent and (self.config.params.runtime == -1 or self.client.run_once):
+                    break
+
+                await self._slots.acquire()
+                order = self._next_order()
+                if order is None:
+                    self._slots.release()
+                    break
+                await self.rate_limiter.acquire_async()
+
+                task = asyncio.create_task(self._submit(order))
+                tasks.add(task)
+                task.add_done_callback(lambda task, order=order: self._done(task, order, tasks))
+                self.sent += 1
+
+            # the failed orders are reported by _done
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            refresher.stop()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            if self.retry.dead_letter is not None:
+                self.retry.dead_letter.close()
+
+        self.stats.elapsed = loop.time() - starttime
+        logging.info(f'Finished, {self.stats.summary()}, '
+                     f'rate {self.rate_limiter.rate:.2f} orders/s, throttled {self.rate_limiter.throttled}, {self.retry.summary()}')
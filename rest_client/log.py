@@ -0,0 +1,83 @@
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s  %(module)s %(lineno)d: %(message)s'
+
+
+class LazyJson:
+    """Serialise an order to JSON only when the log record is actually emitted."""
+    def __init__(self, order, indent: int = None) -> None:
+        self.order = order
+        self.indent = indent
+
+    def __str__(self) -> str:
+        return json.dumps(self.order.as_dict(), indent=self.indent)
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a log record as one compact JSON line.
+
+    Records logged with extra={"order": order, "status_code": code} get the
+    order fields added, the baseline blob is left out to keep lines short.
+    """
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "module": record.module,
+            "msg": record.getMessage(),
+        }
+        order = getattr(record, "order", None)
+        if order is not None:
+            entry["status_code"] = getattr(record, "status_code", None)
+            entry["side"] = order.side
+            entry["power"] = order.power
+            entry["price"] = order.price
+            entry["delivery_start"] = order.delivery_start
+            entry["delivery_end"] = order.delivery_end
+            entry["expiry_time"] = order.expiry_time
+            entry["country_code"] = order.country_code
+            entry["location_ids"] = order.location_ids
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Queue handler that leaves formatting to the listener thread.
+
+    Orders are not modified after they are logged, so the record can be put
+    on the queue as is instead of being formatted in the sending thread.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(log_file: str = None, structured: bool = False) -> QueueListener | None:
+    """Configure the root logger, returns the listener of the file sink if a log file is given.
+
+    The file is written by a QueueListener thread, so senders only put the
+    record on a queue and never wait on file I/O. Stop the returned listener
+    on exit to flush the remaining records. Calling it again, for example in
+    a forked worker process, replaces the file sink of the previous call.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if isinstance(handler, DeferredQueueHandler):
+            root.removeHandler(handler)
+    formatter = JsonFormatter() if structured else logging.Formatter(TEXT_FORMAT)
+    for handler in root.handlers:
+        handler.setFormatter(formatter)
+
+    if not log_file:
+        return None
+
+    file_handler = logging.FileHandler(log_file, encoding="utf-8")
+    file_handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    root.addHandler(DeferredQueueHandler(log_queue))
+    listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,244 @@
+import copy
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+# sub buckets per power of two, the bucket width is below 1/64 of the value
+SUB_BUCKET_BITS = 7
+_HALF = 1 << (SUB_BUCKET_BITS - 1)
+
+
+class Histogram:
+    """Latency histogram with logarithmic buckets in the style of HdrHistogram.
+
+    Values are recorded in microseconds with a relative error below 1.6%.
+    Only non-empty buckets are stored, so histograms are small, picklable
+    and can be merged across threads and worker processes.
+    """
+    def __init__(self) -> None:
+        self.counts = Counter()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(value: int) -> int:
+        if value < 2 * _HALF:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        return shift * _HALF + (value >> shift)
+
+    @staticmethod
+    def _value(index: int) -> int:
+        """Highest value of a bucket."""
+        if index < 2 * _HALF:
+            return index
+        shift = index // _HALF - 1
+        mantissa = index - shift * _HALF
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        value = max(0, int(seconds * 1e6))
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent: float) -> float:
+        """Value in seconds below which `percent` of the recorded values are."""
+        if not self.count:
+            return 0.0
+        rank = percent / 100 * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._value(index), self.max) / 1e6
+        return self.max / 1e6
+
+    def mean(self) -> float:
+        return self.total / self.count / 1e6 if self.count else 0.0
+
+    def summary(self) -> str:
+        return (f'p50={self.percentile(50) * 1000:.1f}ms p90={self.percentile(90) * 1000:.1f}ms '
+                f'p99={self.percentile(99) * 1000:.1f}ms max={self.max / 1000:.1f}ms')
+
+
+class RequestStats:
+    """Status codes, connection errors and latency of the requests of one kind.
+
+    Used for the orders of a Client and the token requests of an Auth.
+    Updated from the sender threads, picklable so worker processes can send
+    their stats to the parent, which merges them into one report.
+    """
+    def __init__(self) -> None:
+        self.status_codes = Counter()
+        self.errors = 0
+        self.latency = Histogram()
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def sent(self) -> int:
+        return sum(self.status_codes.values()) + self.errors
+
+    def record(self, code: int, seconds: float) -> None:
+        with self._lock:
+            self.status_codes[code] += 1
+            self.latency.record(seconds)
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> "RequestStats":
+        """Consistent copy that can be read while the senders keep recording."""
+        with self._lock:
+            return copy.deepcopy(self)
+
+    def merge(self, other: "RequestStats") -> None:
+        """Add the stats of another client, which ran at the same time."""
+        with self._lock:
+            self.status_codes.update(other.status_codes)
+            self.errors += other.errors
+            self.latency.merge(other.latency)
+            self.elapsed = max(self.elapsed, other.elapsed)
+
+    def summary(self) -> str:
+        rate = self.sent / self.elapsed if self.elapsed else 0
+        return (f'{self.sent} orders in {self.elapsed:.1f}s, {rate:.1f} orders/s, '
+                f'latency {self.latency.summary()}, status codes {dict(self.status_codes)}, errors {self.errors}')
+
+
+def _prometheus_request_metrics(name: str, stats: RequestStats) -> list[str]:
+    lines = [
+        f"# TYPE glocalflex_{name}_responses_total counter",
+        *(f'glocalflex_{name}_responses_total{{code="{code}"}} {count}' for code, count in sorted(stats.status_codes.items())),
+        f"# TYPE glocalflex_{name}_errors_total counter",
+        f"glocalflex_{name}_errors_total {stats.errors}",
+        f"# TYPE glocalflex_{name}_latency_seconds summary",
+        *(f'glocalflex_{name}_latency_seconds{{quantile="{q}"}} {stats.latency.percentile(q * 100):.6f}' for q in (0.5, 0.9, 0.99)),
+        f'glocalflex_{name}_latency_seconds{{quantile="1"}} {stats.latency.max / 1e6:.6f}',
+        f"glocalflex_{name}_latency_seconds_sum {stats.latency.total / 1e6:.6f}",
+        f"glocalflex_{name}_latency_seconds_count {stats.latency.count}",
+    ]
+    return lines
+
+
+class MetricsReporter:
+    """Periodic report of the order and token request metrics of a client.
+
+    Every `interval` seconds a summary line with the order rate of the last
+    interval is logged and, if a path is given, the metrics are written to a
+    file in Prometheus text format. With a port the same text is served on
+    http://0.0.0.0:<port>/metrics.
+    """
+    def __init__(self, client, interval: float = 0, path: str = None, port: int = None) -> None:
+        self.client = client
+        self.interval = interval
+        self.path = path
+        self.port = port
+        self.server = None
+        self._starttime = time.time()
+        self._last_time = self._starttime
+        self._last_sent = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "MetricsReporter":
+        if self.port:
+            # imported on demand, most runs have no metrics port
+            from http.server import ThreadingHTTPServer
+            self.server = ThreadingHTTPServer(("0.0.0.0", self.port), _metrics_handler(self))
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        if self.interval > 0:
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.path:
+            self.write()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def report(self) -> None:
+        orders = self.client.stats.snapshot()
+        tokens = self.client.auth.stats.snapshot()
+        now = time.time()
+        rate = (orders.sent - self._last_sent) / (now - self._last_time)
+        self._last_sent, self._last_time = orders.sent, now
+        logging.info(f'Metrics: {rate:.1f} orders/s, {orders.sent} orders, latency {orders.latency.summary()}, '
+                     f'status codes {dict(orders.status_codes)}, errors {orders.errors}, '
+                     f'token requests {tokens.sent}, token latency {tokens.latency.summary()}, '
+                     f'rate limit {self.client.rate_limiter.rate:.2f} orders/s')
+        if self.path:
+            self.write()
+
+    def prometheus(self) -> str:
+        """Metrics in Prometheus text exposition format."""
+        orders = self.client.stats.snapshot()
+        elapsed = time.time() - self._starttime
+        lines = _prometheus_request_metrics("order", orders)
+        lines += _prometheus_request_metrics("token", self.client.auth.stats.snapshot())
+        lines += [
+            "# TYPE glocalflex_orders_per_second gauge",
+            f"glocalflex_orders_per_second {orders.sent / elapsed if elapsed else 0:.3f}",
+            "# TYPE glocalflex_rate_limit_orders_per_second gauge",
+            f"glocalflex_rate_limit_orders_per_second {self.client.rate_limiter.rate:.3f}",
+            "# TYPE glocalflex_throttled_total counter",
+            f"glocalflex_throttled_total {self.client.rate_limiter.throttled}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write(self) -> None:
+        """Write the metrics file, replaced atomically so readers never see a partial file."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, self.path)
+
+
+def _metrics_handler(reporter: MetricsReporter):
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            data = reporter.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
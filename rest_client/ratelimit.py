@@ -0,0 +1,129 @@
+import datetime as dt
+import email.utils
+import logging
+import threading
+import time
+
+import const
+
+
+def parse_retry_after(value: str | None) -> float:
+    """Return the seconds to wait from a Retry-After header, given in seconds or as http date."""
+    if not value:
+        return 0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0
+    return max(0.0, (retry_at - dt.datetime.now(dt.timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """Token bucket rate limiter with AIMD adaptive rate.
+
+    Every order takes a token from the bucket, which refills at `rate` tokens
+    per second up to `burst`. A 429 response multiplies the rate by `decrease`
+    and blocks all senders for the Retry-After time, every `increase_interval`
+    seconds without a 429 the rate grows by `increase` up to `max_rate`.
+    A rate of 0 is unlimited until the first 429, then the rate starts from
+    the order rate measured in the last second. The limiter is thread safe and
+    can be shared by the serial loop, engine tasks and worker threads.
+    """
+    def __init__(self,
+                rate: float = 0,
+                max_rate: float = 0,
+                min_rate: float = const.DEFAULT_MIN_RATE,
+                burst: float = 1,
+                decrease: float = const.DEFAULT_RATE_DECREASE,
+                increase: float = const.DEFAULT_RATE_INCREASE,
+                increase_interval: float = const.DEFAULT_RATE_INCREASE_INTERVAL,
+                ) -> None:
+        self._rate = rate
+        self.max_rate = max_rate or rate or float("inf")
+        self.min_rate = min_rate
+        self.burst = burst
+        self.decrease = decrease
+        self.increase = increase
+        self.increase_interval = increase_interval
+
+        self._lock = threading.Lock()
+        now = time.monotonic()
+        self._tokens = burst
+        self._last_refill = now
+        self._last_change = now
+        self._blocked_until = 0.0
+        # orders counted in the current and the last full second
+        self._window_start = now
+        self._window_count = 0
+        self._last_window_rate = 0.0
+        self.throttled = 0
+
+    @property
+    def rate(self) -> float:
+        """Current allowed orders per second, 0 is unlimited."""
+        return self._rate
+
+    def _observed_rate(self, now: float) -> float:
+        """Order rate of the last full second, or of the current one if none has passed yet."""
+        if self._last_window_rate:
+            return self._last_window_rate
+        return self._window_count / max(now - self._window_start, 0.001)
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds the caller has to wait before sending."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._last_window_rate = self._window_count / (now - self._window_start)
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+
+            wait = max(0.0, self._blocked_until - now)
+            if not self._rate:
+                return wait
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self._rate)
+            self._last_refill = now
+            # tokens go negative, so every caller gets its own send slot
+            self._tokens -= 1
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self._rate)
+            return wait
+
+    def acquire(self) -> None:
+        """Block until the next order may be sent."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        """Wait on the event loop until the next order may be sent."""
+        wait = self.reserve()
+        if wait > 0:
+            # asyncio is only loaded by the engine, not by the sync client
+            import asyncio
+            await asyncio.sleep(wait)
+
+    def update(self, code: int, retry_after: str | None = None) -> None:
+        """Adapt the rate to the status code of a response."""
+        with self._lock:
+            now = time.monotonic()
+            if code == 429:
+                self.throttled += 1
+                self._blocked_until = max(self._blocked_until, now + parse_retry_after(retry_after))
+                # a burst of 429 from orders already in flight only lowers the rate once
+                if self._rate and now - self._last_change < 1 / self._rate:
+                    return
+                current = self._rate or self._observed_rate(now)
+                self._rate = max(self.min_rate, current * self.decrease)
+                self._tokens = min(self._tokens, 0)
+                self._last_change = now
+                logging.warning(f'Rate limited by marketplace, lowering rate to {self._rate:.2f} orders/s')
+            elif self._rate and self._rate < self.max_rate and now - self._last_change >= self.increase_interval:
+                self._rate = min(self.max_rate, self._rate + self.increase)
+                self._last_change = now
+                logging.debug(f'Raising rate to {self._rate:.2f} orders/s')
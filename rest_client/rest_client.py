@@ -1,25 +1,42 @@
 
 import time
 import random
-import json
 import logging
 import datetime as dt
 import os
-import ssl
+import sys
 import warnings
-from dataclasses import dataclass
-import urllib3
-import requests
-from auth import Auth
+from typing import TYPE_CHECKING
+
+# token_cache.py and profiling.py are shared with ws_client.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+
+from auth import Auth, TokenRefresher
+from session import HttpSession
+from ratelimit import RateLimiter
+from log import LazyJson, TEXT_FORMAT, setup_logging
+from encoding import OrderEncoder, json_dumps
+from metrics import MetricsReporter, RequestStats
+from token_cache import TokenCache
+from retry import retry_errors, DeadLetterFile, OrderRetry, RetryPolicy
+
+# the engine (asyncio), batch mode, worker processes, metrics server and
+# trade feed (websocket) are imported where they are used, so a one-shot
+# order does not pay for their imports at startup; requests is imported by
+# the first HttpSession, so --help does not pay for it either
+if TYPE_CHECKING:
+    import requests
+    from profiling import Profiler
+    from tracker import OrderTracker, TradeFeed
 
 warnings.filterwarnings("ignore", message="Unverified HTTPS request")
 
 import const
 
 from utils import SellerBuyerSettings, cli_args, DefaultConfig, HostConfig, UserConfig, EndpointConfig, Parameters
-from utils import Side
+from utils import Side, Order
 
-logging.basicConfig(encoding='utf-8', level=logging.INFO, format='%(asctime)s  %(module)s %(lineno)d: %(message)s')
+logging.basicConfig(encoding='utf-8', level=logging.INFO, format=TEXT_FORMAT)
 
 HOST = os.getenv("GFLEX_URL", "test.glocalflexmarket.com")
 
@@ -85,36 +102,10 @@ config = DefaultConfig(
 )
 
 
-@dataclass
-class Order:
-    side: str
-    location_ids: list[str] = None
-    country_code: str = None
-    power: float = None
-    price: float = None
-    delivery_start: dt.datetime = None
-    delivery_end: dt.datetime = None
-    expiry_time: dt.datetime = None
-    baseline: dict = None
-
-    def as_dict(self) -> dict:
-        return {
-            "side": self.side,
-            "power": float(self.power),
-            "price": float(self.price),
-            "delivery_start": self.delivery_start,
-            "delivery_end": self.delivery_end,
-            "expiry_time": self.expiry_time,
-            "location": {"location_id": self.location_ids,
-                        "country_code": self.country_code},
-            "baseline": self.baseline
-        }
-
-
 class Client:
     """GLocalFlex REST client"""
 
-    def __init__(self, config: DefaultConfig, cli_order: Order) -> None:
+    def __init__(self, config: DefaultConfig, cli_order: Order, session: HttpSession = None) -> None:
 
         self.config = config
         self.cli_order_params = cli_order
@@ -122,24 +113,101 @@ class Client:
 
         self.order_url = f"https://{config.market.host}{config.market.api.order}" 
         self.verify = config.market.ssl_verify
+        # clients of several users can share one connection pool
+        if session is None:
+            session = HttpSession(pool_size=config.session.pool_size,
+                                  connect_timeout=config.session.connect_timeout,
+                                  read_timeout=config.session.read_timeout,
+                                  keep_alive=config.session.keep_alive,
+                                  verify=config.market.ssl_verify)
+        self.session = session
         self.auth: Auth = Auth(config.user.username,
                                config.user.password,
                                config.market.client_id,
                                config.market.host,
                                config.market.api.auth,
                                config.params.timezone,
-                               config.market.ssl_verify) 
-
-    def send_order(self, order: dict) -> requests.Response:
-        """Send post request to marketplace."""
-
+                               config.market.ssl_verify,
+                               session=self.session,
+                               token_cache=TokenCache(config.user.token_cache) if config.user.token_cache else None)
+        self.token_refresher = TokenRefresher(self.auth)
+        self.encoder = OrderEncoder()
+        self.rate_limiter = RateLimiter(config.params.rate, config.params.max_rate)
+        self.stats = RequestStats()
+        self.retry = OrderRetry(RetryPolicy(max_attempts=config.params.retry_attempts, retry_ambiguous=config.params.retry_ambiguous),
+                                DeadLetterFile(config.params.dead_letter) if config.params.dead_letter else None)
+        # set with track_orders(), indexes the accepted orders by id
+        self.tracker: "OrderTracker" = None
+        self.trade_feed: "TradeFeed" = None
+
+    def track_orders(self) -> "OrderTracker":
+        """Follow the accepted orders on the trade websocket feed."""
+        from tracker import OrderTracker, TradeFeed
+        self.tracker = OrderTracker()
+        self.trade_feed = TradeFeed(self.tracker, self.auth, self.config.market.host, ssl_verify=self.verify,
+                                     ready=self.token_refresher.ready).start()
+        return self.tracker
+
+    def send_order(self, order: dict | bytes, idempotency_key: str = None) -> "requests.Response":
+        """Wait for the rate limiter and send post request to marketplace."""
+        self.rate_limiter.acquire()
+        return self.post_order(order, idempotency_key)
+
+    def post_order(self, order: dict | bytes, idempotency_key: str = None) -> "requests.Response":
+        """Send post request to marketplace without waiting for the rate limiter.
+
+        The order is either a dict from Order.as_dict or a JSON body
+        already encoded by the OrderEncoder. Resent orders carry the
+        idempotency key of their first attempt.
+        """
+        body = order if isinstance(order, bytes) else json_dumps(order)
+
+        token = self.auth.token()
         headers = {
-            "Authorization": f"Bearer {self.auth.access_token}",
+            "Authorization": f"Bearer {token}",
             "Content-Type": "application/json",
         }
-        response = requests.post(self.order_url, headers=headers, verify=self.verify, json=order)
+        if idempotency_key is not None:
+            headers[const.IDEMPOTENCY_HEADER] = idempotency_key
+        submitted_at = time.time()
+        request_start = time.perf_counter()
+        response = self.session.post(self.order_url, headers=headers, data=body)
+        self.stats.record(response.status_code, time.perf_counter() - request_start)
+        if self.tracker is not None and response.status_code == 200:
+            self.tracker.submitted(response, self.config.params.side.value, submitted_at)
+        self.rate_limiter.update(response.status_code, response.headers.get("Retry-After"))
+        if response.status_code == const.HTTP_AUTHENTICATION_ERROR:
+            # renewed in the background, the order is resent by the caller
+            self.token_refresher.invalidate(token)
         return response
 
+    def submit_order(self, order: Order) -> "requests.Response | None":
+        """Send the order, resent with backoff until it is accepted, rejected or failed for good.
+
+        Returns the response of the last attempt, None if it failed without one.
+        """
+        body = self.encoder.encode(order)
+        submission = self.retry.submission(order)
+        while True:
+            response, error = None, None
+            try:
+                response = self.send_order(body, submission.key)
+            except retry_errors() as e:
+                self.log_error(e)
+                error = e
+            delay = self.retry.next_delay(submission, response.status_code if response is not None else None, error)
+            if delay is None:
+                return response
+            time.sleep(delay)
+
+    def log_error(self, error: Exception) -> None:
+        """Log an attempt that failed without response."""
+        import ssl
+        if not isinstance(error, ssl.SSLError):
+            logging.error(f'Marketplace is not available')
+        logging.error(f'Error: {error}')
+        self.stats.record_error()
+
 
     def set_random_order_parameters(self, values: SellerBuyerSettings, side: str, config: DefaultConfig) -> tuple[Order, int, int]:
             def format_time(time):
@@ -192,32 +260,28 @@ class Client:
             
     @staticmethod
     def log_response(code: int, text: str, params: Order) -> None:
+        # %-style arguments, so messages are only formatted if the level is enabled
+        extra = {"order": params, "status_code": code}
         if code == 200:
-            logging.info(f'http request status code={code}, side={params.side}, power={params.power}, '
-                        f'price={params.price}, country={params.country_code}, loc_ids={params.location_ids}')  
+            logging.info('http request status code=%s, side=%s, power=%s, price=%s, country=%s, loc_ids=%s',
+                         code, params.side, params.power, params.price, params.country_code, params.location_ids,
+                         extra=extra)
         elif code == 401:
-            logging.debug(f'Debug: 401 Get new token.')
+            logging.debug('Debug: 401 Get new token.', extra=extra)
         elif code == 429:
-            logging.warning(f'Warning: 429 Too many requests.')
+            logging.warning('Warning: 429 Too many requests.', extra=extra)
         elif code == 422:
-            logging.error(f'Error: 422 Unprocessable Content: {text}.')
+            logging.error('Error: 422 Unprocessable Content: %s.', text, extra=extra)
         else:
-            logging.error(f'Request failed with code {code}')
-            logging.error(f'Response: {text}')
+            logging.error('Request failed with code %s, response: %s', code, text, extra=extra)
 
         
 
 
     def run(self):
-        
-        # set up file logger
-        if self.config.params.log:
-            logging.FileHandler('client_orders.log')
-            
-
 
         logging.info(f"Target url {self.config.market.host}")
-        self.auth.token_new()
+        self.token_refresher.start().wait_ready()
 
         starttime = time.time() 
         while True:
@@ -226,42 +290,88 @@ class Client:
                 if time.time() > starttime + self.config.params.runtime:
                     break
 
-            if self.auth.token_check_expiry():
-                if not self.auth.token_refresh():
-                    while not self.auth.token_new():
-                        time.sleep(5)
-
             if self.config.params.side == Side.BUY:
-                order, wmin, wmax = self.set_random_order_parameters(config.buyer, Side.BUY, self.config)
+                order, wmin, wmax = self.set_random_order_parameters(self.config.buyer, Side.BUY, self.config)
             if self.config.params.side == Side.SELL:
-                order, wmin, wmax = self.set_random_order_parameters(config.seller, Side.SELL, self.config)
+                order, wmin, wmax = self.set_random_order_parameters(self.config.seller, Side.SELL, self.config)
               
-            logging.info(f'Sending order: {json.dumps(order.as_dict(), indent=4)}') 
-            try:
-                response = self.send_order(order.as_dict())
-            except (ssl.SSLError) as e:
-                logging.error(f'Error: {e}')
-                time.sleep(5)
-                continue
-            except (urllib3.exceptions.NewConnectionError, requests.exceptions.ConnectionError) as e:
-                logging.error(f'Marketplace is not available')
-                logging.error(f'Error: {e}')
-                time.sleep(5)
-                continue
-
-            if response.status_code == const.HTTP_AUTHENTICATION_ERROR:
-                while not self.auth.token_new():
-                    time.sleep(5)
-
-            self.log_response(response.status_code, response.text, order)
-
-            if config.params.runtime == -1 or self.run_once:
+            # the JSON log has the order in the response line
+            if not self.config.params.json_log:
+                logging.info('Sending order: %s', LazyJson(order, indent=4))
+            response = self.submit_order(order)
+            if response is not None:
+                self.log_response(response.status_code, response.text, order)
+
+            if self.config.params.runtime == -1 or self.run_once:
                 break
 
             sleep_multiplier  = random.randint(wmin, wmax)
             time.sleep(self.config.params.frequency*sleep_multiplier)
         
-        logging.info(f'Finished, side: {order.side}')
+        self.token_refresher.stop()
+        if self.retry.dead_letter is not None:
+            self.retry.dead_letter.close()
+        self.stats.elapsed = time.time() - starttime
+        logging.info(f'Finished, side: {self.config.params.side.value}, {self.stats.summary()}, '
+                     f'rate: {self.rate_limiter.rate:.2f} orders/s, throttled: {self.rate_limiter.throttled}, {self.retry.summary()}')
+
+
+def scenario_generator(config: DefaultConfig, cli_order: Order):
+    """ScenarioGenerator for --generate with the settings of the side, None if numpy is not installed."""
+    try:
+        from scenario import ScenarioGenerator
+    except ImportError:
+        logging.error('--generate requires numpy (pip install numpy)')
+        return None
+    settings = config.seller if config.params.side == Side.SELL else config.buyer
+    return ScenarioGenerator(settings, config.params.side, dt.datetime.now(config.params.timezone),
+                             overrides=cli_order, seed=config.params.seed)
+
+
+def run_simulation(config: DefaultConfig, cli_order: Order) -> None:
+    """Run the agents of the --simulate file until the runtime is over or Ctrl + c."""
+    import asyncio
+    from simulation import AgentScheduler, load_simulation
+    try:
+        groups, options = load_simulation(config.params.simulate, config)
+    except (OSError, ValueError) as e:
+        logging.error(f'Invalid simulation file {config.params.simulate}: {e}')
+        return
+    # the options of the file take precedence over the command line
+    scheduler = AgentScheduler(Client, config, cli_order, groups,
+                               concurrency=options.get("concurrency", config.params.concurrency or const.DEFAULT_SIMULATION_CONCURRENCY),
+                               runtime=options.get("runtime", config.params.runtime))
+    try:
+        asyncio.run(scheduler.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.log_summary()
+
+
+def start_profiler() -> "Profiler":
+    """Time the stages of the order path, from the random order to the TLS connect, see profiling.py."""
+    import urllib3.connection
+    from profiling import Profiler
+    profiler = Profiler()
+    profiler.instrument(Client, "set_random_order_parameters", "submit_order", "send_order", "post_order", "log_response")
+    profiler.instrument(Order, "as_dict")
+    profiler.instrument(OrderEncoder, "encode")
+    profiler.instrument(RateLimiter, "acquire")
+    profiler.instrument(HttpSession, "post")
+    profiler.instrument(urllib3.connection.HTTPSConnection, "connect")
+    profiler.instrument(Auth, "token", "token_new", "token_refresh", "token_load")
+    profiler.instrument(TokenRefresher, "renew")
+    profiler.instrument(logging.Logger, "handle")
+    profiler.instrument(time, "sleep")
+    return profiler
+
+
+def stop_profiler(profiler: "Profiler", path: str = None) -> None:
+    profiler.restore()
+    logging.info(profiler.report())
+    if path:
+        logging.info(f'Profile: {profiler.write_collapsed(path)} collapsed stacks written to {path}')
 
 
 def main():
@@ -269,11 +379,40 @@ def main():
     config.market.host = args.host
     config.user.username = args.username
     config.user.password = args.password
+    config.user.token_cache = args.token_cache
     config.params.runtime = args.run_time
     config.params.frequency = args.sleep_time
     config.params.log = args.log
+    config.params.json_log = args.json_log
     config.params.side = Side(args.side)
     config.params.run_only_once = args.once
+    config.params.concurrency = args.concurrency
+    config.params.rate = args.rate
+    config.params.max_rate = args.max_rate
+    config.params.workers = args.workers
+    config.params.sell_ratio = args.sell_ratio
+    config.params.metrics_interval = args.metrics_interval
+    config.params.metrics_file = args.metrics_file
+    config.params.metrics_port = args.metrics_port
+    config.params.batch_file = args.batch_file
+    config.params.batch_results = args.batch_results
+    config.params.track = args.track
+    config.params.generate = args.generate
+    config.params.generate_file = args.generate_file
+    config.params.seed = args.seed
+    config.params.simulate = args.simulate
+    config.params.retry_attempts = args.retry_attempts
+    config.params.retry_ambiguous = args.retry_ambiguous
+    config.params.dead_letter = args.dead_letter
+    config.params.profile = args.profile or args.profile_file is not None
+    config.params.profile_file = args.profile_file
+    if (config.params.batch_file or config.params.generate) and config.params.concurrency == 0:
+        config.params.concurrency = const.DEFAULT_BATCH_CONCURRENCY
+    # every order in flight needs its own connection
+    config.session.pool_size = max(args.pool_size, config.params.concurrency)
+    config.session.connect_timeout = args.connect_timeout
+    config.session.read_timeout = args.read_timeout
+    config.session.keep_alive = args.keep_alive
 
     cli_args_order = Order(
         side= args.side,
@@ -286,14 +425,72 @@ def main():
         country_code= args.country_code,
     )
 
+    log_listener = setup_logging(const.ORDER_LOG_FILE if config.params.log else None, config.params.json_log)
+    profiler = start_profiler() if config.params.profile else None
+    try:
+        run(config, cli_args_order)
+    finally:
+        if profiler is not None:
+            stop_profiler(profiler, config.params.profile_file)
+        if log_listener is not None:
+            log_listener.stop()
+
+
+def run(config: DefaultConfig, cli_args_order: Order) -> None:
+    """Run the mode selected on the command line."""
+    generator = scenario_generator(config, cli_args_order) if config.params.generate else None
+    if config.params.generate and (generator is None or config.params.generate_file):
+        if generator is not None:
+            start = time.perf_counter()
+            generator.write(config.params.generate_file, config.params.generate)
+            elapsed = time.perf_counter() - start
+            logging.info(f'Generated {config.params.generate} orders to {config.params.generate_file} in {elapsed:.1f}s, '
+                         f'{config.params.generate / elapsed:.0f} orders/s')
+        return
+
+    if config.params.simulate:
+        run_simulation(config, cli_args_order)
+        return
+
+    if config.params.workers > 0 and not config.params.batch_file and generator is None:
+        from workers import run_workers
+        run_workers(Client, config, cli_args_order, config.params.workers, config.params.sell_ratio)
+        return
+
     client = Client(config, cli_args_order)
 
     logging.info(f'Client started with runtime: {config.params.runtime}, side: {config.params.side}')
 
+    reporter = MetricsReporter(client,
+                               interval=config.params.metrics_interval,
+                               path=config.params.metrics_file,
+                               port=config.params.metrics_port).start()
+    if config.params.track:
+        client.track_orders()
     try:
-        client.run()
+        if config.params.batch_file:
+            from batch import BatchRun
+            batch = BatchRun(config.params.batch_file, config.params.batch_results, config.params.side.value)
+            batch.run(client, config.params.concurrency)
+        elif generator is not None:
+            import asyncio
+            from engine import AsyncOrderEngine
+            engine = AsyncOrderEngine(client, config.params.concurrency, orders=generator.orders(config.params.generate))
+            asyncio.run(engine.run())
+        elif config.params.concurrency > 0:
+            import asyncio
+            from engine import AsyncOrderEngine
+            engine = AsyncOrderEngine(client, config.params.concurrency)
+            asyncio.run(engine.run())
+        else:
+            client.run()
     except KeyboardInterrupt:
         pass
+    finally:
+        reporter.stop()
+        if client.tracker is not None:
+            client.trade_feed.stop()
+            logging.info(f'Order tracker: {client.tracker.summary()}')
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,220 @@
+"""
+Retries of failed order submissions.
+
+An order that failed with a connection error, a connect timeout or one of
+the status codes RETRY_STATUS_CODES (401, 408, 429, 503) is resent after a
+jittered exponential backoff: the same order with the same idempotency
+key, until it is accepted or rejected, runs out of attempts, or its
+expiry_time is too close. Orders that failed for good are appended to the
+dead-letter file:
+
+    retry = OrderRetry(RetryPolicy(), DeadLetterFile("dead_letter_orders.jsonl"))
+    submission = retry.submission(order)
+    while True:
+        response = client.send_order(body, submission.key)  # or the error
+        delay = retry.next_delay(submission, response.status_code)
+        if delay is None:
+            break
+        time.sleep(delay)
+
+The key is sent in the Idempotency-Key header, so a marketplace that
+processed a request whose response was lost returns the first result
+instead of creating the order twice. The marketplace API does not support
+the header yet, so the failures after which the order may have been
+created, a read timeout, a connection closed after the request was sent or
+one of AMBIGUOUS_STATUS_CODES (500, 502, 504), are only resent with
+RetryPolicy.retry_ambiguous (--retry-ambiguous); otherwise they are
+written to the dead-letter file, to be checked before they are resent.
+"""
+
+import dataclasses
+import datetime as dt
+import functools
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+
+import const
+from utils import Order
+
+@functools.cache
+def retry_errors() -> tuple[type[Exception], ...]:
+    """Failures without a response, the order may or may not have reached the marketplace.
+
+    A function, so requests is imported with the first order and not at startup.
+    """
+    import ssl
+    import requests
+    import urllib3
+    return (ssl.SSLError, urllib3.exceptions.NewConnectionError,
+            requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+def sent_without_response(error: Exception) -> bool:
+    """Whether the request failed after it was sent, so the marketplace may have created the order."""
+    import requests
+    import urllib3
+    if isinstance(error, requests.exceptions.ReadTimeout):
+        return True
+    # e.g. RemoteDisconnected, the connection was closed before the response
+    return (isinstance(error, requests.exceptions.ConnectionError) and bool(error.args)
+            and isinstance(error.args[0], urllib3.exceptions.ProtocolError))
+
+
+def order_deadline(order: Order, margin: float = const.RETRY_EXPIRY_MARGIN) -> float:
+    """time.time() after which the order is not resent, `margin` seconds before its expiry_time.
+
+    Expiry times without timezone are UTC, like the --expiry-time option.
+    Orders without a valid expiry_time are resent until the attempts run out.
+    """
+    expiry = order.expiry_time
+    if isinstance(expiry, str):
+        try:
+            expiry = dt.datetime.fromisoformat(expiry)
+        except ValueError:
+            return float("inf")
+    if not isinstance(expiry, dt.datetime):
+        return float("inf")
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=dt.timezone.utc)
+    return expiry.timestamp() - margin
+
+
+@dataclasses.dataclass
+class RetryPolicy:
+    """Attempts per order and the backoff between them."""
+    max_attempts: int = const.DEFAULT_RETRY_ATTEMPTS # including the first, 1 disables retries
+    base_delay: float = const.RETRY_BASE_DELAY
+    max_delay: float = const.RETRY_MAX_DELAY
+    expiry_margin: float = const.RETRY_EXPIRY_MARGIN
+    # also resend after the failures the order may have been created by, needs a marketplace honouring Idempotency-Key
+    retry_ambiguous: bool = False
+
+    def retryable(self, status_code: int | None, error: Exception = None) -> bool:
+        """Whether an attempt failed with this status code or error is resent."""
+        if error is not None:
+            return self.retry_ambiguous or not sent_without_response(error)
+        if status_code in const.RETRY_STATUS_CODES:
+            return True
+        return self.retry_ambiguous and status_code in const.AMBIGUOUS_STATUS_CODES
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds before the next attempt after `attempt` failed ones.
+
+        Full jitter, uniform between 0 and the exponential backoff, so the
+        orders that failed together are not resent together.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+@dataclasses.dataclass(slots=True)
+class Submission:
+    """An order and its attempts, all attempts are sent with the same idempotency key."""
+    order: Order
+    key: str
+    deadline: float
+    attempts: int = 0
+
+
+class DeadLetterFile:
+    """JSONL file of the orders that failed for good.
+
+    The file is opened on the first failure and appended line by line, so
+    the worker processes can share it. The order of a line is a record of
+    the batch file format, the orders can be resent with
+    `jq -c .order dead_letter_orders.jsonl > retry.jsonl` and --batch.
+    """
+    def __init__(self, path: str = const.DEFAULT_DEAD_LETTER_FILE) -> None:
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, submission: Submission, status_code: int | None, error: str) -> None:
+        record = {
+            "order": dataclasses.asdict(submission.order),
+            "idempotency_key": submission.key,
+            "attempts": submission.attempts,
+            "status_code": status_code,
+            "error": error,
+            "failed_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+        }
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(line)
+                self._file.flush()
+            except OSError as e:
+                logging.error(f"Dead-letter file {self.path} not written: {e}")
+                return
+            self.count += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class OrderRetry:
+    """Decides after every attempt of an order whether and when it is resent.
+
+    Shared by the senders of a Client, next_delay is called from the serial
+    loop or the event loop of the engine, the sleeping is up to the caller.
+    """
+    def __init__(self, policy: RetryPolicy = None, dead_letter: DeadLetterFile = None) -> None:
+        self.policy = policy or RetryPolicy()
+        self.dead_letter = dead_letter
+        self.retries = 0
+        self.failed = 0
+
+    def submission(self, order: Order) -> Submission:
+        return Submission(order, uuid.uuid4().hex, order_deadline(order, self.policy.expiry_margin))
+
+    def next_delay(self, submission: Submission, status_code: int | None, error: Exception = None) -> float | None:
+        """Seconds to wait before resending the order, None if it is done.
+
+        Called with the status code of the response, or None and the error
+        if the attempt failed without one. An order is done when it was
+        accepted, rejected with a status code that is not retried, out of
+        attempts or too close to its expiry time; the failed ones are
+        written to the dead-letter file.
+        """
+        submission.attempts += 1
+        if error is None and status_code < 300:
+            return None
+        reason = str(error) if error is not None else f"status code {status_code}"
+        if not self.policy.retryable(status_code, error):
+            if error is not None or status_code in const.AMBIGUOUS_STATUS_CODES:
+                self._fail(submission, status_code, f"{reason}, not resent, the order may have been created")
+            else:
+                self._fail(submission, status_code, "rejected")
+            return None
+        if submission.attempts >= self.policy.max_attempts:
+            self._fail(submission, status_code, f"{reason}, out of attempts")
+            return None
+        delay = self.policy.backoff(submission.attempts)
+        if time.time() + delay > submission.deadline:
+            self._fail(submission, status_code, f"{reason}, expires before the next attempt")
+            return None
+        self.retries += 1
+        logging.warning(f"Order attempt {submission.attempts} failed with {reason}, resent in {delay:.2f}s")
+        return delay
+
+    def not_sent(self, submission: Submission, error: Exception) -> None:
+        """Record an order that failed before its first attempt, e.g. its body could not be encoded."""
+        self._fail(submission, None, f"{error}, not sent")
+
+    def _fail(self, submission: Submission, status_code: int | None, reason: str) -> None:
+        self.failed += 1
+        logging.error(f"Order failed after {submission.attempts} attempts: {reason}")
+        if self.dead_letter is not None:
+            self.dead_letter.write(submission, status_code, reason)
+
+    def summary(self) -> str:
+        return f"retries {self.retries}, failed {self.failed}"
@@ -0,0 +1,154 @@
+"""
+Synthetic order scenarios generated ahead of time in NumPy batches.
+
+Power, price, country and delivery slot of a batch of orders are drawn as
+index arrays in one call each, with the same ranges as
+Client.set_random_order_parameters. The JSON fragments of all power and
+price values and of every delivery slot and country are formatted once,
+so an order of the scenario is only a lookup of three fragments:
+
+    generator = ScenarioGenerator(config.buyer, Side.BUY, seed=1)
+    generator.write("orders.jsonl", 1000000)      # input for --batch
+    engine = AsyncOrderEngine(client, 10, orders=generator.orders(100000))
+
+The delivery slots are consecutive quarter hours from the start time: an
+order of slot i is created at start + i * 15 minutes, delivered one hour
+later for one hour and expires ten minutes after its creation, like the
+orders of the client.
+
+Requires numpy (pip install numpy).
+"""
+
+import datetime as dt
+import functools
+import json
+from typing import Iterator
+
+import numpy as np
+
+import const
+from utils import Order, SellerBuyerSettings, Side
+
+SLOT_MINUTES = 15
+MAX_TABLE_SIZE = 1000000  # distinct power or price values formatted up front
+
+
+def format_time(time: dt.datetime) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def round_quarter(t: dt.datetime) -> dt.datetime:
+    """Round the time up to the next quarter hour 00, 15, 30, 45"""
+    minute = t.minute
+    if minute % 15 != 0:
+        t += dt.timedelta(minutes=15 - (minute % 15))
+    return t.replace(second=0, microsecond=0)
+
+
+@functools.lru_cache(maxsize=16)
+def slot_times(first: dt.datetime, slots: int) -> tuple[tuple[str, str, str], ...]:
+    """Formatted (delivery_start, delivery_end, expiry_time) of the orders created in `slots` quarter hours from first."""
+    times = []
+    for i in range(slots):
+        created = first + dt.timedelta(minutes=SLOT_MINUTES * i)
+        times.append((format_time(created + dt.timedelta(hours=1)),
+                      format_time(created + dt.timedelta(hours=2)),
+                      format_time(created + dt.timedelta(minutes=10))))
+    return tuple(times)
+
+
+class ScenarioGenerator:
+    """Random orders of one side, generated `batch_size` at a time.
+
+    The fields set in `overrides`, e.g. the order options of the command
+    line, are the same for all orders, like in Client._overide_order_client_args.
+    """
+    def __init__(self,
+                 settings: SellerBuyerSettings,
+                 side: Side,
+                 start: dt.datetime = None,
+                 slots: int = const.DEFAULT_SCENARIO_SLOTS,
+                 overrides: Order = None,
+                 seed: int = None,
+                 batch_size: int = const.DEFAULT_SCENARIO_BATCH,
+                 ) -> None:
+        self.side = side.value
+        self.batch_size = batch_size
+        self.rng = np.random.default_rng(seed)
+        overrides = overrides or Order(side=self.side)
+
+        # the same value ranges as random.randrange(power_min, power_max, 100) and round(random.uniform(min, max), 2)
+        if overrides.power is not None:
+            self.powers = [float(overrides.power)]
+        else:
+            self.powers = [float(power) for power in range(settings.power_min, settings.power_max, 100)]
+        if overrides.price is not None:
+            self.prices = [float(overrides.price)]
+        else:
+            cents = range(round(settings.unit_price_min * 100), round(settings.unit_price_max * 100) + 1)
+            self.prices = [cent / 100 for cent in cents]
+        if max(len(self.powers), len(self.prices)) > MAX_TABLE_SIZE:
+            raise ValueError(f"More than {MAX_TABLE_SIZE} power or price values, narrow the ranges of the settings")
+        self.countries = [overrides.country_code] if overrides.country_code is not None else const.COUNTRY_CODES_ALLOWED
+        if overrides.delivery_start is not None or overrides.delivery_end is not None or overrides.expiry_time is not None:
+            # a fixed slot, the missing times are taken from the first generated slot
+            first = slot_times(round_quarter(start or dt.datetime.now(dt.timezone.utc)), 1)[0]
+            self.slots = ((overrides.delivery_start or first[0], overrides.delivery_end or first[1], overrides.expiry_time or first[2]),)
+        else:
+            self.slots = slot_times(round_quarter(start or dt.datetime.now(dt.timezone.utc)), slots)
+        self.location_ids = overrides.location_ids or [None]
+        self.baseline = settings.baseline if side == Side.SELL else None
+
+        # JSON fragments of the batch file records, a record is head + price + tail
+        self._heads = np.array([f'{{"side":{json.dumps(self.side)},"power":{power!r},' for power in self.powers], dtype=object)
+        self._prices = np.array([f'"price":{price!r},' for price in self.prices], dtype=object)
+        baseline = json.dumps(self.baseline, separators=(",", ":"))
+        location_ids = json.dumps(self.location_ids)
+        self._tails = np.array([
+            f'"delivery_start":"{start}","delivery_end":"{end}","expiry_time":"{expiry}",'
+            f'"location_ids":{location_ids},"country_code":{json.dumps(country)},"baseline":{baseline}}}\n'
+            for start, end, expiry in self.slots for country in self.countries
+        ], dtype=object)
+
+    def arrays(self, count: int) -> dict[str, np.ndarray]:
+        """Index arrays of `count` orders into powers, prices, slots and countries."""
+        return {
+            "power": self.rng.integers(0, len(self.powers), count),
+            "price": self.rng.integers(0, len(self.prices), count),
+            "slot": self.rng.integers(0, len(self.slots), count),
+            "country": self.rng.integers(0, len(self.countries), count),
+        }
+
+    def _batches(self, count: int) -> Iterator[dict[str, np.ndarray]]:
+        for offset in range(0, count, self.batch_size):
+            yield self.arrays(min(self.batch_size, count - offset))
+
+    def records(self, count: int) -> Iterator[str]:
+        """JSON lines of `count` orders in the format of the batch file, one string per batch."""
+        for batch in self._batches(count):
+            lines = (self._heads[batch["power"]] + self._prices[batch["price"]]
+                     + self._tails[batch["slot"] * len(self.countries) + batch["country"]])
+            yield "".join(lines.tolist())
+
+    def write(self, path: str, count: int) -> int:
+        """Write `count` orders to a JSONL file for --batch, returns the number of orders."""
+        with open(path, "w", encoding="utf-8") as f:
+            for chunk in self.records(count):
+                f.write(chunk)
+        return count
+
+    def orders(self, count: int) -> Iterator[Order]:
+        """`count` orders, generated a batch at a time, for AsyncOrderEngine(orders=...)."""
+        for batch in self._batches(count):
+            for power, price, slot, country in zip(batch["power"].tolist(), batch["price"].tolist(),
+                                                   batch["slot"].tolist(), batch["country"].tolist()):
+                delivery_start, delivery_end, expiry_time = self.slots[slot]
+                yield Order(side=self.side,
+                            location_ids=self.location_ids,
+                            country_code=self.countries[country],
+                            power=self.powers[power],
+                            price=self.prices[price],
+                            delivery_start=delivery_start,
+                            delivery_end=delivery_end,
+                            expiry_time=expiry_time,
+                            baseline=self.baseline)
@@ -0,0 +1,50 @@
+from typing import TYPE_CHECKING
+
+import const
+
+if TYPE_CHECKING:
+    import requests
+
+
+class HttpSession:
+    """Shared HTTP session with a keep-alive connection pool.
+
+    One instance is shared by the Client and Auth so that order and token
+    requests reuse the same TCP/TLS connections instead of paying for a new
+    handshake on every request. With keep_alive disabled every request goes
+    through the module-level requests.post, which opens a new connection.
+    """
+    def __init__(self,
+                pool_size: int = const.DEFAULT_POOL_SIZE,
+                connect_timeout: float = const.DEFAULT_CONNECT_TIMEOUT,
+                read_timeout: float = const.DEFAULT_READ_TIMEOUT,
+                keep_alive: bool = True,
+                verify = True
+                ) -> None:
+
+        self.timeout = (connect_timeout, read_timeout)
+        self.keep_alive = keep_alive
+        self.verify = verify
+
+        # most of the import time of the client, paid by the first session and not by --help
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        self.session.verify = verify
+        # no automatic retries, failed requests are handled by the caller
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, url: str, **kwargs) -> "requests.Response":
+        """Send a post request, reusing a pooled connection if keep alive is enabled."""
+        kwargs.setdefault("timeout", self.timeout)
+        kwargs.setdefault("verify", self.verify)
+        if not self.keep_alive:
+            import requests
+            return requests.post(url, **kwargs)
+        return self.session.post(url, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
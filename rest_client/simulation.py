@@ -0,0 +1,328 @@
+"""
+Market simulation with many virtual buyers and sellers in one process.
+
+A JSON file describes groups of agents, each group with its own order
+settings (the fields of SellerBuyerSettings), timing and credentials:
+
+    {
+        "concurrency": 50,
+        "runtime": 600,
+        "groups": [
+            {"name": "households", "side": "buy", "count": 500, "username": "buyer", "password": "...",
+             "interval": 30, "power_min": 1000, "power_max": 2000, "unit_price_min": 0.5, "unit_price_max": 1.5},
+            {"name": "batteries", "side": "sell", "count": 50, "username": "seller", "password": "...",
+             "interval": 5, "wait_multiplier_min": 1, "wait_multiplier_max": 2}
+        ]
+    }
+
+Like Client.run, an agent waits interval * randint(wait_multiplier_min,
+wait_multiplier_max) seconds between its orders. Missing order settings
+are taken from the buyer or seller settings of the config, missing
+credentials from the command line.
+
+All agents are driven by one AgentScheduler on one asyncio event loop. A
+heap of (due time, action) pops the agents that are due, builds their
+orders and posts them on a thread pool sharing one connection pool, with
+at most `concurrency` orders in flight. Agents with the same username share
+one Client, whose token is renewed from the same heap instead of by a
+TokenRefresher thread, so thousands of agents run without a thread each.
+Failed orders are resent by the OrderRetry of their Client, with the same
+backoff and idempotency key as the orders of the order engine.
+"""
+
+import asyncio
+import dataclasses
+import heapq
+import itertools
+import json
+import logging
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import const
+from metrics import Histogram
+from retry import retry_errors
+from session import HttpSession
+from utils import DefaultConfig, Order, SellerBuyerSettings, Side
+
+SIMULATION_FIELDS = ("concurrency", "runtime", "groups")
+GROUP_FIELDS = ("name", "side", "count", "username", "password", "interval", "rate") + tuple(
+    field.name for field in dataclasses.fields(SellerBuyerSettings))
+
+
+@dataclasses.dataclass
+class AgentGroup:
+    """Agents with the same settings and credentials, and their results."""
+    name: str
+    side: Side
+    count: int
+    settings: SellerBuyerSettings
+    interval: float
+    username: str
+    password: str
+    rate: float = 0 # orders per second of the user, 0 is unlimited until the first 429
+    sent: int = 0
+    errors: int = 0
+    # orders not placed because the previous order of the agent was still waiting for the rate limiter
+    skipped: int = 0
+    status_codes: Counter = dataclasses.field(default_factory=Counter)
+    # seconds the orders started after they were due, grows when concurrency is the bottleneck
+    lag: Histogram = dataclasses.field(default_factory=Histogram)
+
+    def summary(self, elapsed: float) -> str:
+        return (f'{self.name} ({self.count} {self.side.value} agents): {self.sent} orders, '
+                f'{self.sent / elapsed if elapsed else 0:.1f} orders/s, status codes {dict(self.status_codes)}, '
+                f'errors {self.errors}, skipped {self.skipped}, lag {self.lag.summary()}')
+
+
+@dataclasses.dataclass(slots=True)
+class Agent:
+    group: AgentGroup
+    client: object
+    # an order of the agent is being sent, with its retries
+    pending: bool = False
+
+
+def group_from_record(record: dict, config: DefaultConfig, index: int = 0) -> AgentGroup:
+    """Validate a group of the simulation file and convert it to an AgentGroup, raises ValueError if invalid."""
+    if not isinstance(record, dict):
+        raise ValueError("group is not a JSON object")
+    unknown = set(record) - set(GROUP_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown fields {sorted(unknown)}")
+    name = record.get("name", f"group {index}")
+    try:
+        side = Side(record.get("side"))
+    except ValueError:
+        raise ValueError(f"group {name!r}: side must be buy or sell, got {record.get('side')!r}")
+    defaults = config.seller if side == Side.SELL else config.buyer
+    try:
+        settings = dataclasses.replace(defaults, **{field: record[field] for field in record
+                                                    if field in SellerBuyerSettings.__dataclass_fields__})
+        count = int(record.get("count", 1))
+        interval = float(record.get("interval", config.params.frequency))
+        rate = float(record.get("rate", 0))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"group {name!r}: {e}")
+    if count < 1 or interval <= 0:
+        raise ValueError(f"group {name!r}: count and interval must be positive")
+    if settings.power_min >= settings.power_max or settings.unit_price_min > settings.unit_price_max:
+        raise ValueError(f"group {name!r}: empty power or price range")
+    if not 1 <= settings.wait_multiplier_min <= settings.wait_multiplier_max:
+        raise ValueError(f"group {name!r}: wait multipliers must be 1 <= min <= max")
+    return AgentGroup(name=name,
+                      side=side,
+                      count=count,
+                      settings=settings,
+                      interval=interval,
+                      username=record.get("username", config.user.username),
+                      password=record.get("password", config.user.password),
+                      rate=rate)
+
+
+def load_simulation(path: str, config: DefaultConfig) -> tuple[list[AgentGroup], dict]:
+    """Agent groups and the options concurrency and runtime of a simulation file."""
+    with open(path, encoding="utf-8") as f:
+        simulation = json.load(f)
+    if not isinstance(simulation, dict) or not isinstance(simulation.get("groups"), list) or not simulation["groups"]:
+        raise ValueError("the simulation file needs a list of groups")
+    unknown = set(simulation) - set(SIMULATION_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown fields {sorted(unknown)}")
+    groups = [group_from_record(record, config, index) for index, record in enumerate(simulation["groups"])]
+    options = {name: simulation[name] for name in ("concurrency", "runtime") if name in simulation}
+    return groups, options
+
+
+class AgentScheduler:
+    """Drives the agents of all groups from one heap of timers on one event loop.
+
+    Each heap entry is (due, seq, action, target): an agent placing its next
+    order or a client renewing its token. The loop sleeps until the earliest
+    entry is due, or until an earlier entry is scheduled.
+    """
+    def __init__(self, client_class, config: DefaultConfig, cli_order: Order, groups: list[AgentGroup],
+                 concurrency: int, runtime: float = 0) -> None:
+        self.config = config
+        self.groups = groups
+        self.concurrency = max(1, concurrency)
+        self.runtime = runtime
+        # one connection pool for all users, every order in flight needs its own connection
+        self.session = HttpSession(pool_size=self.concurrency,
+                                   connect_timeout=config.session.connect_timeout,
+                                   read_timeout=config.session.read_timeout,
+                                   keep_alive=config.session.keep_alive,
+                                   verify=config.market.ssl_verify)
+        self.clients = {}
+        self.agents = []
+        for group in groups:
+            key = (group.username, group.password)
+            if key not in self.clients:
+                user_config = dataclasses.replace(config,
+                                                  user=dataclasses.replace(config.user, username=group.username, password=group.password),
+                                                  params=dataclasses.replace(config.params, rate=group.rate, max_rate=0))
+                self.clients[key] = client_class(user_config, cli_order, session=self.session)
+            self.agents += [Agent(group, self.clients[key]) for _ in range(group.count)]
+        self.heap = []
+        self._seq = itertools.count()
+        self._renew_due = {}
+        self.elapsed = 0
+        self._wake = None
+
+    def schedule(self, due: float, action, target) -> None:
+        seq = next(self._seq)
+        heapq.heappush(self.heap, (due, seq, action, target))
+        if self.heap[0][1] == seq:
+            # earlier than the entry the loop sleeps for
+            self._wake.set()
+
+    async def _call(self, executor: ThreadPoolExecutor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    def _schedule_renewal(self, client, due: float) -> None:
+        # a renewal after a 401 replaces the periodic one, the replaced entry is skipped
+        self._renew_due[client] = due
+        self.schedule(due, self._renew, client)
+
+    async def _renew(self, client, due: float) -> None:
+        if self._renew_due.get(client) != due:
+            return
+        self._renew_due[client] = None
+        self._spawn(self._renew_token(client))
+
+    async def _renew_token(self, client) -> None:
+        await self._call(self._auth_executor, client.token_refresher.renew)
+        loop = asyncio.get_running_loop()
+        self._schedule_renewal(client, loop.time() + client.auth.seconds_until_refresh(client.token_refresher.ratio))
+
+    async def _order(self, agent: Agent, due: float) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        group = agent.group
+        group.lag.record(now - due)
+        order, wmin, wmax = agent.client.set_random_order_parameters(group.settings, group.side, agent.client.config)
+        # counted from now, an agent that is late does not catch up with a burst of orders
+        self.schedule(now + group.interval * random.randint(wmin, wmax), self._order, agent)
+        if agent.pending:
+            # one order per agent at a time, the orders of a rate limited user do not pile up
+            group.skipped += 1
+            return
+        agent.pending = True
+        self._spawn(self._submit(agent, order))
+
+    async def _wait(self, awaitable) -> None:
+        """Wait for a rate limiter or a backoff, cancelled when the simulation ends."""
+        task = asyncio.current_task()
+        self._waiting.add(task)
+        try:
+            await awaitable
+        finally:
+            self._waiting.discard(task)
+
+    async def _submit(self, agent: Agent, order: Order) -> None:
+        """Send the order with the retries of its client, like the order engine does.
+
+        Every attempt waits for the rate limiter of its user before it takes
+        a slot, so the agents of a slow user do not hold the slots of the
+        other groups. The slot is released during the backoff as well.
+        """
+        client, group = agent.client, agent.group
+        try:
+            submission = client.retry.submission(order)
+            try:
+                body = client.encoder.encode(order)
+            except (TypeError, ValueError) as e:
+                logging.error(f'Agent of {group.name}: {e}')
+                client.retry.not_sent(submission, e)
+                group.errors += 1
+                return
+            while True:
+                await self._wait(client.rate_limiter.acquire_async())
+                response, error = None, None
+                async with self._slots:
+                    token = client.auth.token()
+                    try:
+                        response = await self._call(self._executor, client.post_order, body, submission.key)
+                    except retry_errors() as e:
+                        logging.error(f'Agent of {group.name}: {e}')
+                        client.stats.record_error()
+                        error = e
+                if response is not None and response.status_code == const.HTTP_AUTHENTICATION_ERROR \
+                        and self._renew_due.get(client) is not None and token == client.auth.token():
+                    self._schedule_renewal(client, asyncio.get_running_loop().time())
+                delay = client.retry.next_delay(submission, response.status_code if response is not None else None, error)
+                if delay is None:
+                    break
+                await self._wait(asyncio.sleep(delay))
+        finally:
+            agent.pending = False
+        if response is None:
+            group.errors += 1
+        else:
+            group.sent += 1
+            group.status_codes[response.status_code] += 1
+            client.log_response(response.status_code, response.text, order)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._auth_executor = ThreadPoolExecutor(max_workers=min(len(self.clients), const.SIMULATION_AUTH_WORKERS))
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._wake = asyncio.Event()
+        self._tasks = set()
+        self._waiting = set()
+
+        logging.info(f'Simulation of {len(self.agents)} agents in {len(self.groups)} groups with {len(self.clients)} users, '
+                     f'target url {self.config.market.host}, concurrency {self.concurrency}')
+        await asyncio.gather(*(self._call(self._auth_executor, client.token_refresher.renew) for client in self.clients.values()))
+        starttime = loop.time()
+        for client in self.clients.values():
+            self._schedule_renewal(client, starttime + client.auth.seconds_until_refresh(client.token_refresher.ratio))
+        for agent in self.agents:
+            # spread the first orders over the longest wait, so the agents do not start at once
+            group = agent.group
+            self.schedule(starttime + random.uniform(0, group.interval * group.settings.wait_multiplier_max), self._order, agent)
+        end = starttime + self.runtime if self.runtime > 0 else float("inf")
+        try:
+            while self.heap:
+                due = self.heap[0][0]
+                if due > end:
+                    break
+                delay = due - loop.time()
+                if delay > 0:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), min(delay, end - loop.time()))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                _, _, action, target = heapq.heappop(self.heap)
+                await action(target, due)
+        finally:
+            for client in self.clients.values():
+                client.token_refresher.stop()
+            # the orders in flight are finished, the ones still waiting are dropped
+            for task in self._waiting:
+                task.cancel()
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            for client in self.clients.values():
+                if client.retry.dead_letter is not None:
+                    client.retry.dead_letter.close()
+            self._executor.shutdown()
+            self._auth_executor.shutdown(wait=False)
+            self.elapsed = loop.time() - starttime
+            self.session.close()
+
+    def log_summary(self) -> None:
+        for group in self.groups:
+            logging.info(f'Group {group.summary(self.elapsed)}')
+        for (username, _), client in self.clients.items():
+            client.stats.elapsed = self.elapsed
+            logging.info(f'User {username}: {client.stats.summary()}, {client.retry.summary()}')
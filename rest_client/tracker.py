@@ -0,0 +1,183 @@
+import json
+import logging
+import ssl
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass
+
+import requests
+import websocket
+
+import const
+from metrics import Histogram
+
+ACCEPTED = "accepted"
+MATCHED = "matched"
+EXPIRED = "expired"
+TERMINAL_STATES = (MATCHED, EXPIRED)
+
+
+@dataclass(slots=True)
+class TrackedOrder:
+    """State and transition times of a submitted order, times are time.time() seconds."""
+    order_id: str
+    side: str
+    submitted_at: float
+    accepted_at: float = None
+    matched_at: float = None
+    expired_at: float = None
+    state: str = ACCEPTED
+
+
+def order_id_from_response(response: requests.Response) -> str | None:
+    """Id of the created order in the response body of the order endpoint."""
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    if not isinstance(body, dict):
+        return None
+    order_id = body.get("id", body.get("order_id"))
+    return None if order_id is None else str(order_id)
+
+
+class OrderTracker:
+    """Lifecycle of the submitted orders, correlated with the updates of the trade websocket feed.
+
+    Orders are indexed by id when the order endpoint accepts them, the
+    trade feed moves them to matched or expired. Updates can arrive before
+    the REST response, they are kept for a short while and applied when
+    the order is submitted. Terminal orders are evicted first when more
+    than `max_orders` are tracked, then the oldest open ones.
+    """
+    def __init__(self, max_orders: int = const.MAX_TRACKED_ORDERS) -> None:
+        self.max_orders = max_orders
+        self.orders = {}
+        self.states = Counter()
+        self.evicted = 0
+        self.unknown_updates = 0
+        self.match_latency = Histogram()
+        self.expiry_latency = Histogram()
+        self._terminal = deque()
+        self._early = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submitted(self, response: requests.Response, side: str, submitted_at: float) -> TrackedOrder | None:
+        """Track an order accepted by the order endpoint, returns None if the response has no order id."""
+        order_id = order_id_from_response(response)
+        if order_id is None:
+            return None
+        order = TrackedOrder(order_id, side, submitted_at, accepted_at=time.time())
+        with self._lock:
+            self.orders[order_id] = order
+            self.states[ACCEPTED] += 1
+            early = self._early.pop(order_id, None)
+            if early is not None:
+                self._transition(order, *early)
+            self._evict()
+        return order
+
+    def update(self, order_id: str, status: str, timestamp: float = None) -> None:
+        """Apply a status update of the trade feed."""
+        if status not in TERMINAL_STATES:
+            return
+        timestamp = timestamp or time.time()
+        with self._lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                # not submitted by this client, or the REST response is still on its way
+                self.unknown_updates += 1
+                self._early[order_id] = (status, timestamp)
+                if len(self._early) > self.max_orders:
+                    self._early.popitem(last=False)
+                return
+            self._transition(order, status, timestamp)
+
+    def on_message(self, message: dict) -> None:
+        """Handler for the parsed messages of the trade websocket feed."""
+        order_id = message.get("order_id", message.get("id"))
+        if order_id is not None:
+            # local receive time, the latency is measured on this host's clock
+            self.update(str(order_id), message.get("status"))
+
+    def _transition(self, order: TrackedOrder, status: str, timestamp: float) -> None:
+        if order.state in TERMINAL_STATES:
+            return
+        self.states[order.state] -= 1
+        order.state = status
+        self.states[status] += 1
+        if status == MATCHED:
+            order.matched_at = timestamp
+            self.match_latency.record(timestamp - order.submitted_at)
+        else:
+            order.expired_at = timestamp
+            self.expiry_latency.record(timestamp - order.submitted_at)
+        self._terminal.append(order.order_id)
+
+    def _evict(self) -> None:
+        while len(self.orders) > self.max_orders:
+            if self._terminal:
+                order = self.orders.pop(self._terminal.popleft(), None)
+            else:
+                # no terminal orders left, the oldest open order is dropped
+                order = self.orders.pop(next(iter(self.orders)))
+            if order is not None:
+                self.states[order.state] -= 1
+                self.evicted += 1
+
+    def get(self, order_id: str) -> TrackedOrder | None:
+        with self._lock:
+            return self.orders.get(str(order_id))
+
+    def summary(self) -> str:
+        with self._lock:
+            return (f'orders {dict(+self.states)}, evicted {self.evicted}, unknown updates {self.unknown_updates}, '
+                    f'submit to match {self.match_latency.summary()}, submit to expiry {self.expiry_latency.summary()}')
+
+
+class TradeFeed:
+    """Listener of the trade websocket endpoint feeding an OrderTracker.
+
+    Runs websocket-client's run_forever in a daemon thread, which reconnects
+    after lost connections with the current token of the Auth. With a ready
+    event, e.g. TokenRefresher.ready, it connects once the first token is granted.
+    """
+    def __init__(self, tracker: OrderTracker, auth, host: str, endpoint: str = const.TRADE_WS_ENDPOINT,
+                 ssl_verify: bool = True, reconnect: float = const.TRADE_FEED_RECONNECT,
+                 ready: threading.Event = None) -> None:
+        self.tracker = tracker
+        self.auth = auth
+        self.ready = ready
+        self.reconnect = reconnect
+        self.sslopt = None if ssl_verify else {"cert_reqs": ssl.CERT_NONE, "check_hostname": False}
+        self.ws = websocket.WebSocketApp(
+            f"wss://{host}{endpoint}",
+            # called on every (re)connect, so a renewed token is used
+            header=lambda: {"Authorization": f"Bearer {self.auth.token()}"},
+            on_message=self._on_message,
+            on_error=self._on_error,
+        )
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "TradeFeed":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.ws.close()
+
+    def _run(self) -> None:
+        if self.ready is not None:
+            self.ready.wait()
+        self.ws.run_forever(sslopt=self.sslopt, reconnect=self.reconnect)
+
+    def _on_message(self, ws, message) -> None:
+        try:
+            self.tracker.on_message(json.loads(message))
+        except (ValueError, AttributeError):
+            logging.debug('Invalid trade feed message: %s', message)
+
+    @staticmethod
+    def _on_error(ws, error) -> None:
+        logging.warning('Trade feed error: %s', error)
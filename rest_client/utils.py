@@ -1,6 +1,7 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import argparse
 from enum import Enum
+import datetime as dt
 
 import const
 
@@ -27,10 +28,37 @@ class SellerBuyerSettings:
     baseline: dict = None
 
 
+@dataclass
+class Order:
+    side: str
+    location_ids: list[str] = None
+    country_code: str = None
+    power: float = None
+    price: float = None
+    delivery_start: dt.datetime = None
+    delivery_end: dt.datetime = None
+    expiry_time: dt.datetime = None
+    baseline: dict = None
+
+    def as_dict(self) -> dict:
+        return {
+            "side": self.side,
+            "power": float(self.power),
+            "price": float(self.price),
+            "delivery_start": self.delivery_start,
+            "delivery_end": self.delivery_end,
+            "expiry_time": self.expiry_time,
+            "location": {"location_id": self.location_ids,
+                        "country_code": self.country_code},
+            "baseline": self.baseline
+        }
+
+
 @dataclass
 class UserConfig:
     username: str = None
     password: str = None
+    token_cache: str = None # token cache file shared with other runs, None disables it
 
 @dataclass
 class EndpointConfig:
@@ -44,7 +72,28 @@ class Parameters:
     timezone: str
     frequency: float = -1
     log: bool = False
+    json_log: bool = False
     run_only_once: bool = False
+    concurrency: int = 0 # orders in flight, 0 runs the serial loop
+    rate: float = 0 # target orders per second, 0 is unlimited until the first 429
+    max_rate: float = 0 # upper bound of the adaptive rate, 0 uses rate
+    workers: int = 0 # worker processes, 0 runs in this process
+    sell_ratio: float = None # share of selling workers, None uses side
+    metrics_interval: float = 0 # seconds between metrics summary lines, 0 disables them
+    metrics_file: str = None
+    metrics_port: int = None
+    batch_file: str = None
+    batch_results: str = const.DEFAULT_BATCH_RESULTS
+    track: bool = False # follow the submitted orders on the trade websocket feed
+    generate: int = 0 # random orders of a generated scenario, 0 disables it
+    generate_file: str = None # write the generated orders to this file instead of sending them
+    seed: int = None # random seed of the generated scenario
+    simulate: str = None # simulation file with the agent groups, see simulation.py
+    retry_attempts: int = const.DEFAULT_RETRY_ATTEMPTS # attempts per order, 1 disables retries
+    retry_ambiguous: bool = False # also resend after read timeouts and 500, 502, 504, see retry.py
+    dead_letter: str = const.DEFAULT_DEAD_LETTER_FILE # orders that failed for good, None disables the file
+    profile: bool = False # time the stages of the order path, see profiling.py
+    profile_file: str = None # collapsed stacks of the profile
 
 @dataclass
 class HostConfig:
@@ -53,6 +102,14 @@ class HostConfig:
     ssl_verify: bool
     api: EndpointConfig
 
+@dataclass
+class SessionConfig:
+    """Connection pool and timeout settings of the shared HTTP session."""
+    pool_size: int = const.DEFAULT_POOL_SIZE
+    connect_timeout: float = const.DEFAULT_CONNECT_TIMEOUT
+    read_timeout: float = const.DEFAULT_READ_TIMEOUT
+    keep_alive: bool = True
+
 @dataclass
 class DefaultConfig:
     market: HostConfig
@@ -60,6 +117,7 @@ class DefaultConfig:
     params: Parameters
     buyer: SellerBuyerSettings = None
     seller: SellerBuyerSettings = None
+    session: SessionConfig = field(default_factory=SessionConfig)
 
 def cli_args(config: DefaultConfig) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Create buy or sell orders")
@@ -69,8 +127,38 @@ def cli_args(config: DefaultConfig) -> argparse.Namespace:
     parser.add_argument('side', choices=['buy', 'sell'])
     parser.add_argument("-r", "--run", dest="run_time", metavar="", type=int, default=config.params.runtime, help=f"Running time in seconds. 0 runs forever, -1 sends one order and exits, same as --run-once option. Default: {config.params.runtime}")
     parser.add_argument("-s", "--sleep", dest="sleep_time", metavar="", type=float, default=config.params.frequency, help=f"Time between order requests. Default: {config.params.frequency}")
-    parser.add_argument('--log', dest='log', action='store_true', help=f"Log orders output to file")
+    parser.add_argument('--log', dest='log', action='store_true', help=f"Log orders output to file {const.ORDER_LOG_FILE}")
+    parser.add_argument('--json-log', dest='json_log', action='store_true', help=f"Log one compact JSON line per order")
     parser.add_argument("--run-once", dest="once", action="store_true", help=f"Send order once and exit")
+    parser.add_argument("-c", "--concurrency", dest="concurrency", metavar="", type=int, default=config.params.concurrency, help=f"Number of orders in flight with the asyncio engine, 0 uses the serial loop. Default: {config.params.concurrency}")
+    parser.add_argument("--rate", dest="rate", metavar="", type=float, default=config.params.rate, help=f"Target orders per second, lowered on 429 responses, 0 is unlimited. Default: {config.params.rate}")
+    parser.add_argument("--max-rate", dest="max_rate", metavar="", type=float, default=config.params.max_rate, help=f"Upper bound of the adaptive order rate, 0 uses --rate. Default: {config.params.max_rate}")
+    parser.add_argument("-w", "--workers", dest="workers", metavar="", type=int, default=config.params.workers, help=f"Number of worker processes, each running its own client, the rate target is shared. Default: {config.params.workers}")
+    parser.add_argument("--sell-ratio", dest="sell_ratio", metavar="", type=float, default=None, help=f"Share of workers selling, the others buy. Default: all workers use the side argument")
+    parser.add_argument("--batch", dest="batch_file", metavar="", default=None, help=f"Send the orders of a JSONL or CSV file and exit")
+    parser.add_argument("--batch-results", dest="batch_results", metavar="", default=config.params.batch_results, help=f"Result file of the batch mode. Default: {config.params.batch_results}")
+    parser.add_argument("--generate", dest="generate", metavar="", type=int, default=0, help=f"Generate this number of random orders up front and send them like a batch file, requires numpy")
+    parser.add_argument("--generate-file", dest="generate_file", metavar="", default=None, help=f"Write the generated orders to this JSONL file for --batch instead of sending them")
+    parser.add_argument("--seed", dest="seed", metavar="", type=int, default=None, help=f"Random seed of the generated orders")
+    parser.add_argument("--simulate", dest="simulate", metavar="", default=None, help=f"Simulate the buyer and seller agents of this JSON file in one process, see simulation.py")
+    parser.add_argument("--metrics-interval", dest="metrics_interval", metavar="", type=float, default=config.params.metrics_interval, help=f"Log a latency and throughput summary every n seconds, 0 disables it. Default: {config.params.metrics_interval}")
+    parser.add_argument("--metrics-file", dest="metrics_file", metavar="", default=None, help=f"Write metrics in Prometheus text format to this file")
+    parser.add_argument("--metrics-port", dest="metrics_port", metavar="", type=int, default=None, help=f"Serve metrics in Prometheus text format on http://0.0.0.0:<port>/metrics")
+    parser.add_argument("--token-cache", dest="token_cache", metavar="", default=const.TOKEN_CACHE_FILE, help=f"File caching the access token for later runs and other processes. Default: {const.TOKEN_CACHE_FILE}")
+    parser.add_argument("--no-token-cache", dest="token_cache", action="store_const", const=None, help=f"Authenticate on every start without token cache")
+    parser.add_argument("--track", dest="track", action="store_true", help="Track the submitted orders on the trade websocket feed and report the submit to match latency")
+    parser.add_argument("--max-attempts", dest="retry_attempts", metavar="", type=int, default=config.params.retry_attempts, help=f"Attempts per order after connection errors, connect timeouts, 401, 408, 429 and 503 responses, with jittered exponential backoff, 1 disables retries. Default: {config.params.retry_attempts}")
+    parser.add_argument("--retry-ambiguous", dest="retry_ambiguous", action="store_true", help=f"Also resend orders after read timeouts, lost connections and 500, 502, 504 responses, which the marketplace may have processed. Only safe if it honours the Idempotency-Key header")
+    parser.add_argument("--dead-letter", dest="dead_letter", metavar="", default=config.params.dead_letter, help=f"JSONL file of the orders that failed for good. Default: {config.params.dead_letter}")
+    parser.add_argument("--no-dead-letter", dest="dead_letter", action="store_const", const=None, help=f"Only log the orders that failed for good")
+    parser.add_argument("--profile", dest="profile", action="store_true", help=f"Time the stages of the order path in this process and log a per stage breakdown at the end")
+    parser.add_argument("--profile-file", dest="profile_file", metavar="", default=None, help=f"Write the collapsed stacks of the profile to this file for flamegraph.pl or speedscope, implies --profile")
+
+    # http session options
+    parser.add_argument("--pool-size", dest="pool_size", metavar="", type=int, default=config.session.pool_size, help=f"Max keep-alive connections. Default: {config.session.pool_size}")
+    parser.add_argument("--connect-timeout", dest="connect_timeout", metavar="", type=float, default=config.session.connect_timeout, help=f"Connect timeout in seconds. Default: {config.session.connect_timeout}")
+    parser.add_argument("--read-timeout", dest="read_timeout", metavar="", type=float, default=config.session.read_timeout, help=f"Read timeout in seconds. Default: {config.session.read_timeout}")
+    parser.add_argument("--no-keep-alive", dest="keep_alive", action="store_false", help=f"Open a new connection for every request")
 
     # order option to override default settings
     parser.add_argument("--power", dest="power", metavar="", help=f"Power in Watt")
@@ -0,0 +1,168 @@
+import asyncio
+import copy
+import logging
+import multiprocessing
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+import const
+from engine import AsyncOrderEngine
+from log import setup_logging
+from metrics import MetricsReporter, RequestStats
+from utils import DefaultConfig, Order, Side
+
+# queue of the stats snapshots the workers send to the parent, set by the pool initializer
+_snapshots = None
+
+
+def worker_configs(config: DefaultConfig, workers: int, sell_ratio: float = None) -> list[DefaultConfig]:
+    """Copy the config for every worker, splitting the rate target and assigning the sides.
+
+    With a sell ratio the first round(workers * sell_ratio) workers sell and
+    the others buy, otherwise all workers use the side of the config.
+    """
+    sellers = round(workers * sell_ratio) if sell_ratio is not None else None
+    configs = []
+    for index in range(workers):
+        worker_config = copy.deepcopy(config)
+        if sellers is not None:
+            worker_config.params.side = Side.SELL if index < sellers else Side.BUY
+        worker_config.params.rate = config.params.rate / workers
+        worker_config.params.max_rate = config.params.max_rate / workers
+        configs.append(worker_config)
+    return configs
+
+
+class WorkerMetrics:
+    """Merged stats of the workers for the MetricsReporter of the parent process.
+
+    Has the stats, auth.stats and rate_limiter attributes the reporter reads
+    from a Client, merged from the latest snapshot of every worker.
+    """
+    def __init__(self) -> None:
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def receive(self, snapshots) -> None:
+        """Take the snapshots from the queue until it gets None."""
+        while (snapshot := snapshots.get()) is not None:
+            index, *stats = snapshot
+            with self._lock:
+                self._latest[index] = stats
+
+    def _snapshots(self) -> list:
+        with self._lock:
+            return list(self._latest.values())
+
+    def _merged(self, position: int) -> RequestStats:
+        total = RequestStats()
+        for snapshot in self._snapshots():
+            total.merge(snapshot[position])
+        return total
+
+    @property
+    def stats(self) -> RequestStats:
+        return self._merged(0)
+
+    @property
+    def auth(self) -> types.SimpleNamespace:
+        return types.SimpleNamespace(stats=self._merged(1))
+
+    @property
+    def rate_limiter(self) -> types.SimpleNamespace:
+        snapshots = self._snapshots()
+        return types.SimpleNamespace(rate=sum(snapshot[2] for snapshot in snapshots),
+                                     throttled=sum(snapshot[3] for snapshot in snapshots))
+
+
+def _init_worker(snapshots) -> None:
+    global _snapshots
+    _snapshots = snapshots
+
+
+def _send_snapshot(index: int, client) -> None:
+    _snapshots.put((index, client.stats.snapshot(), client.auth.stats.snapshot(),
+                    client.rate_limiter.rate, client.rate_limiter.throttled))
+
+
+def _send_snapshots(index: int, client, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        _send_snapshot(index, client)
+
+
+def _run_worker(client_class, config: DefaultConfig, cli_order: Order, index: int = 0) -> RequestStats:
+    """Entry point of a worker process, runs one client and returns its stats.
+
+    With metrics the stats are also sent to the parent while the client runs.
+    """
+    log_listener = setup_logging(const.ORDER_LOG_FILE if config.params.log else None, config.params.json_log)
+    client = client_class(config, cli_order)
+    stop = threading.Event()
+    if _snapshots is not None:
+        interval = config.params.metrics_interval or const.WORKER_METRICS_INTERVAL
+        threading.Thread(target=_send_snapshots, args=(index, client, interval, stop), daemon=True).start()
+    try:
+        if config.params.concurrency > 0:
+            asyncio.run(AsyncOrderEngine(client, config.params.concurrency).run())
+        else:
+            client.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        if _snapshots is not None:
+            _send_snapshot(index, client)
+        if log_listener is not None:
+            log_listener.stop()
+    return client.stats
+
+
+def run_workers(client_class, config: DefaultConfig, cli_order: Order, workers: int, sell_ratio: float = None) -> RequestStats:
+    """Run one client per worker process and log the merged throughput and latency report.
+
+    client_class is passed in, so the workers create the same Client class the
+    parent uses without this module importing the CLI script. The metrics
+    options report the merged stats of the workers, which send them to the
+    parent every --metrics-interval (or WORKER_METRICS_INTERVAL) seconds.
+    """
+    configs = worker_configs(config, workers, sell_ratio)
+    logging.info(f'Starting {workers} workers, sides: {[c.params.side.value for c in configs]}, '
+                 f'rate per worker: {configs[0].params.rate or "unlimited"}')
+
+    snapshots = reporter = receiver = None
+    if config.params.metrics_interval or config.params.metrics_file or config.params.metrics_port:
+        snapshots = multiprocessing.Queue()
+        metrics = WorkerMetrics()
+        receiver = threading.Thread(target=metrics.receive, args=(snapshots,), daemon=True)
+        receiver.start()
+        reporter = MetricsReporter(metrics,
+                                   interval=config.params.metrics_interval,
+                                   path=config.params.metrics_file,
+                                   port=config.params.metrics_port).start()
+
+    starttime = time.time()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(snapshots,)) as pool:
+            futures = [pool.submit(_run_worker, client_class, worker_config, cli_order, index)
+                       for index, worker_config in enumerate(configs)]
+            try:
+                results = [future.result() for future in futures]
+            except KeyboardInterrupt:
+                # the workers got the interrupt as well and return their stats
+                results = [future.result() for future in futures]
+    finally:
+        if reporter is not None:
+            # the last snapshots of the workers are in the final metrics
+            snapshots.put(None)
+            receiver.join()
+            reporter.stop()
+
+    total = RequestStats()
+    for index, stats in enumerate(results):
+        logging.info(f'Worker {index} ({configs[index].params.side.value}): {stats.summary()}')
+        total.merge(stats)
+    total.elapsed = time.time() - starttime
+    logging.info(f'All workers: {total.summary()}')
+    return total
@@ -0,0 +1,161 @@
+"""
+Span timers of the hot path stages, for --profile.
+
+The profiler replaces the methods and functions of the stages with timed
+wrappers, and restores them when it is done. Without --profile nothing is
+wrapped, so the clients run unchanged and pay nothing for it:
+
+    profiler = Profiler()
+    profiler.instrument(Stage, "parse", "handle")
+    profiler.instrument(json, "loads")
+    try:
+        run()
+    finally:
+        profiler.restore()
+    print(profiler.report())
+    profiler.write_collapsed("profile.folded")
+
+The stages of the clients are instrumented by start_profiler() of
+rest_client.py and ws_client.py, which share this module.
+
+A span is timed with its stack of enclosing spans on the same thread, so
+the report is a tree of the stages with calls, total and self time, e.g.
+the TLS connect within the http post within send_order. The collapsed
+stacks, one `stage;stage;stage self-microseconds` line per stack, are the
+input of flamegraph.pl and speedscope. Unlike cProfile, which only sees
+the thread it is enabled on, the spans of the sender, refresher and
+consumer threads are all recorded.
+"""
+
+import functools
+import inspect
+import threading
+import time
+
+_perf_counter = time.perf_counter
+
+
+class Profiler:
+    """Calls and seconds of every stack of stage spans, recorded per thread and merged for the report."""
+
+    def __init__(self) -> None:
+        self.started = _perf_counter()
+        self._local = threading.local()
+        self._spans = []  # the spans of every thread, {stack: [calls, seconds]}
+        self._lock = threading.Lock()
+        self._patches = []
+
+    def _thread_state(self) -> tuple[list, dict]:
+        local = self._local
+        try:
+            return local.stack, local.spans
+        except AttributeError:
+            local.stack, local.spans = [], {}
+            with self._lock:
+                self._spans.append(local.spans)
+            return local.stack, local.spans
+
+    def wrap(self, func, stage: str):
+        """func timed as a span of stage."""
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            stack, spans = self._thread_state()
+            stack.append(stage)
+            start = _perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = _perf_counter() - start
+                key = tuple(stack)
+                stack.pop()
+                entry = spans.get(key)
+                if entry is None:
+                    spans[key] = [1, elapsed]
+                else:
+                    entry[0] += 1
+                    entry[1] += elapsed
+        return timed
+
+    def instrument(self, obj, *names: str, label: str = None) -> None:
+        """Time the methods `names` of a class, or the functions of a module, as stages label.name.
+
+        The label defaults to the name of the class or module. Async
+        functions are left alone, a span would only time the creation of
+        the coroutine.
+        """
+        label = label or getattr(obj, "__name__", type(obj).__name__)
+        for name in names:
+            original = inspect.getattr_static(obj, name)
+            # static and class methods are wrapped inside their descriptor
+            descriptor = type(original) if isinstance(original, (staticmethod, classmethod)) else None
+            func = original.__func__ if descriptor is not None else original
+            if inspect.iscoroutinefunction(func):
+                continue
+            timed = self.wrap(func, f"{label}.{name}")
+            # an inherited method is removed again instead of copied to the subclass
+            self._patches.append((obj, name, original if name in vars(obj) else None))
+            setattr(obj, name, descriptor(timed) if descriptor is not None else timed)
+
+    def restore(self) -> None:
+        """Put the original methods and functions back, the spans recorded so far are kept."""
+        while self._patches:
+            obj, name, original = self._patches.pop()
+            if original is None:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, original)
+
+    def stacks(self) -> dict[tuple[str, ...], list]:
+        """[calls, seconds] of every stack, summed over the threads."""
+        merged = {}
+        with self._lock:
+            spans = list(self._spans)
+        for thread_spans in spans:
+            for key, (calls, seconds) in list(thread_spans.items()):
+                entry = merged.setdefault(key, [0, 0.0])
+                entry[0] += calls
+                entry[1] += seconds
+        return merged
+
+    @staticmethod
+    def _self_seconds(stacks: dict) -> dict:
+        """Seconds of every stack not spent in a nested span."""
+        own = {key: seconds for key, (_, seconds) in stacks.items()}
+        for key, (_, seconds) in stacks.items():
+            if len(key) > 1 and key[:-1] in own:
+                own[key[:-1]] -= seconds
+        return own
+
+    def report(self) -> str:
+        """Tree of the stages with calls, total, self and mean time, the slowest first.
+
+        The share is of the wall time since the profiler was created, spans
+        of concurrent threads add up to more than 100%.
+        """
+        wall = _perf_counter() - self.started
+        stacks = self.stacks()
+        own = self._self_seconds(stacks)
+        children = {}
+        for key in stacks:
+            children.setdefault(key[:-1], []).append(key)
+
+        lines = [f"Profile of {wall:.2f}s wall time",
+                 f"{'stage':48s} {'calls':>9s} {'total s':>9s} {'self s':>9s} {'mean ms':>9s} {'share':>7s}"]
+
+        def add(parent: tuple) -> None:
+            for key in sorted(children.get(parent, ()), key=lambda key: stacks[key][1], reverse=True):
+                calls, seconds = stacks[key]
+                name = "  " * (len(key) - 1) + key[-1]
+                lines.append(f"{name:48s} {calls:9d} {seconds:9.3f} {own[key]:9.3f} {seconds / calls * 1000:9.3f} "
+                             f"{seconds / wall if wall else 0:7.1%}")
+                add(key)
+        add(())
+        return "\n".join(lines)
+
+    def write_collapsed(self, path: str) -> int:
+        """Write the collapsed stacks with their self time in microseconds, returns the number of stacks."""
+        own = self._self_seconds(self.stacks())
+        with open(path, "w", encoding="utf-8") as f:
+            for key, seconds in sorted(own.items()):
+                f.write(f"{';'.join(key)} {max(0, round(seconds * 1e6))}\n")
+        return len(own)
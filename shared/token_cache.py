@@ -0,0 +1,123 @@
+"""
+Access tokens shared by the runs and processes of the clients.
+
+Tokens are kept in one JSON file, keyed by user, host and client id, with
+the time they were granted, so a run started shortly after another one
+reuses its token instead of authenticating again:
+
+    cache = TokenCache()
+    key = cache_key(host, client_id, username)
+    with cache.lock():
+        entry = cache.get(key)
+        if not is_fresh(entry):
+            entry = ...  # refresh_token or password grant
+            cache.put(key, entry, granted_at)
+
+While a process holds lock() the others wait, so of several runs started
+at once only the first requests a token and the others read it from the
+file. The lock is an fcntl.flock on a .lock file next to the cache; on
+platforms without fcntl the file is only replaced atomically. The cache is
+created readable by the user only and never contains the password.
+
+Shared by rest_client.py and ws_client.py, which put this directory on
+sys.path, so both clients read and write the same file.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DEFAULT_TOKEN_CACHE = "~/.cache/glocalflex/tokens.json"  # also const.TOKEN_CACHE_FILE of the rest client
+DEFAULT_REUSE_RATIO = 0.75  # share of the token lifetime it is reused for, also const.TOKEN_REFRESH_RATIO of the rest client
+
+
+def cache_key(host: str, client_id: str, username: str) -> str:
+    """Cache key of a user's tokens, host includes the port if it is not 443."""
+    return f"{username}@{host}/{client_id}"
+
+
+def is_fresh(entry: dict | None, ratio: float = DEFAULT_REUSE_RATIO, now: float = None) -> bool:
+    """True if less than `ratio` of the lifetime of the cached access token has passed."""
+    if entry is None:
+        return False
+    now = time.time() if now is None else now
+    return now < entry["granted_at"] + entry["expires_in"] * ratio
+
+
+class TokenCache:
+    """Token file shared by processes, read without lock, written under lock() and replaced atomically."""
+
+    def __init__(self, path: str = DEFAULT_TOKEN_CACHE):
+        self.path = os.path.expanduser(path)
+        # flock excludes other processes, the threads of this process are serialized by the RLock
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def lock(self):
+        """Exclusive access to the cache across processes, reentrant within a thread."""
+        with self._thread_lock:
+            fd = None
+            if fcntl is not None and not self._depth:
+                try:
+                    self._makedirs()
+                    fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except OSError as e:
+                    # e.g. a read-only home directory, the client still works without the cache
+                    logging.warning(f"Token cache {self.path} not locked: {e}")
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if fd is not None:
+                    # closing the file releases the flock
+                    os.close(fd)
+
+    def _makedirs(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                tokens = json.load(f)
+        except (OSError, ValueError):
+            # no cache yet or a damaged file, the next put() replaces it
+            return {}
+        return tokens if isinstance(tokens, dict) else {}
+
+    def get(self, key: str) -> dict | None:
+        """Cached access_token, refresh_token, expires_in and granted_at (time.time() seconds) of key."""
+        entry = self._read().get(key)
+        if not isinstance(entry, dict) or not {"access_token", "expires_in", "granted_at"} <= entry.keys():
+            return None
+        return entry
+
+    def put(self, key: str, token_data: dict, granted_at: float) -> None:
+        """Store the token response of key, granted_at is the time the token was requested."""
+        with self.lock():
+            tokens = self._read()
+            tokens[key] = {
+                "access_token": token_data["access_token"],
+                "refresh_token": token_data.get("refresh_token"),
+                "expires_in": token_data["expires_in"],
+                "granted_at": granted_at,
+            }
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                self._makedirs()
+                fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(tokens, f)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                logging.warning(f"Token cache {self.path} not written: {e}")
@@ -0,0 +1,66 @@
+"""
+Fixtures of the test suite, run from the repository root:
+
+    python3 -m pytest tests
+
+The client modules are imported flat like in the scripts, from their
+folders put on sys.path here. Tests using the `stub` fixture run against
+the local stub marketplace of the benchmarks, which needs openssl for its
+certificate.
+"""
+
+import dataclasses
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for folder in ("rest_client", "ws_client", "shared", "benchmarks"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+import const
+import rest_client
+from rest_client import Client, Order
+from stub_server import StubMarketplace
+
+# settings of the stub restored after every test
+STUB_DEFAULTS = {"latency": 0, "error_rates": {}, "retry_after": 1, "ws_messages": 100, "ws_rate": 0,
+                 "ws_drop_rate": 0, "expires_in": 300, "drop_rate": 0}
+
+
+def pytest_configure(config):
+    # the stub has a self signed certificate, like rest_client.py the tests ignore the warning
+    config.addinivalue_line("filterwarnings", "ignore:Unverified HTTPS request")
+
+
+@pytest.fixture(scope="session")
+def _stub():
+    if shutil.which("openssl") is None:
+        pytest.skip("openssl is needed for the certificate of the stub marketplace")
+    with StubMarketplace() as stub:
+        yield stub
+
+
+@pytest.fixture
+def stub(_stub):
+    """The stub marketplace shared by the tests, with the default settings and counters."""
+    for name, value in STUB_DEFAULTS.items():
+        setattr(_stub, name, value)
+    _stub.requests = dict.fromkeys(_stub.requests, 0)
+    _stub.replayed = 0
+    yield _stub
+    _stub.open_orders.clear()
+
+
+def make_client(host: str, pool_size: int = const.DEFAULT_POOL_SIZE, **params) -> Client:
+    """Client of the stub with a copy of the default config, `params` replace fields of config.params."""
+    config = rest_client.config
+    params = {"rate": 0, "max_rate": 0, "runtime": 0, "dead_letter": None, **params}
+    config = dataclasses.replace(config,
+                                 market=dataclasses.replace(config.market, host=host, ssl_verify=False),
+                                 user=dataclasses.replace(config.user, token_cache=None),
+                                 params=dataclasses.replace(config.params, **params),
+                                 session=dataclasses.replace(config.session, pool_size=pool_size))
+    return Client(config, Order(side="buy"))
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from batch import BatchRun, order_from_record, read_records
+from conftest import make_client
+
+RECORD = {"power": 1000, "price": 0.5, "delivery_start": "2025-01-31T15:00:00.000Z",
+          "delivery_end": "2025-01-31T16:00:00.000Z", "expiry_time": "2025-01-31T14:50:00.000Z", "country_code": "DE"}
+
+
+def test_valid_record():
+    order = order_from_record({**RECORD, "power": "1500", "location_ids": "a,b"}, "buy")
+    assert (order.side, order.power, order.price, order.location_ids) == ("buy", 1500.0, 0.5, ["a", "b"])
+
+
+@pytest.mark.parametrize("fields, error", [
+    ({"power": "nan"}, "finite"),
+    ({"power": "inf"}, "finite"),
+    ({"power": "-inf"}, "finite"),
+    ({"price": "nan"}, "finite"),
+    ({"price": float("inf")}, "finite"),
+    ({"power": 0}, "positive"),
+    ({"power": "a lot"}, "numbers"),
+    ({"side": "hold"}, "side"),
+    ({"country_code": "XX"}, "country code"),
+    ({"expiry_time": ""}, "missing"),
+    ({"quantity": 1}, "unknown"),
+])
+def test_invalid_record(fields, error):
+    with pytest.raises(ValueError, match=error):
+        order_from_record({**RECORD, **fields}, "buy")
+
+
+def test_unparsable_lines_are_passed_on(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    path.write_text('{"power": 1}\n\nnot json\n')
+    assert list(read_records(str(path))) == [(1, {"power": 1}), (3, "not json\n")]
+
+
+def test_batch_writes_a_result_for_every_line(stub, tmp_path):
+    path, results = tmp_path / "orders.jsonl", tmp_path / "results.jsonl"
+    records = [RECORD, {**RECORD, "power": "nan"}, {**RECORD, "price": "inf"}, RECORD]
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    batch = BatchRun(str(path), str(results), "buy")
+    batch.run(make_client(stub.host), concurrency=2)
+    lines = sorted((json.loads(line) for line in results.read_text().splitlines()), key=lambda result: result["line"])
+    assert [(result["line"], result["status_code"]) for result in lines] == [(1, 200), (2, None), (3, None), (4, 200)]
+    assert lines[1]["response"].startswith("invalid: power and price must be finite")
+    assert batch.invalid == 2
@@ -0,0 +1,128 @@
+"""
+Throughput of the clients against the stub marketplace, with pytest-benchmark:
+
+    # compare with the results saved by an earlier run, fail on a mean 20% slower
+    python3 -m pytest tests/test_benchmarks.py --benchmark-autosave
+    python3 -m pytest tests/test_benchmarks.py --benchmark-compare --benchmark-compare-fail=mean:20%
+
+The time of one round is the time of one order or token refresh, of the
+engine sending ENGINE_ORDERS orders or of a websocket connection
+receiving MESSAGES messages; the orders and messages per second of those
+are in the extra info. With --benchmark-disable every benchmark runs
+once, as a plain test.
+"""
+
+import asyncio
+import contextlib
+import io
+
+import pytest
+
+import ws_client
+from conftest import make_client
+from engine import AsyncOrderEngine
+from multiplex import MultiplexClient
+from utils import Side
+
+MESSAGES = 2000
+ENGINE_ORDERS = 200
+
+
+def record_rate(benchmark, name: str, count: int) -> None:
+    """Add the `count` per second of a round to the extra info, not measured with --benchmark-disable."""
+    if benchmark.stats is not None:
+        benchmark.extra_info[name] = count / benchmark.stats.stats.mean
+
+
+def order_body(client) -> bytes:
+    order, _, _ = client.set_random_order_parameters(client.config.buyer, Side.BUY, client.config)
+    return client.encoder.encode(order)
+
+
+@pytest.mark.benchmark(group="orders")
+def test_client_orders(benchmark, stub):
+    client = make_client(stub.host)
+    client.auth.token_new()
+    body = order_body(client)
+    response = benchmark(client.send_order, body)
+    assert response.status_code == 200
+    assert client.stats.status_codes[200] == stub.requests["order"]
+
+
+@pytest.mark.benchmark(group="orders")
+@pytest.mark.parametrize("concurrency", [1, 10])
+def test_engine_orders(benchmark, stub, concurrency):
+    # 2ms round trips, which more orders in flight overlap
+    stub.latency = 0.002
+
+    def run():
+        # a new client every round, its token refresher only starts once
+        client = make_client(stub.host, pool_size=concurrency)
+        order, _, _ = client.set_random_order_parameters(client.config.buyer, Side.BUY, client.config)
+        asyncio.run(AsyncOrderEngine(client, concurrency, orders=[order] * ENGINE_ORDERS).run())
+        return client.stats.status_codes
+
+    assert benchmark.pedantic(run, rounds=3) == {200: ENGINE_ORDERS}
+    record_rate(benchmark, "orders_per_s", ENGINE_ORDERS)
+
+
+@pytest.mark.benchmark(group="orders")
+def test_client_orders_with_expired_tokens(benchmark, stub):
+    """Orders per second when 2% are rejected with 401 and resent with the token renewed by the refresher."""
+    stub.error_rates = {401: 0.02}
+    client = make_client(stub.host, retry_attempts=50)
+    client.retry.policy.base_delay = 0.001
+    assert client.token_refresher.start().wait_ready(5)
+    order, _, _ = client.set_random_order_parameters(client.config.buyer, Side.BUY, client.config)
+    try:
+        response = benchmark(client.submit_order, order)
+    finally:
+        client.token_refresher.stop()
+    assert response.status_code == 200
+    assert client.retry.failed == 0
+
+
+@pytest.mark.benchmark(group="token")
+def test_token_refresh(benchmark, stub):
+    client = make_client(stub.host)
+    client.auth.token_new()
+    assert benchmark(client.auth.token_refresh)
+    assert client.auth.token().startswith("stub-")
+    assert stub.requests["token"] > 1
+
+
+def receive(stub, fast: bool) -> "ws_client.WebSocketClient":
+    url = f"wss://{stub.host}/api/v1/ws/ticker/"
+    # the messages printed in the normal mode are part of what is measured
+    with contextlib.redirect_stdout(io.StringIO()):
+        client = ws_client.WebSocketClient(url, token="stub-token", fast=fast)
+        client.receive_thread.join()
+        if fast:
+            client.consumer.stop()
+    return client
+
+
+@pytest.mark.benchmark(group="websocket")
+@pytest.mark.parametrize("fast", [False, True], ids=["print", "fast"])
+def test_websocket_messages(benchmark, stub, fast):
+    stub.ws_messages = MESSAGES
+    client = benchmark.pedantic(receive, args=(stub, fast), rounds=3)
+    record_rate(benchmark, "messages_per_s", MESSAGES)
+    assert [message["seq"] for message in client.received_messages] == list(range(MESSAGES))
+
+
+@pytest.mark.benchmark(group="websocket")
+def test_multiplex_messages(benchmark, stub):
+    stub.ws_messages = MESSAGES // 3
+    address, port = stub.host.split(":")
+
+    def run():
+        multiplex = MultiplexClient(address, int(port), token="stub-token")
+        for endpoint in stub.ws_endpoints:
+            multiplex.subscribe(endpoint)
+        with contextlib.redirect_stdout(io.StringIO()):
+            errors = asyncio.run(multiplex.run())
+        return errors, len(multiplex.received_messages)
+
+    assert benchmark.pedantic(run, rounds=3) == ({}, MESSAGES // 3 * 3)
+    record_rate(benchmark, "messages_per_s", MESSAGES // 3 * 3)
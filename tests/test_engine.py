@@ -0,0 +1,56 @@
+import asyncio
+import dataclasses
+import json
+
+import pytest
+
+from conftest import make_client
+from encoding import OrderEncoder
+from engine import AsyncOrderEngine
+from utils import Side
+
+
+def run_engine(client, orders: list, concurrency: int) -> list[tuple]:
+    """Send the orders with the engine, returns the (order, code, text) results."""
+    results = []
+    engine = AsyncOrderEngine(client, concurrency, orders=orders, on_result=lambda *result: results.append(result))
+    asyncio.run(asyncio.wait_for(engine.run(), 20))
+    return results
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+@pytest.mark.parametrize("power", [float("nan"), float("inf")])
+def test_order_that_does_not_encode_fails_without_blocking_a_slot(stub, tmp_path, concurrency, power):
+    client = make_client(stub.host, dead_letter=str(tmp_path / "dead_letter.jsonl"))
+    # the order templates reject non-finite numbers, orjson would send them as null
+    client.encoder = OrderEncoder(use_templates=True)
+    good, _, _ = client.set_random_order_parameters(client.config.buyer, Side.BUY, client.config)
+    bad = dataclasses.replace(good, power=power)
+
+    results = run_engine(client, [bad, good, good], concurrency)
+    assert sorted(code is None for _, code, _ in results) == [False, False, True]
+    (order, _, text), = [result for result in results if result[1] is None]
+    assert order is bad and "Out of range float" in text
+    assert stub.requests["order"] == 2
+    with open(tmp_path / "dead_letter.jsonl", encoding="utf-8") as f:
+        record, = [json.loads(line) for line in f]
+    assert record["attempts"] == 0 and record["error"].endswith("not sent")
+
+
+@pytest.mark.parametrize("concurrency", [1, 2])
+def test_order_failed_with_an_unexpected_error_is_reported(stub, concurrency):
+    client = make_client(stub.host)
+    order, _, _ = client.set_random_order_parameters(client.config.buyer, Side.BUY, client.config)
+    order, bad = dataclasses.replace(order, power=1000.0), dataclasses.replace(order, power=1100.0)
+    post_order = client.post_order
+
+    def failing_post_order(body, idempotency_key=None):
+        if b'"power":1100.0' in body:
+            raise RuntimeError("unexpected")
+        return post_order(body, idempotency_key)
+
+    client.post_order = failing_post_order
+    results = run_engine(client, [order, bad, order, order], concurrency)
+    assert len(results) == 4
+    (failed, _, text), = [result for result in results if result[1] is None]
+    assert failed is bad and "unexpected" in text
@@ -0,0 +1,127 @@
+import os
+import threading
+
+import pytest
+
+from message_store import (COMPRESSED_SUFFIX, MessageStore, Ring, SegmentWriter, read_segments, segment_number,
+                           segment_paths, segment_records)
+
+
+def test_ring_evicts_the_oldest_item():
+    ring = Ring(3)
+    assert [ring.append(item) for item in range(5)] == [None, None, None, 0, 1]
+    assert list(ring) == [2, 3, 4]
+    assert (ring[0], ring[-1]) == (2, 4)
+    assert ring.since(1) == [3, 4]
+    with pytest.raises(IndexError):
+        ring[3]
+    assert ring.popleft() == 2
+    assert len(ring) == 2
+
+
+@pytest.mark.parametrize("appended", [5, 6, 7])
+def test_ring_slice_wraps_around_the_storage(appended):
+    ring = Ring(5)
+    for item in range(appended):
+        ring.append(item)
+    items = list(ring)
+    for first in range(-1, 7):
+        for last in range(-1, 7):
+            assert ring.slice(first, last) == items[max(first, 0):max(last, 0)]
+
+
+def test_store_keeps_the_latest_messages_by_type():
+    store = MessageStore(capacity=4)
+    for seq in range(6):
+        store.append({"type": "update" if seq % 3 else "snapshot", "seq": seq}, timestamp=seq)
+    assert [message["seq"] for message in store] == [2, 3, 4, 5]
+    assert [message["seq"] for message in store.recent(2)] == [4, 5]
+    assert [message["seq"] for message in store.recent(10, "update")] == [2, 4, 5]
+    assert [message["seq"] for message in store.between(3, 4)] == [3, 4]
+    assert [message["seq"] for message in store.between(3, msg_type="update")] == [4, 5]
+    assert store.types() == {"update": 3, "snapshot": 1}
+
+
+def test_type_index_is_dropped_with_its_last_message():
+    store = MessageStore(capacity=10)
+    for seq in range(100):
+        store.append({"type": f"type-{seq}"}, timestamp=seq)
+    assert len(store.types()) == 10
+    assert store.recent(msg_type="type-0") == []
+
+
+def test_unhashable_type_is_stored_without_type():
+    store = MessageStore(capacity=10)
+    store.append({"type": ["not", "a", "key"]})
+    store.append({"type": {"nested": 1}})
+    assert len(store) == 2
+    assert store.types() == {None: 2}
+
+
+def test_messages_older_than_max_age_are_evicted():
+    store = MessageStore(capacity=100, max_age=10)
+    for timestamp in (0, 5, 12, 20):
+        store.append({"type": "tick", "t": timestamp}, timestamp=timestamp)
+    assert [message["t"] for message in store] == [12, 20]
+    assert store.types() == {"tick": 2}
+
+
+def test_evicted_messages_are_spilled_in_order(tmp_path):
+    store = MessageStore(capacity=5, spill_dir=str(tmp_path), segment_size=200)
+    for seq in range(50):
+        store.append({"type": "tick", "seq": seq}, timestamp=seq)
+    store.close()
+    spilled = list(read_segments(str(tmp_path)))
+    assert [timestamp for timestamp, _ in spilled] == list(range(45))
+    assert spilled[0][1] == {"type": "tick", "message": {"type": "tick", "seq": 0}}
+    assert len(segment_paths(str(tmp_path))) > 1
+
+
+def test_concurrent_appends_spill_every_evicted_message(tmp_path):
+    store = MessageStore(capacity=10, spill_dir=str(tmp_path))
+
+    def append(thread):
+        for seq in range(500):
+            store.append({"thread": thread, "seq": seq})
+
+    threads = [threading.Thread(target=append, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+    assert len(list(read_segments(str(tmp_path)))) == 4 * 500 - 10
+
+
+def test_new_segments_are_numbered_after_the_highest_existing_one(tmp_path):
+    for _ in range(3):
+        SegmentWriter(str(tmp_path)).close()
+    os.remove(segment_paths(str(tmp_path))[0])
+    writer = SegmentWriter(str(tmp_path))
+    writer.close()
+    assert [segment_number(path) for path in segment_paths(str(tmp_path))] == [2, 3, 4]
+    assert segment_number("messages.seg") == 0
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_flushed_records_are_readable_before_close(tmp_path, compress):
+    writer = SegmentWriter(str(tmp_path), compress=compress, flush_interval=3600)
+    for seq in range(10):
+        writer.write(seq, b'{"seq":%d}' % seq)
+    writer.flush()
+    path, = segment_paths(str(tmp_path))
+    assert path.endswith(COMPRESSED_SUFFIX) == compress
+    # the writer is still open, like after a crash
+    assert [timestamp for timestamp, _ in segment_records(path)] == list(range(10))
+    writer.close()
+
+
+def test_truncated_segment_ends_at_the_last_complete_record(tmp_path):
+    writer = SegmentWriter(str(tmp_path))
+    for seq in range(3):
+        writer.write(seq, b"x" * 10)
+    writer.close()
+    path, = segment_paths(str(tmp_path))
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 5)
+    assert [timestamp for timestamp, _ in segment_records(path)] == [0, 1]
@@ -0,0 +1,67 @@
+import pickle
+import random
+
+import pytest
+
+from metrics import Histogram, RequestStats, SUB_BUCKET_BITS
+
+
+def test_small_values_have_exact_buckets():
+    for value in range(1 << SUB_BUCKET_BITS):
+        assert Histogram._value(Histogram._index(value)) == value
+
+
+@pytest.mark.parametrize("value", [128, 129, 255, 256, 1000, 4095, 123456, 10 ** 7, 2 ** 40 + 17])
+def test_bucket_bounds_the_value_within_the_relative_error(value):
+    index = Histogram._index(value)
+    highest = Histogram._value(index)
+    assert highest >= value
+    assert (highest - value) / value < 1 / 64
+    # the bucket below ends below the value
+    assert Histogram._value(index - 1) < value
+
+
+def test_bucket_indexes_are_monotonic():
+    values = sorted(random.Random(1).sample(range(10 ** 8), 2000))
+    indexes = [Histogram._index(value) for value in values]
+    assert indexes == sorted(indexes)
+
+
+def test_percentiles_of_recorded_latencies():
+    histogram = Histogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    assert histogram.count == 100
+    assert histogram.percentile(50) == pytest.approx(0.050, rel=1 / 64)
+    assert histogram.percentile(99) == pytest.approx(0.099, rel=1 / 64)
+    assert histogram.percentile(100) == histogram.max / 1e6 == 0.1
+    assert histogram.mean() == pytest.approx(0.0505)
+    assert Histogram().percentile(50) == 0
+
+
+def test_merge_equals_recording_into_one_histogram():
+    merged, single = Histogram(), Histogram()
+    rng = random.Random(2)
+    for _ in range(4):
+        part = Histogram()
+        for _ in range(250):
+            seconds = rng.expovariate(100)
+            part.record(seconds)
+            single.record(seconds)
+        merged.merge(pickle.loads(pickle.dumps(part)))
+    assert merged.counts == single.counts
+    assert (merged.count, merged.total, merged.max) == (single.count, single.total, single.max)
+
+
+def test_request_stats_snapshot_and_merge():
+    stats = RequestStats()
+    stats.record(200, 0.01)
+    stats.record(429, 0.02)
+    stats.record_error()
+    snapshot = stats.snapshot()
+    stats.record(200, 0.01)
+    total = RequestStats()
+    total.merge(snapshot)
+    total.merge(snapshot)
+    assert total.sent == 2 * snapshot.sent
+    assert snapshot.sent == 3
@@ -0,0 +1,123 @@
+import asyncio
+import contextlib
+import time
+
+import pytest
+from websocket import ABNF
+
+from multiplex import MultiplexClient, HandshakeError, read_frame
+from order_book import OrderBook
+from stub_server import ws_frame
+
+
+def read_frames(data: bytes, count: int = 1) -> list[tuple[bool, int, bytes]]:
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return [await read_frame(reader) for _ in range(count)]
+    return asyncio.run(read())
+
+
+@pytest.mark.parametrize("length", [0, 125, 126, 65535, 65536, 200000])
+def test_read_frame_payload_lengths(length):
+    payload = bytes(range(256)) * (length // 256) + bytes(length % 256)
+    assert read_frames(ws_frame(payload)) == [(True, ABNF.OPCODE_TEXT, payload)]
+
+
+@pytest.mark.parametrize("length", [5, 300, 70000])
+def test_read_frame_unmasks_client_frames(length):
+    payload = b"x" * length
+    frame = ABNF.create_frame(payload, ABNF.OPCODE_BINARY).format()
+    assert frame[1] & 0x80
+    assert read_frames(frame) == [(True, ABNF.OPCODE_BINARY, payload)]
+
+
+def test_read_frame_fragments_and_control_frames():
+    data = (bytes([0x01, 3]) + b"abc"           # first fragment, fin not set
+            + ws_frame(b"ping", ABNF.OPCODE_PING)
+            + bytes([0x80, 3]) + b"def"          # continuation with fin
+            + ws_frame(b"\x03\xe8", ABNF.OPCODE_CLOSE))
+    assert read_frames(data, 4) == [(False, ABNF.OPCODE_TEXT, b"abc"), (True, ABNF.OPCODE_PING, b"ping"),
+                                    (True, ABNF.OPCODE_CONT, b"def"), (True, ABNF.OPCODE_CLOSE, b"\x03\xe8")]
+
+
+def test_read_frame_of_a_truncated_stream():
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_frames(ws_frame(b"payload")[:-1])
+
+
+def client(stub, **kwargs) -> MultiplexClient:
+    address, port = stub.host.split(":")
+    return MultiplexClient(address, int(port), token="stub-token", **kwargs)
+
+
+async def run_until(multiplex: MultiplexClient, done, timeout: float = 10) -> None:
+    """Run a client with renew_token until done() is true, then cancel it like Ctrl + c does."""
+    task = asyncio.create_task(multiplex.run())
+    deadline = time.monotonic() + timeout
+    while not done() and time.monotonic() < deadline and not task.done():
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+def test_all_messages_of_every_endpoint(stub):
+    stub.ws_messages = 500
+    received = {}
+    book = OrderBook()
+
+    def record(channel, message):
+        received.setdefault(channel, []).append(message["seq"])
+
+    multiplex = client(stub)
+    multiplex.subscribe("/api/v1/ws/trade/", record)
+    multiplex.subscribe("/api/v1/ws/ticker/", record)
+    multiplex.subscribe("/api/v1/ws/orderbook/", book.on_message)
+    assert asyncio.run(multiplex.run()) == {}
+    assert received == {"trade": list(range(500)), "ticker": list(range(500))}
+    assert book.seq == 499
+    assert len(multiplex.received_messages) == 1500
+    assert stub.requests["ws"] == 3
+
+
+def test_fast_mode_parses_on_the_consumer_thread(stub):
+    stub.ws_messages = 1000
+    multiplex = client(stub, fast=True)
+    multiplex.subscribe("/api/v1/ws/ticker/")
+    assert asyncio.run(multiplex.run()) == {}
+    assert [message["seq"] for message in multiplex.received_messages] == list(range(1000))
+
+
+def test_rejected_handshake_is_returned_as_error(stub):
+    multiplex = client(stub)
+    multiplex.subscribe("/api/v1/ws/unknown/")
+    errors = asyncio.run(multiplex.run())
+    assert isinstance(errors["unknown"], HandshakeError)
+
+
+def test_gap_in_the_orderbook_reconnects_for_a_new_snapshot(stub):
+    stub.ws_messages, stub.ws_drop_rate = 200, 0.05
+    renewed = []
+    # type of the first message handled per connection
+    first = {}
+
+    def on_message(channel, message):
+        first.setdefault(subscription.connects, message["type"])
+
+    multiplex = client(stub, renew_token=lambda: renewed.append(1) or "stub-token", max_backoff=0.01)
+    subscription = multiplex.subscribe("/api/v1/ws/orderbook/", on_message)
+    asyncio.run(run_until(multiplex, lambda: subscription.resyncs >= 2 and subscription.connects >= 3))
+    assert subscription.resyncs >= 2
+    assert len(renewed) >= 2
+    assert len(first) >= 3 and set(first.values()) == {"snapshot"}
+
+
+def test_lost_connection_reconnects_with_backoff(stub):
+    stub.ws_messages = 10
+    multiplex = client(stub, renew_token=lambda: "stub-token", max_backoff=0.01)
+    subscription = multiplex.subscribe("/api/v1/ws/ticker/")
+    asyncio.run(run_until(multiplex, lambda: subscription.connects >= 3))
+    assert subscription.connects >= 3
+    assert [message["seq"] for message in multiplex.received_messages][:20] == list(range(10)) * 2
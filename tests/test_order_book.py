@@ -0,0 +1,70 @@
+from order_book import BookSide, OrderBook
+
+SNAPSHOT = {"seq": 0, "timestamp": 1.0, "type": "snapshot",
+            "bids": [[0.79, 100], [0.78, 200], [0.77, 300]],
+            "asks": [[0.80, 400], [0.81, 500], [0.82, 600]]}
+
+
+def book() -> OrderBook:
+    order_book = OrderBook()
+    order_book.apply(SNAPSHOT)
+    return order_book
+
+
+def test_snapshot_sets_both_sides():
+    order_book = book()
+    assert order_book.best_bid() == (0.79, 100)
+    assert order_book.best_ask() == (0.80, 400)
+    assert order_book.spread() == 0.80 - 0.79
+    assert order_book.mid_price() == (0.80 + 0.79) / 2
+    assert order_book.seq == 0
+
+
+def test_update_replaces_and_removes_levels():
+    order_book = book()
+    order_book.apply({"seq": 1, "type": "update", "bids": [[0.78, 250], [0.79, 0]], "asks": [[0.795, 50]]})
+    assert order_book.best_bid() == (0.78, 250)
+    assert order_book.best_ask() == (0.795, 50)
+    assert 0.79 not in order_book.bids
+    assert order_book.bids.quantity(0.77) == 300
+    assert order_book.seq == 1
+    assert order_book.updates == 2
+
+
+def test_removing_a_level_inside_the_book():
+    order_book = book()
+    order_book.apply({"type": "update", "asks": [[0.81, 0], [0.90, 0]]})
+    assert order_book.depth(5)["asks"] == [(0.80, 400), (0.82, 600)]
+
+
+def test_depth_is_best_first():
+    depth = book().depth(2)
+    assert depth == {"bids": [(0.79, 100), (0.78, 200)], "asks": [(0.80, 400), (0.81, 500)]}
+    assert len(book().depth(0)["bids"]) == 3
+
+
+def test_new_snapshot_replaces_the_book():
+    order_book = book()
+    order_book.apply({"seq": 5, "type": "snapshot", "bids": [[0.5, 1]], "asks": []})
+    assert order_book.depth() == {"bids": [(0.5, 1)], "asks": []}
+    assert order_book.spread() is None
+
+
+def test_messages_of_other_channels_are_ignored():
+    order_book = OrderBook()
+    order_book.on_message("ticker", SNAPSHOT)
+    assert order_book.best_bid() is None
+    order_book.on_message("orderbook", SNAPSHOT)
+    assert order_book.best_bid() == (0.79, 100)
+
+
+def test_book_side_keeps_many_levels_sorted():
+    side = BookSide(descending=False)
+    prices = [round(0.01 * cents, 2) for cents in range(200, 0, -7)]
+    for price in prices:
+        side.set(price, 1)
+    for price in prices[::2]:
+        side.set(price, 0)
+    remaining = sorted(prices[1::2])
+    assert [price for price, _ in side.depth(0)] == remaining
+    assert len(side) == len(remaining)
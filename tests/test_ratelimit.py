@@ -0,0 +1,68 @@
+import email.utils
+import time
+
+import pytest
+
+from ratelimit import RateLimiter, parse_retry_after
+
+
+@pytest.mark.parametrize("value, expected", [(None, 0), ("", 0), ("2", 2), ("1.5", 1.5), ("-3", 0), ("soon", 0)])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    value = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= parse_retry_after(value) <= 30
+    assert parse_retry_after(email.utils.formatdate(time.time() - 30, usegmt=True)) == 0
+
+
+def aged(limiter: RateLimiter) -> RateLimiter:
+    """The limiter as if its rate was set a while ago, a 429 right after a change is part of the same burst."""
+    limiter._last_change -= 60
+    return limiter
+
+
+def test_unlimited_rate_never_waits():
+    limiter = RateLimiter()
+    assert all(limiter.reserve() == 0 for _ in range(1000))
+    assert limiter.rate == 0
+
+
+def test_reserve_spaces_the_orders_at_the_rate():
+    limiter = RateLimiter(rate=10)
+    # the burst of one token is sent at once, every further order gets its own slot 0.1s later
+    waits = [limiter.reserve() for _ in range(4)]
+    assert waits[0] == 0
+    assert waits[1:] == pytest.approx([0.1, 0.2, 0.3], abs=0.01)
+
+
+def test_429_lowers_the_rate_once_per_burst_and_blocks():
+    limiter = aged(RateLimiter(rate=10, max_rate=20))
+    limiter.update(429, "2")
+    limiter.update(429, "2")
+    assert limiter.rate == 5
+    assert limiter.throttled == 2
+    assert limiter.reserve() == pytest.approx(2, abs=0.05)
+
+
+def test_rate_does_not_drop_below_min_rate():
+    limiter = aged(RateLimiter(rate=0.15, min_rate=0.1))
+    limiter.update(429)
+    assert limiter.rate == 0.1
+
+
+def test_unlimited_rate_starts_from_the_observed_rate():
+    limiter = RateLimiter()
+    for _ in range(100):
+        limiter.reserve()
+    limiter.update(429)
+    assert 0 < limiter.rate < float("inf")
+
+
+def test_rate_increases_after_the_interval_without_429():
+    limiter = RateLimiter(rate=2, max_rate=3, increase=1, increase_interval=0)
+    limiter.update(200)
+    assert limiter.rate == 3
+    limiter.update(200)
+    assert limiter.rate == 3
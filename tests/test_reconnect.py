@@ -0,0 +1,60 @@
+import pytest
+
+from reconnect import Backoff, GapDetector
+
+
+def test_gap_in_the_sequence_numbers():
+    detector = GapDetector()
+    assert [detector.check("trade", {"seq": seq}) for seq in (0, 1, 2, 4, 5)] == [False, False, False, True, False]
+    assert detector.gaps == 1
+
+
+def test_sequences_are_per_channel():
+    detector = GapDetector()
+    assert not detector.check("trade", {"seq": 7})
+    assert not detector.check("ticker", {"seq": 0})
+    assert not detector.check("trade", {"seq": 8})
+
+
+def test_reset_starts_a_new_sequence():
+    detector = GapDetector()
+    detector.check("orderbook", {"seq": 10})
+    detector.reset()
+    assert not detector.check("orderbook", {"seq": 0})
+
+
+def test_gap_in_the_timestamps_without_seq():
+    detector = GapDetector(max_silence=5)
+    assert not detector.check("ticker", {"timestamp": 100})
+    assert not detector.check("ticker", {"timestamp": 104})
+    assert detector.check("ticker", {"timestamp": 110})
+
+
+def test_messages_without_seq_and_timestamp_are_no_gap():
+    detector = GapDetector()
+    assert not detector.check("ticker", {"price": 1})
+    assert not detector.check("ticker", ["not", "a", "dict"])
+    assert detector.gaps == 0
+
+
+def test_backoff_is_bounded_and_grows():
+    backoff = Backoff(initial=0.1, maximum=1, multiplier=2)
+    bounds = [0.1, 0.2, 0.4, 0.8, 1, 1, 1]
+    for bound in bounds:
+        assert 0 <= backoff.next_delay() <= bound
+    assert backoff.attempts == len(bounds)
+
+
+def test_backoff_reset():
+    backoff = Backoff(initial=0.1, maximum=30)
+    for _ in range(10):
+        backoff.next_delay()
+    backoff.reset()
+    assert backoff.next_delay() <= 0.1
+
+
+def test_backoff_is_jittered():
+    backoff = Backoff(initial=10, maximum=10)
+    delays = {backoff.next_delay() for _ in range(20)}
+    assert len(delays) == 20
+    assert sum(delays) / len(delays) == pytest.approx(5, abs=3)
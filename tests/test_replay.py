@@ -0,0 +1,35 @@
+import pytest
+
+from message_store import SegmentWriter
+from replay import FeedReplayer
+
+
+def record(directory, count: int) -> None:
+    writer = SegmentWriter(str(directory), prefix="ticker")
+    for seq in range(count):
+        writer.write(float(seq), f'{{"seq": {seq}}}'.encode())
+    writer.close()
+
+
+def test_every_frame_is_replayed_in_order(tmp_path):
+    record(tmp_path, 5)
+    frames = []
+    replayer = FeedReplayer(str(tmp_path), "ticker")
+    assert replayer.run(lambda ws, frame: frames.append(frame)) == 5
+    assert frames == [f'{{"seq": {seq}}}' for seq in range(5)]
+    assert replayer.replayed == 5
+
+
+def test_interrupted_replay_counts_the_frames_replayed(tmp_path):
+    record(tmp_path, 5)
+    frames = []
+
+    def on_message(ws, frame):
+        if len(frames) == 3:
+            raise KeyboardInterrupt
+        frames.append(frame)
+
+    replayer = FeedReplayer(str(tmp_path), "ticker")
+    with pytest.raises(KeyboardInterrupt):
+        replayer.run(on_message)
+    assert replayer.replayed == 3
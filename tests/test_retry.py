@@ -0,0 +1,143 @@
+import datetime as dt
+import json
+
+import pytest
+import requests
+import urllib3
+
+from conftest import make_client
+from retry import DeadLetterFile, OrderRetry, RetryPolicy, order_deadline, sent_without_response
+from utils import Order
+
+READ_TIMEOUT = requests.exceptions.ReadTimeout("read timed out")
+CONNECT_TIMEOUT = requests.exceptions.ConnectTimeout("connect timed out")
+DISCONNECTED = requests.exceptions.ConnectionError(urllib3.exceptions.ProtocolError("Connection aborted."))
+
+
+def order(**fields) -> Order:
+    return Order(side="buy", power=1000, price=0.5, **fields)
+
+
+def retry(tmp_path=None, **policy) -> OrderRetry:
+    dead_letter = DeadLetterFile(str(tmp_path / "dead_letter.jsonl")) if tmp_path is not None else None
+    return OrderRetry(RetryPolicy(**{"base_delay": 0.01, **policy}), dead_letter)
+
+
+def dead_letters(tmp_path) -> list[dict]:
+    with open(tmp_path / "dead_letter.jsonl", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_failures_after_the_request_was_sent():
+    assert sent_without_response(READ_TIMEOUT)
+    assert sent_without_response(DISCONNECTED)
+    assert not sent_without_response(CONNECT_TIMEOUT)
+    assert not sent_without_response(requests.exceptions.ConnectionError("refused"))
+
+
+@pytest.mark.parametrize("code", [200, 201])
+def test_accepted_order_is_done(code):
+    order_retry = retry()
+    assert order_retry.next_delay(order_retry.submission(order()), code) is None
+    assert (order_retry.retries, order_retry.failed) == (0, 0)
+
+
+@pytest.mark.parametrize("code", [401, 408, 429, 503])
+def test_retry_status_codes_are_resent_with_backoff(code):
+    order_retry = retry(base_delay=0.5, max_delay=1)
+    submission = order_retry.submission(order())
+    delays = [order_retry.next_delay(submission, code) for _ in range(3)]
+    assert all(0 <= delay <= bound for delay, bound in zip(delays, (0.5, 1, 1)))
+    assert order_retry.retries == 3
+
+
+def test_connection_errors_before_the_request_are_resent():
+    order_retry = retry()
+    submission = order_retry.submission(order())
+    assert order_retry.next_delay(submission, None, CONNECT_TIMEOUT) is not None
+
+
+def test_rejected_order_is_not_resent(tmp_path):
+    order_retry = retry(tmp_path)
+    submission = order_retry.submission(order())
+    assert order_retry.next_delay(submission, 422) is None
+    record, = dead_letters(tmp_path)
+    assert record["error"] == "rejected"
+    assert record["status_code"] == 422
+    assert record["idempotency_key"] == submission.key
+    assert record["order"]["power"] == 1000
+
+
+@pytest.mark.parametrize("code, error", [(500, None), (502, None), (504, None), (None, READ_TIMEOUT), (None, DISCONNECTED)])
+def test_ambiguous_failures_are_only_resent_when_enabled(tmp_path, code, error):
+    order_retry = retry(tmp_path)
+    assert order_retry.next_delay(order_retry.submission(order()), code, error) is None
+    record, = dead_letters(tmp_path)
+    assert record["error"].endswith("not resent, the order may have been created")
+
+    order_retry = retry(retry_ambiguous=True)
+    assert order_retry.next_delay(order_retry.submission(order()), code, error) is not None
+
+
+def test_order_fails_when_out_of_attempts(tmp_path):
+    order_retry = retry(tmp_path, max_attempts=3)
+    submission = order_retry.submission(order())
+    delays = [order_retry.next_delay(submission, 503) for _ in range(3)]
+    assert delays[:2] != [None, None] and delays[2] is None
+    assert (submission.attempts, order_retry.retries, order_retry.failed) == (3, 2, 1)
+    record, = dead_letters(tmp_path)
+    assert record["attempts"] == 3
+    assert record["error"] == "status code 503, out of attempts"
+
+
+def test_order_is_not_resent_after_its_deadline(tmp_path):
+    expiry = dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=6)
+    order_retry = retry(tmp_path, base_delay=10, max_delay=10, expiry_margin=5)
+    failed = 0
+    for _ in range(20):
+        if order_retry.next_delay(order_retry.submission(order(expiry_time=expiry.isoformat())), 429) is None:
+            failed += 1
+    # the backoff is uniform up to 10s, with 1s left most of the orders expire before their next attempt
+    assert failed > 10
+    assert all(record["error"].endswith("expires before the next attempt") for record in dead_letters(tmp_path))
+
+
+def test_order_deadline():
+    assert order_deadline(order(expiry_time="2030-01-01T00:00:00"), margin=5) == \
+        dt.datetime(2030, 1, 1, tzinfo=dt.timezone.utc).timestamp() - 5
+    assert order_deadline(order(expiry_time="not a time")) == float("inf")
+    assert order_deadline(order()) == float("inf")
+
+
+def test_client_resends_unavailable_orders_until_accepted(stub, tmp_path):
+    # 503, a 429 would also lower the rate of the rate limiter
+    stub.error_rates = {503: 0.5}
+    client = make_client(stub.host, retry_attempts=20, dead_letter=str(tmp_path / "dead_letter.jsonl"))
+    client.retry.policy.base_delay = 0.001
+    client.auth.token_new()
+    codes = [client.submit_order(order()).status_code for _ in range(20)]
+    assert codes == [200] * 20
+    assert stub.requests["order"] == 20 + client.retry.retries
+    assert client.retry.failed == 0
+
+
+def test_client_dead_letters_rejected_orders(stub, tmp_path):
+    stub.error_rates = {422: 1}
+    client = make_client(stub.host, dead_letter=str(tmp_path / "dead_letter.jsonl"))
+    client.auth.token_new()
+    assert client.submit_order(order()).status_code == 422
+    client.retry.dead_letter.close()
+    assert stub.requests["order"] == 1
+    assert [record["error"] for record in dead_letters(tmp_path)] == ["rejected"]
+
+
+def test_lost_responses_are_resent_with_the_same_idempotency_key(stub):
+    stub.drop_rate = 0.5
+    client = make_client(stub.host, retry_attempts=20, retry_ambiguous=True)
+    client.retry.policy.base_delay = 0.001
+    client.auth.token_new()
+    responses = [client.submit_order(order()) for _ in range(20)]
+    ids = [response.json()["id"] for response in responses]
+    # every order was created once, the resent ones got the id of the first attempt
+    assert len(set(ids)) == 20
+    assert stub.replayed == client.retry.retries > 0
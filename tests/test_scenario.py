@@ -0,0 +1,68 @@
+import dataclasses
+import datetime as dt
+import json
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import rest_client
+from scenario import ScenarioGenerator, round_quarter
+from utils import Order, Side
+
+START = dt.datetime(2025, 1, 31, 14, 7, tzinfo=dt.timezone.utc)
+
+
+def generator(side: Side = Side.BUY, **kwargs) -> ScenarioGenerator:
+    settings = rest_client.config.buyer if side == Side.BUY else rest_client.config.seller
+    return ScenarioGenerator(settings, side, START, seed=kwargs.pop("seed", 1), **kwargs)
+
+
+def test_round_quarter():
+    assert round_quarter(START) == START.replace(minute=15)
+    assert round_quarter(START.replace(minute=30, second=5)) == START.replace(minute=30)
+
+
+def test_orders_are_in_the_ranges_of_the_settings():
+    settings = rest_client.config.buyer
+    orders = list(generator(slots=4).orders(2000))
+    assert len(orders) == 2000
+    assert all(settings.power_min <= order.power < settings.power_max and order.power % 100 == 0 for order in orders)
+    assert all(settings.unit_price_min <= order.price <= settings.unit_price_max for order in orders)
+    assert {order.delivery_start for order in orders} == {
+        "2025-01-31T15:15:00.000Z", "2025-01-31T15:30:00.000Z", "2025-01-31T15:45:00.000Z", "2025-01-31T16:00:00.000Z"}
+    assert all(order.side == "buy" and order.baseline is None for order in orders)
+
+
+def test_slot_times():
+    order = next(generator(slots=1).orders(1))
+    assert (order.delivery_start, order.delivery_end, order.expiry_time) == \
+        ("2025-01-31T15:15:00.000Z", "2025-01-31T16:15:00.000Z", "2025-01-31T14:25:00.000Z")
+
+
+def test_same_seed_same_scenario():
+    assert list(generator(seed=7).orders(100)) == list(generator(seed=7).orders(100))
+    assert list(generator(seed=7).orders(100)) != list(generator(seed=8).orders(100))
+
+
+def test_batches_do_not_change_the_number_of_orders():
+    assert len(list(generator(batch_size=7).orders(100))) == 100
+    assert sum(chunk.count("\n") for chunk in generator(batch_size=7).records(100)) == 100
+
+
+def test_records_are_the_orders_as_json(tmp_path):
+    path = tmp_path / "orders.jsonl"
+    assert generator(Side.SELL, seed=3).write(str(path), 500) == 500
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    orders = list(generator(Side.SELL, seed=3).orders(500))
+    assert len(records) == 500
+    assert records == [dataclasses.asdict(order) for order in orders]
+    assert records[0]["baseline"] == rest_client.config.seller.baseline
+
+
+def test_overrides_are_the_same_for_all_orders():
+    overrides = Order(side="buy", power=1500, country_code="FI", expiry_time="2025-01-31T15:00:00.000Z")
+    orders = list(generator(overrides=overrides).orders(50))
+    assert {(order.power, order.country_code, order.expiry_time) for order in orders} == \
+        {(1500.0, "FI", "2025-01-31T15:00:00.000Z")}
+    assert len({order.price for order in orders}) > 1
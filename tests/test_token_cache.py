@@ -0,0 +1,112 @@
+import json
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from token_cache import TokenCache, cache_key, fcntl, is_fresh
+
+TOKEN = {"access_token": "access", "refresh_token": "refresh", "expires_in": 300}
+
+
+@pytest.fixture
+def cache(tmp_path) -> TokenCache:
+    return TokenCache(str(tmp_path / "cache" / "tokens.json"))
+
+
+def test_put_and_get(cache):
+    key = cache_key("127.0.0.1:8443", "client", "user")
+    assert cache.get(key) is None
+    cache.put(key, {**TOKEN, "token_type": "bearer"}, granted_at=100.0)
+    assert cache.get(key) == {**TOKEN, "granted_at": 100.0}
+    assert cache.get(cache_key("127.0.0.1:8443", "client", "other")) is None
+    assert stat.S_IMODE(os.stat(cache.path).st_mode) == 0o600
+
+
+def test_damaged_cache_is_replaced(cache):
+    os.makedirs(os.path.dirname(cache.path))
+    with open(cache.path, "w") as f:
+        f.write("{not json")
+    assert cache.get("key") is None
+    cache.put("key", TOKEN, granted_at=1.0)
+    assert cache.get("key")["access_token"] == "access"
+
+
+def test_entries_without_the_token_fields_are_ignored(cache):
+    os.makedirs(os.path.dirname(cache.path))
+    with open(cache.path, "w") as f:
+        json.dump({"key": {"access_token": "access"}, "other": "not a dict"}, f)
+    assert cache.get("key") is None
+    assert cache.get("other") is None
+
+
+def test_is_fresh():
+    entry = {**TOKEN, "granted_at": 1000.0}
+    assert not is_fresh(None)
+    assert is_fresh(entry, ratio=0.75, now=1000 + 224)
+    assert not is_fresh(entry, ratio=0.75, now=1000 + 225)
+    assert is_fresh({**TOKEN, "granted_at": time.time()})
+
+
+def test_lock_is_reentrant(cache):
+    with cache.lock():
+        with cache.lock():
+            cache.put("key", TOKEN, granted_at=1.0)
+    assert cache.get("key") is not None
+
+
+def test_lock_serializes_the_threads(cache):
+    """Of several threads checking the cache at once only the first requests a token."""
+    requested = []
+
+    def token(user):
+        with cache.lock():
+            entry = cache.get("key")
+            if not is_fresh(entry):
+                time.sleep(0.01)
+                requested.append(user)
+                cache.put("key", {**TOKEN, "access_token": f"access-{user}"}, time.time())
+
+    threads = [threading.Thread(target=token, args=(user,)) for user in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(requested) == 1
+    assert cache.get("key")["access_token"] == f"access-{requested[0]}"
+
+
+def test_concurrent_puts_keep_every_key(cache):
+    def put(user):
+        for _ in range(10):
+            cache.put(f"user-{user}", TOKEN, time.time())
+
+    threads = [threading.Thread(target=put, args=(user,)) for user in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(cache.get(f"user-{user}") is not None for user in range(8))
+
+
+def put_token(path: str) -> None:
+    # a cache of its own, like the one of another run of the client
+    TokenCache(path).put("key", TOKEN, 1.0)
+
+
+@pytest.mark.skipif(fcntl is None, reason="the cache is only locked across processes with fcntl")
+def test_lock_excludes_other_processes(cache):
+    import multiprocessing
+    with cache.lock():
+        # spawned, a forked child would inherit the locked file descriptor
+        process = multiprocessing.get_context("spawn").Process(target=put_token, args=(cache.path,))
+        process.start()
+        process.join(1)
+        # blocked on the flock of this process
+        assert process.is_alive()
+        assert cache.get("key") is None
+    process.join(5)
+    assert process.exitcode == 0
+    assert cache.get("key") is not None
@@ -0,0 +1,14 @@
+"""
+Channel names and connection defaults shared by WebSocketClient and MultiplexClient.
+
+Only the standard library is used here: ws_client.py imports this module
+at startup, multiplex.py (and with it asyncio) only when several
+endpoints are subscribed.
+"""
+
+DEFAULT_PING_INTERVAL = 30  # seconds between keep-alive pings of WebSocketClient and MultiplexClient
+
+
+def channel_name(endpoint: str) -> str:
+    """Last path segment of an endpoint, e.g. ticker for /api/v1/ws/ticker/."""
+    return endpoint.rstrip("/").rsplit("/", 1)[-1]
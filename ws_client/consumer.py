@@ -0,0 +1,89 @@
+"""
+Message consumer decoupling the websocket receive thread from parsing and console output.
+
+The receive thread only puts the raw frame on a queue. A consumer thread
+parses the frames in batches, stores them and prints a summary with the
+messages per second of every channel instead of every message.
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import Counter
+
+DEFAULT_SUMMARY_INTERVAL = 1.0  # seconds between console summaries
+
+
+class MessageConsumer:
+    def __init__(self, store, summary_interval: float = DEFAULT_SUMMARY_INTERVAL, on_parsed=None, printer=print):
+        self.store = store
+        self.summary_interval = summary_interval
+        self.on_parsed = on_parsed
+        self.printer = printer
+        self.received = Counter()
+        self.parse_errors = 0
+        # SimpleQueue is implemented in C, put() never blocks the receive thread
+        self._queue = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._last_summary = time.monotonic()
+        self._last_received = Counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def put(self, frame, channel: str = None):
+        """Called on the receive thread, only enqueues the raw frame."""
+        self._queue.put((channel, frame))
+
+    def stop(self, timeout: float = None):
+        """Stop after all frames received so far are processed."""
+        self._stop.set()
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.summary_interval)
+            except queue.Empty:
+                item = False
+            # drain everything queued so far in one batch
+            batch = []
+            while item:
+                batch.append(item)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = False
+            stopping = item is None
+            self._process(batch)
+            if stopping or (self._stop.is_set() and self._queue.empty()):
+                break
+            if time.monotonic() - self._last_summary >= self.summary_interval:
+                self._summary()
+        self._summary()
+
+    def _process(self, batch: list):
+        for channel, frame in batch:
+            try:
+                message = json.loads(frame)
+            except ValueError:
+                self.parse_errors += 1
+                continue
+            self.received[channel] += 1
+            self.store.append(message)
+            if self.on_parsed is not None:
+                self.on_parsed(channel, message)
+
+    def _summary(self):
+        now = time.monotonic()
+        elapsed = now - self._last_summary
+        if self.received != self._last_received:
+            rates = ", ".join(f"{channel}: {(count - self._last_received[channel]) / elapsed:.0f} msg/s ({count} total)"
+                              for channel, count in self.received.items())
+            self.printer(f"Received {rates}")
+        self._last_summary = now
+        self._last_received = self.received.copy()
@@ -0,0 +1,332 @@
+"""
+Bounded in-memory store for received websocket messages.
+
+Messages are kept in a fixed size ring buffer, optionally also evicted by
+age, with an index of the messages of every type for fast queries. Evicted
+messages can be spilled to disk in append-only segment files of length
+prefixed JSON records, which read_segments() reads back. The same segment files record
+raw websocket frames, see replay.py.
+"""
+
+import bisect
+import collections
+import itertools
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Iterator
+
+DEFAULT_CAPACITY = 10000
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024  # bytes per spill segment file
+DEFAULT_FLUSH_INTERVAL = 1.0  # max seconds the records written are kept in buffers
+SEGMENT_SUFFIX = ".seg"
+COMPRESSED_SUFFIX = ".segz"
+
+# record header: payload length, receive timestamp
+RECORD_HEADER = struct.Struct("!Id")
+
+
+class Ring:
+    """Fixed capacity ring buffer of (timestamp, type, message) entries in insertion order."""
+
+    def __init__(self, capacity: int):
+        self._items = [None] * capacity
+        self._start = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("ring index out of range")
+        return self._items[(self._start + index) % len(self._items)]
+
+    def __iter__(self):
+        for index in range(self._len):
+            yield self[index]
+
+    def full(self) -> bool:
+        return self._len == len(self._items)
+
+    def append(self, item):
+        """Append an item, returns the evicted oldest item if the ring was full."""
+        evicted = None
+        if self.full():
+            evicted = self.popleft()
+        self._items[(self._start + self._len) % len(self._items)] = item
+        self._len += 1
+        return evicted
+
+    def popleft(self):
+        item = self._items[self._start]
+        self._items[self._start] = None
+        self._start = (self._start + 1) % len(self._items)
+        self._len -= 1
+        return item
+
+    def since(self, index: int) -> list:
+        return self.slice(index, self._len)
+
+    def slice(self, first: int, last: int) -> list:
+        """Items first to last (exclusive), copied from the storage in at most two list slices."""
+        first, last = max(first, 0), min(last, self._len)
+        if first >= last:
+            return []
+        size = len(self._items)
+        start = (self._start + first) % size
+        end = start + last - first
+        if end <= size:
+            return self._items[start:end]
+        # wraps around the end of the storage
+        return self._items[start:] + self._items[:end - size]
+
+
+class SegmentWriter:
+    """Append-only writer of length prefixed records, rolling over to a new segment file.
+
+    With compress the segment files (.segz) are one zlib stream, the
+    segment_size is the uncompressed size of their records. New segments are
+    numbered after the highest existing one and never appended to. The
+    buffered records are flushed to the file every flush_interval seconds,
+    compressed ones with a zlib sync flush, so a crash loses at most the
+    records of the last interval.
+    """
+
+    def __init__(self, directory: str, segment_size: int = DEFAULT_SEGMENT_SIZE, prefix: str = "messages", compress: bool = False,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.prefix = prefix
+        self.compress = compress
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+        self._segment = max(map(segment_number, segment_paths(directory, prefix)), default=0)
+        self._file = None
+        self._compressor = None
+        self._size = 0
+        self._flushed = time.monotonic()
+        self._open()
+
+    def _open(self):
+        suffix = COMPRESSED_SUFFIX if self.compress else SEGMENT_SUFFIX
+        while True:
+            self._segment += 1
+            path = os.path.join(self.directory, f"{self.prefix}-{self._segment:06d}{suffix}")
+            try:
+                self._file = open(path, "xb")
+                break
+            except FileExistsError:
+                # created by another writer of the same prefix since
+                continue
+        self._compressor = zlib.compressobj() if self.compress else None
+        self._size = 0
+
+    def _close_segment(self):
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush())
+        self._file.close()
+
+    def write(self, timestamp: float, payload: bytes):
+        record = RECORD_HEADER.pack(len(payload), timestamp) + payload
+        if self._size + len(record) > self.segment_size and self._size > 0:
+            self._close_segment()
+            self._open()
+        self._size += len(record)
+        self._file.write(self._compressor.compress(record) if self._compressor is not None else record)
+        now = time.monotonic()
+        if now - self._flushed >= self.flush_interval:
+            self.flush()
+            self._flushed = now
+
+    def flush(self):
+        """Write the buffered records to the segment file, readable by segment_records()."""
+        if self._compressor is not None:
+            self._file.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        self._file.flush()
+
+    def close(self):
+        self._close_segment()
+
+
+def segment_paths(directory: str, prefix: str = "messages") -> list[str]:
+    """Paths of the segment files of a prefix in write order."""
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.startswith(f"{prefix}-") and name.endswith((SEGMENT_SUFFIX, COMPRESSED_SUFFIX))]
+
+
+def segment_number(path: str) -> int:
+    """Number of a segment file, 0 if its name does not end with one."""
+    number = os.path.splitext(os.path.basename(path))[0].rsplit("-", 1)[-1]
+    return int(number) if number.isdigit() else 0
+
+
+def _decompress(data: bytes) -> bytes:
+    """Decompress the zlib streams of a segment, up to where a crash truncated or corrupted it."""
+    chunks = []
+    while data:
+        decompressor = zlib.decompressobj()
+        try:
+            chunks.append(decompressor.decompress(data))
+        except zlib.error:
+            break
+        data = decompressor.unused_data
+    return b"".join(chunks)
+
+
+def segment_records(path: str) -> Iterator[tuple[float, bytes]]:
+    """Read the (timestamp, payload) records of a segment file.
+
+    Uncompressed segments are memory mapped, compressed ones decompressed
+    into memory. A record truncated by a crash while writing ends the segment.
+    """
+    with open(path, "rb") as f:
+        if path.endswith(COMPRESSED_SUFFIX):
+            buffer = _decompress(f.read())
+        elif os.fstat(f.fileno()).st_size:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            return
+        try:
+            offset, end = 0, len(buffer)
+            while offset + RECORD_HEADER.size <= end:
+                length, timestamp = RECORD_HEADER.unpack_from(buffer, offset)
+                offset += RECORD_HEADER.size
+                if offset + length > end:
+                    break
+                yield timestamp, buffer[offset:offset + length]
+                offset += length
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+
+
+def read_segments(directory: str, prefix: str = "messages") -> Iterator[tuple[float, dict]]:
+    """Read (timestamp, record) pairs of all spill segments in order."""
+    for path in segment_paths(directory, prefix):
+        for timestamp, payload in segment_records(path):
+            yield timestamp, json.loads(payload)
+
+
+class MessageStore:
+    """Bounded store of received messages with queries by type and time range.
+
+    capacity    max number of messages kept in memory
+    max_age     seconds after which messages are evicted, None keeps them until the capacity is reached
+    spill_dir   directory for the segment files of evicted messages, None drops them
+
+    Appends and evictions are O(1), queries by time use binary search on the
+    receive timestamps instead of scanning all messages. Queries of all
+    messages copy the range out of the ring, O(log n + k) for k messages;
+    the index of a type is a deque, which is walked from its oldest message
+    to the first one in the range. The index of a type
+    only holds its messages in the ring and is dropped with its last one, so
+    the memory is bounded by the capacity however many types arrive. The
+    store is thread safe, the websocket thread appends while others query;
+    evicted messages are encoded and spilled after the store lock is released.
+    """
+
+    def __init__(self,
+                 capacity: int = DEFAULT_CAPACITY,
+                 max_age: float = None,
+                 spill_dir: str = None,
+                 segment_size: int = DEFAULT_SEGMENT_SIZE):
+        self.capacity = capacity
+        self.max_age = max_age
+        self._all = Ring(capacity)
+        # entries of every type in the ring, oldest first
+        self._by_type = {}
+        self._lock = threading.Lock()
+        self._spill = SegmentWriter(spill_dir, segment_size) if spill_dir else None
+        # the segment writer is not thread safe, appends of several threads take turns
+        self._spill_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._all)
+
+    def __iter__(self):
+        with self._lock:
+            return iter([message for _, _, message in self._all])
+
+    def append(self, message, msg_type: str = None, timestamp: float = None):
+        if timestamp is None:
+            timestamp = time.time()
+        if msg_type is None and isinstance(message, dict):
+            msg_type = message.get("type")
+        if msg_type is not None and not isinstance(msg_type, (str, int)):
+            # e.g. a list or object in the type field of a message, not usable as a key
+            msg_type = None
+        entry = (timestamp, msg_type, message)
+        spilled = []
+        with self._lock:
+            evicted = self._all.append(entry)
+            if evicted is not None:
+                self._evicted(evicted, spilled)
+            entries = self._by_type.get(msg_type)
+            if entries is None:
+                entries = self._by_type[msg_type] = collections.deque()
+            entries.append(entry)
+            self._evict_old(timestamp, spilled)
+        if spilled:
+            self._write_spill(spilled)
+
+    def _evicted(self, entry, spilled: list):
+        msg_type = entry[1]
+        # the evicted entry is the oldest of its type as well
+        entries = self._by_type[msg_type]
+        entries.popleft()
+        if not entries:
+            del self._by_type[msg_type]
+        if self._spill is not None:
+            spilled.append(entry)
+
+    def _evict_old(self, now: float, spilled: list):
+        if self.max_age is None:
+            return
+        while len(self._all) and self._all[0][0] < now - self.max_age:
+            self._evicted(self._all.popleft(), spilled)
+
+    def _write_spill(self, spilled: list):
+        records = [(timestamp, json.dumps({"type": msg_type, "message": message}, separators=(",", ":")).encode())
+                   for timestamp, msg_type, message in spilled]
+        with self._spill_lock:
+            for timestamp, payload in records:
+                self._spill.write(timestamp, payload)
+
+    def _entries(self, msg_type):
+        return self._all if msg_type is None else self._by_type.get(msg_type, ())
+
+    def recent(self, count: int = 10, msg_type: str = None) -> list:
+        """The latest `count` messages, of one type if msg_type is given."""
+        with self._lock:
+            latest = list(itertools.islice(reversed(self._entries(msg_type)), count))
+        return [message for _, _, message in reversed(latest)]
+
+    def between(self, start: float, end: float = None, msg_type: str = None) -> list:
+        """Messages received between the timestamps start and end, of one type if msg_type is given."""
+        with self._lock:
+            entries = self._entries(msg_type)
+            first = bisect.bisect_left(entries, start, key=lambda entry: entry[0])
+            last = len(entries) if end is None else bisect.bisect_right(entries, end, key=lambda entry: entry[0])
+            if isinstance(entries, Ring):
+                selected = entries.slice(first, last)
+            else:
+                # a deque has no slices, it is walked from the head
+                selected = itertools.islice(entries, first, last)
+            return [entry[2] for entry in selected]
+
+    def types(self) -> dict:
+        """Number of messages in memory per type."""
+        with self._lock:
+            return {msg_type: len(entries) for msg_type, entries in self._by_type.items()}
+
+    def close(self):
+        if self._spill is not None:
+            with self._spill_lock:
+                self._spill.close()
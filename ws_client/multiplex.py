@@ -0,0 +1,294 @@
+"""
+Websocket client subscribing to several endpoints on one asyncio event loop.
+
+All subscriptions share one token and one thread, every received message
+is parsed and passed to the handler of its channel, the last path segment
+of the endpoint (trade, ticker or orderbook):
+
+    client = MultiplexClient(host, port, token)
+    client.subscribe("/api/v1/ws/ticker/", on_ticker)
+    client.subscribe("/api/v1/ws/orderbook/", book.on_message)
+    asyncio.run(client.run())
+
+With renew_token every subscription reconnects on its own after a lost
+connection, like ReconnectSupervisor does for a WebSocketClient: after a
+jittered exponential backoff, with the token another subscription renewed
+since or a new one from renew_token. A gap in the orderbook feed closes its
+connection and reconnects without backoff, for a new snapshot.
+
+The websocket handshake and framing are implemented on asyncio streams,
+frames sent by the client are encoded with websocket-client's ABNF.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import ssl
+import struct
+import time
+
+from websocket import ABNF
+
+from channels import channel_name, DEFAULT_PING_INTERVAL
+from consumer import MessageConsumer, DEFAULT_SUMMARY_INTERVAL
+from message_store import MessageStore, SegmentWriter
+from reconnect import Backoff, GapDetector, RESYNC_CHANNELS, DEFAULT_BACKOFF_MAX
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class HandshakeError(Exception):
+    pass
+
+
+async def handshake(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str, token: str = None):
+    key = base64.b64encode(os.urandom(16)).decode()
+    lines = [
+        f"GET {path} HTTP/1.1",
+        f"Host: {host}",
+        "Upgrade: websocket",
+        "Connection: Upgrade",
+        f"Sec-WebSocket-Key: {key}",
+        "Sec-WebSocket-Version: 13",
+    ]
+    if token:
+        lines.append(f"Authorization: Bearer {token}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+    await writer.drain()
+
+    status, *header_lines = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    if status.split(" ", 2)[1:2] != ["101"]:
+        raise HandshakeError(f"{path}: {status}")
+    headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(":") for line in header_lines if line)}
+    accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+    if headers.get("sec-websocket-accept") != accept:
+        raise HandshakeError(f"{path}: invalid Sec-WebSocket-Accept")
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[bool, int, bytes]:
+    """Read one frame, returns (fin, opcode, payload)."""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack("!Q", await reader.readexactly(8))
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = ABNF.mask(mask, payload)
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+class Subscription:
+    """One websocket connection of a MultiplexClient."""
+
+    def __init__(self, client: "MultiplexClient", endpoint: str, handler):
+        self.client = client
+        self.endpoint = endpoint
+        self.channel = channel_name(endpoint)
+        self.handler = handler
+        self.writer = None
+        self.backoff = Backoff(maximum=client.max_backoff)
+        self.gap_detector = GapDetector()
+        self.connects = 0
+        self.resyncs = 0
+        self._resyncing = False
+        self._loop = None
+
+    async def send(self, payload, opcode: int = ABNF.OPCODE_TEXT):
+        self.writer.write(ABNF.create_frame(payload, opcode).format())
+        await self.writer.drain()
+
+    async def run(self):
+        """Receive until the connection is closed, with renew_token of the client reconnect until cancelled."""
+        client = self.client
+        self._loop = asyncio.get_running_loop()
+        token = client.token
+        while True:
+            started = time.monotonic()
+            try:
+                await self._connect(token)
+            except (OSError, EOFError, HandshakeError) as e:
+                # IncompleteReadError is an EOFError, ssl.SSLError an OSError
+                if client.renew_token is None:
+                    raise
+                if not self._resyncing:
+                    print(f"WebSocket {self.channel} connection error: {e!r}\n")
+            if client.renew_token is None:
+                return
+            if not self._resyncing:
+                # a connection that stayed up for a while starts a new backoff sequence
+                if time.monotonic() - started > self.backoff.maximum:
+                    self.backoff.reset()
+                await self._wait()
+            while (token := await client.fresh_token(token)) is None:
+                print("Failed to get token")
+                await self._wait()
+
+    async def _wait(self):
+        delay = self.backoff.next_delay()
+        print(f"Reconnecting {self.channel} in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    async def _connect(self, token: str):
+        client = self.client
+        reader, self.writer = await asyncio.open_connection(client.host, client.port, ssl=client.ssl_context)
+        pinger = None
+        try:
+            await handshake(reader, self.writer, f"{client.host}:{client.port}", self.endpoint, token)
+            self.gap_detector.reset()
+            self._resyncing = False
+            self.connects += 1
+            if client.ping_interval:
+                pinger = asyncio.create_task(self._ping())
+            await self._receive(reader)
+        finally:
+            if pinger is not None:
+                pinger.cancel()
+            self.writer.close()
+
+    def check(self, message) -> bool:
+        """Whether to pass a message of this subscription to its handler, False while resyncing."""
+        if self._resyncing:
+            return False  # dropped until the snapshot of the new connection
+        if self.gap_detector.check(self.channel, message):
+            print(f"Gap in the {self.channel} feed before seq {message.get('seq')}")
+            if self.client.renew_token is not None and self.channel in RESYNC_CHANNELS:
+                self.resync()
+                return False
+        return True
+
+    def resync(self):
+        """Close the connection from any thread, run() reconnects without backoff and receives a new snapshot."""
+        self._resyncing = True
+        self.resyncs += 1
+        # handle() runs on the consumer thread in fast mode
+        self._loop.call_soon_threadsafe(self.writer.close)
+
+    async def _ping(self):
+        while True:
+            await asyncio.sleep(self.client.ping_interval)
+            await self.send(b"", ABNF.OPCODE_PING)
+
+    async def _receive(self, reader: asyncio.StreamReader):
+        fragments = []
+        # a resync closes the connection, the frames still buffered are not read
+        while not self._resyncing:
+            fin, opcode, payload = await read_frame(reader)
+            if opcode == ABNF.OPCODE_CLOSE:
+                print(f"WebSocket {self.channel} closed by server")
+                await self.send(payload[:2], ABNF.OPCODE_CLOSE)
+                return
+            if opcode == ABNF.OPCODE_PING:
+                await self.send(payload, ABNF.OPCODE_PONG)
+                continue
+            if opcode == ABNF.OPCODE_PONG:
+                continue
+            fragments.append(payload)
+            if fin:
+                self.client.dispatch(self.channel, b"".join(fragments))
+                fragments = []
+
+
+class MultiplexClient:
+    """Websocket subscriptions to several endpoints of one host on a single event loop.
+
+    store      MessageStore all parsed messages are appended to, default: a new MessageStore
+    fast       hand the raw frames to a MessageConsumer thread for parsing and print a summary
+               of the messages per second of every channel, as WebSocketClient does
+    record_dir directory the raw frames of every channel are recorded to, see replay.py
+    renew_token returns a fresh access token for a reconnect, blocking, called in a worker thread;
+               None ends a subscription with its connection
+    max_backoff maximum seconds between reconnect attempts of a subscription
+    """
+
+    def __init__(self,
+                 host: str,
+                 port: int = 443,
+                 token: str = None,
+                 ssl_enabled: bool = True,
+                 ping_interval: float = DEFAULT_PING_INTERVAL,
+                 store=None,
+                 fast: bool = False,
+                 summary_interval: float = DEFAULT_SUMMARY_INTERVAL,
+                 record_dir: str = None,
+                 compress: bool = False,
+                 renew_token=None,
+                 max_backoff: float = DEFAULT_BACKOFF_MAX):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.renew_token = renew_token
+        self.max_backoff = max_backoff
+        self._token_lock = None
+        self.ping_interval = ping_interval
+        self.received_messages = store if store is not None else MessageStore()
+        self.consumer = MessageConsumer(self.received_messages, summary_interval, self.handle).start() if fast else None
+        self.ssl_context = ssl._create_unverified_context() if ssl_enabled else None
+        self.subscriptions = {}
+        self.record_dir = record_dir
+        self.compress = compress
+        self.recorders = {}
+
+    def subscribe(self, endpoint: str, handler=None) -> Subscription:
+        """Subscribe to an endpoint, handler is called with (channel, message) for every message."""
+        subscription = Subscription(self, endpoint, handler)
+        self.subscriptions[subscription.channel] = subscription
+        if self.record_dir:
+            self.recorders[subscription.channel] = SegmentWriter(self.record_dir, prefix=subscription.channel, compress=self.compress)
+        return subscription
+
+    def dispatch(self, channel: str, frame: bytes):
+        recorder = self.recorders.get(channel)
+        if recorder is not None:
+            recorder.write(time.time(), frame)
+        if self.consumer is not None:
+            self.consumer.put(frame, channel)
+            return
+        try:
+            message = json.loads(frame)
+        except ValueError:
+            print(f"Invalid {channel} message: {frame[:100]!r}")
+            return
+        self.received_messages.append(message)
+        self.handle(channel, message)
+
+    def handle(self, channel: str, message):
+        subscription = self.subscriptions[channel]
+        if subscription.check(message) and subscription.handler is not None:
+            subscription.handler(channel, message)
+
+    async def fresh_token(self, used: str) -> str | None:
+        """Token for a reconnect after `used` was, renewed once for all subscriptions that lost their connection together."""
+        async with self._token_lock:
+            if self.token == used:
+                token = await asyncio.to_thread(self.renew_token)
+                if token is None:
+                    return None
+                self.token = token
+            return self.token
+
+    async def run(self):
+        """Run all subscriptions until every connection is closed, returns the connection errors.
+
+        With renew_token the subscriptions reconnect and run until cancelled, e.g. by Ctrl + c.
+        """
+        self._token_lock = asyncio.Lock()
+        try:
+            results = await asyncio.gather(*(subscription.run() for subscription in self.subscriptions.values()),
+                                           return_exceptions=True)
+        finally:
+            if self.consumer is not None:
+                self.consumer.stop()
+            self.received_messages.close()
+            for recorder in self.recorders.values():
+                recorder.close()
+        errors = {}
+        for channel, result in zip(self.subscriptions, results):
+            if isinstance(result, BaseException):
+                print(f"WebSocket {channel} connection error: {result!r}\n")
+                errors[channel] = result
+        return errors
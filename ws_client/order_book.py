@@ -0,0 +1,122 @@
+"""
+Local order book built incrementally from the orderbook websocket feed.
+
+Messages of /api/v1/ws/orderbook/ are either a snapshot of the whole book or
+an update of single price levels:
+
+    {"seq": 0, "type": "snapshot", "bids": [[price, quantity], ...], "asks": [[price, quantity], ...]}
+    {"seq": 1, "type": "update", "bids": [[0.52, 300]], "asks": [[0.81, 0]]}
+
+An update replaces the quantity of a level, a quantity of 0 removes it.
+"""
+
+import bisect
+
+SNAPSHOT = "snapshot"
+
+
+class BookSide:
+    """Price levels of one side of the book.
+
+    Prices are kept in a sorted list with the best price at the end, so the
+    best level is an O(1) lookup and removing it an O(1) pop. A level is
+    found with binary search, the quantities are kept in a dict by price.
+    """
+
+    def __init__(self, descending: bool):
+        # bids are best at the highest price, asks at the lowest: asks are stored negated
+        self._sign = 1 if descending else -1
+        self._keys = []
+        self._levels = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, price):
+        return price in self._levels
+
+    def clear(self):
+        self._keys.clear()
+        self._levels.clear()
+
+    def set(self, price: float, quantity: float):
+        if quantity:
+            if price not in self._levels:
+                bisect.insort(self._keys, price * self._sign)
+            self._levels[price] = quantity
+        elif self._levels.pop(price, None) is not None:
+            key = price * self._sign
+            if self._keys[-1] == key:
+                self._keys.pop()
+            else:
+                del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def best(self) -> tuple[float, float] | None:
+        if not self._keys:
+            return None
+        price = self._keys[-1] * self._sign
+        return price, self._levels[price]
+
+    def quantity(self, price: float) -> float:
+        return self._levels.get(price, 0)
+
+    def depth(self, levels: int = 10) -> list[tuple[float, float]]:
+        """The `levels` best (price, quantity) levels, best first."""
+        keys = self._keys[-levels:] if levels else self._keys
+        return [(key * self._sign, self._levels[key * self._sign]) for key in reversed(keys)]
+
+
+class OrderBook:
+    """Order book of bids and asks, updated with apply() for every orderbook message."""
+
+    def __init__(self):
+        self.bids = BookSide(descending=True)
+        self.asks = BookSide(descending=False)
+        self.seq = None
+        self.timestamp = None
+        self.updates = 0
+
+    def apply(self, message: dict):
+        if message.get("type") == SNAPSHOT:
+            self.bids.clear()
+            self.asks.clear()
+        for price, quantity in message.get("bids", ()):
+            self.bids.set(price, quantity)
+        for price, quantity in message.get("asks", ()):
+            self.asks.set(price, quantity)
+        self.seq = message.get("seq", self.seq)
+        self.timestamp = message.get("timestamp", self.timestamp)
+        self.updates += 1
+
+    def on_message(self, channel: str, message: dict):
+        """Handler for WebSocketClient on_parsed, ignores the messages of other channels."""
+        if channel == "orderbook":
+            self.apply(message)
+
+    def best_bid(self) -> tuple[float, float] | None:
+        return self.bids.best()
+
+    def best_ask(self) -> tuple[float, float] | None:
+        return self.asks.best()
+
+    def spread(self) -> float | None:
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return ask[0] - bid[0]
+
+    def mid_price(self) -> float | None:
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (ask[0] + bid[0]) / 2
+
+    def depth(self, levels: int = 10) -> dict:
+        """The `levels` best bid and ask levels, best first."""
+        return {"bids": self.bids.depth(levels), "asks": self.asks.depth(levels)}
+
+    def summary(self) -> str:
+        bid, ask = self.bids.best(), self.asks.best()
+        spread = self.spread()
+        return (f"seq {self.seq}: best bid {bid}, best ask {ask}, "
+                f"spread {'-' if spread is None else f'{spread:.4f}'}, levels {len(self.bids)}/{len(self.asks)}")
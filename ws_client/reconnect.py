@@ -0,0 +1,143 @@
+"""
+Reconnect supervisor for WebSocketClient.
+
+The supervisor connects with a fresh token, waits until the connection is
+lost and reconnects after a jittered exponential backoff. Gaps in the
+sequence numbers or timestamps of the received messages are detected per
+channel; a gap on a channel with snapshots (the orderbook) closes the
+connection, so the reconnect starts again with a full snapshot.
+"""
+
+import random
+import time
+
+DEFAULT_BACKOFF_INITIAL = 0.1  # seconds before the first reconnect attempt
+DEFAULT_BACKOFF_MAX = 30
+DEFAULT_MAX_SILENCE = 60  # seconds between timestamps counted as a gap for feeds without seq
+RESYNC_CHANNELS = ("orderbook",)
+
+
+class Backoff:
+    """Exponential backoff with full jitter, the delay is random between 0 and the exponential bound."""
+
+    def __init__(self, initial: float = DEFAULT_BACKOFF_INITIAL, maximum: float = DEFAULT_BACKOFF_MAX, multiplier: float = 2):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        bound = min(self.maximum, self.initial * self.multiplier ** self.attempts)
+        self.attempts += 1
+        return random.uniform(0, bound)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class GapDetector:
+    """Detects missing messages of a channel by the seq field, or by the timestamp if there is none."""
+
+    def __init__(self, max_silence: float = DEFAULT_MAX_SILENCE):
+        self.max_silence = max_silence
+        self.gaps = 0
+        self._last_seq = {}
+        self._last_timestamp = {}
+
+    def reset(self):
+        """Forget the last messages, a new connection starts a new sequence."""
+        self._last_seq.clear()
+        self._last_timestamp.clear()
+
+    def check(self, channel: str, message) -> bool:
+        """Record a message, returns True if messages are missing before it."""
+        if not isinstance(message, dict):
+            return False
+        gap = False
+        seq = message.get("seq")
+        timestamp = message.get("timestamp")
+        if seq is not None:
+            last = self._last_seq.get(channel)
+            gap = last is not None and seq != last + 1
+            self._last_seq[channel] = seq
+        elif timestamp is not None:
+            last = self._last_timestamp.get(channel)
+            gap = last is not None and timestamp - last > self.max_silence
+        if timestamp is not None:
+            self._last_timestamp[channel] = timestamp
+        if gap:
+            self.gaps += 1
+        return gap
+
+
+class ReconnectSupervisor:
+    """Keeps a WebSocketClient connected.
+
+    connect        called with (token, on_parsed), returns a new connected WebSocketClient
+    renew_token    returns a fresh access token, called before every connect
+    on_parsed      handler called with (channel, message) for every message, e.g. OrderBook.on_message
+    """
+
+    def __init__(self,
+                 connect,
+                 renew_token,
+                 on_parsed=None,
+                 backoff: Backoff = None,
+                 gap_detector: GapDetector = None,
+                 resync_channels: tuple = RESYNC_CHANNELS):
+        self.connect = connect
+        self.renew_token = renew_token
+        self.on_parsed = on_parsed
+        self.backoff = backoff or Backoff()
+        self.gap_detector = gap_detector or GapDetector()
+        self.resync_channels = resync_channels
+        self.client = None
+        self.connects = 0
+        self.resyncs = 0
+        self._resyncing = False
+
+    def _on_parsed(self, channel, message):
+        if self._resyncing and channel in self.resync_channels:
+            return  # dropped until the snapshot of the new connection
+        if self.gap_detector.check(channel, message):
+            print(f"Gap in the {channel} feed before seq {message.get('seq')}")
+            if channel in self.resync_channels:
+                self.resync()
+                return
+        if self.on_parsed is not None:
+            self.on_parsed(channel, message)
+
+    def resync(self):
+        """Close the connection, the supervisor reconnects without backoff and receives a new snapshot."""
+        self._resyncing = True
+        self.resyncs += 1
+        self.client.stop()
+
+    def run(self, token: str = None):
+        """Connect and reconnect until interrupted with Ctrl + c, token is used for the first connect."""
+        try:
+            while True:
+                if token is None:
+                    token = self.renew_token()
+                if token is None:
+                    print("Failed to get token")
+                else:
+                    self.gap_detector.reset()
+                    self._resyncing = False
+                    self.client = self.connect(token, self._on_parsed)
+                    token = None
+                    self.connects += 1
+                    started = time.monotonic()
+                    self.client.run()
+                    if self.client.interrupted:
+                        return
+                    if self._resyncing:
+                        continue
+                    # a connection that stayed up for a while starts a new backoff sequence
+                    if time.monotonic() - started > self.backoff.maximum:
+                        self.backoff.reset()
+                delay = self.backoff.next_delay()
+                print(f"Reconnecting in {delay:.2f}s")
+                time.sleep(delay)
+        except KeyboardInterrupt:
+            pass
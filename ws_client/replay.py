@@ -0,0 +1,61 @@
+"""
+Replay of websocket feeds recorded with WebSocketClient(recorder=...).
+
+A recording is a directory of segment files per channel, with the raw text
+frames and their receive timestamps (see message_store.SegmentWriter).
+The replay passes the frames to the same handlers as a live connection,
+e.g. WebSocketClient.on_message, either as fast as possible or with the
+recorded timing:
+
+    client = WebSocketClient(url, fast=True, connect=False)
+    FeedReplayer("recording", "ticker").run(client.enqueue_message)
+"""
+
+import time
+from typing import Iterator
+
+from message_store import segment_paths, segment_records
+
+
+class FeedReplayer:
+    """Plays back the recorded frames of one channel.
+
+    speed   0 replays as fast as possible, 1 with the recorded timing, 10 ten times faster
+    """
+
+    def __init__(self, directory: str, channel: str, speed: float = 0):
+        self.directory = directory
+        self.channel = channel
+        self.speed = speed
+        self.replayed = 0
+
+    def frames(self) -> Iterator[tuple[float, str]]:
+        """(receive timestamp, frame) of all recorded frames in order."""
+        for path in segment_paths(self.directory, self.channel):
+            for timestamp, payload in segment_records(path):
+                yield timestamp, payload.decode()
+
+    def run(self, on_message, ws=None) -> int:
+        """Pass every frame to on_message(ws, frame), returns the number of frames."""
+        frames = self.frames()
+        if self.speed:
+            frames = self._paced(frames)
+        count = 0
+        try:
+            for _, frame in frames:
+                on_message(ws, frame)
+                count += 1
+        finally:
+            # also counts the frames of a replay interrupted with Ctrl + c
+            self.replayed += count
+        return count
+
+    def _paced(self, frames: Iterator[tuple[float, str]]) -> Iterator[tuple[float, str]]:
+        start = first = None
+        for timestamp, frame in frames:
+            if first is None:
+                start, first = time.perf_counter(), timestamp
+            delay = (timestamp - first) / self.speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            yield timestamp, frame
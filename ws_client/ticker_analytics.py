@@ -0,0 +1,157 @@
+"""
+Live statistics of the ticker feed in columnar NumPy ring arrays.
+
+Every tick of /api/v1/ws/ticker/ is written to fixed size arrays of
+timestamps, prices, quantities, delivery slots and country codes. Each
+value is written twice, at i and i + capacity, so the latest n ticks are
+always one contiguous slice: appending costs the same for any capacity and
+the statistics are computed on array views without copying.
+
+    analytics = TickerAnalytics(capacity=100000)
+    client = WebSocketClient(url, token=token, on_parsed=analytics.on_message)
+    analytics.vwap(seconds=300), analytics.volume_by_country()
+
+Requires numpy (pip install numpy).
+"""
+
+import time
+
+import numpy as np
+
+DEFAULT_TICKER_CAPACITY = 100000
+
+
+class Codes:
+    """Integer codes of the delivery slots or countries of the ticks in the ring.
+
+    The code of a value is freed and reused once its last tick is
+    overwritten, so the names stay bounded by the capacity however many
+    delivery slots the feed goes through. Freed codes are named None and
+    have no volume.
+    """
+
+    def __init__(self):
+        self.names = []
+        self._counts = []
+        self._index = {}
+        self._free = []
+
+    def add(self, name) -> int:
+        i = self._index.get(name)
+        if i is None:
+            if self._free:
+                i = self._free.pop()
+                self.names[i] = name
+            else:
+                i = len(self.names)
+                self.names.append(name)
+                self._counts.append(0)
+            self._index[name] = i
+        self._counts[i] += 1
+        return i
+
+    def remove(self, i: int):
+        """A tick of code i was overwritten."""
+        self._counts[i] -= 1
+        if not self._counts[i]:
+            del self._index[self.names[i]]
+            self.names[i] = None
+            self._free.append(i)
+
+
+class TickerAnalytics:
+    """Rolling VWAP, volatility and traded volume per delivery slot and country of the last `capacity` ticks.
+
+    The window of the statistics is the last `seconds` of ticks, or all
+    ticks in the ring if seconds is None.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_TICKER_CAPACITY):
+        self.capacity = capacity
+        self.timestamps = np.zeros(2 * capacity, dtype=np.float64)
+        self.prices = np.zeros(2 * capacity, dtype=np.float64)
+        self.quantities = np.zeros(2 * capacity, dtype=np.float64)
+        # delivery slots and country codes are stored as codes of the names of these tables
+        self.slots = np.zeros(2 * capacity, dtype=np.int32)
+        self.countries = np.zeros(2 * capacity, dtype=np.int32)
+        self.slot_codes = Codes()
+        self.country_codes = Codes()
+        self._next = 0
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, price: float, quantity: float, slot=None, country: str = None, timestamp: float = None):
+        if timestamp is None:
+            timestamp = time.time()
+        if self.count >= self.capacity:
+            # the oldest tick is overwritten
+            self.slot_codes.remove(self.slots.item(self._next))
+            self.country_codes.remove(self.countries.item(self._next))
+        slot_i = self.slot_codes.add(slot)
+        country_i = self.country_codes.add(country)
+        for i in (self._next, self._next + self.capacity):
+            self.timestamps[i] = timestamp
+            self.prices[i] = price
+            self.quantities[i] = quantity
+            self.slots[i] = slot_i
+            self.countries[i] = country_i
+        self._next = (self._next + 1) % self.capacity
+        self.count += 1
+
+    def on_message(self, channel: str, message: dict):
+        """Handler for WebSocketClient on_parsed, ignores the messages of other channels."""
+        if channel != "ticker" or not isinstance(message, dict) or "price" not in message:
+            return
+        timestamp = message.get("timestamp")
+        self.append(message["price"], message.get("quantity", 0),
+                    (message.get("delivery_start"), message.get("delivery_end")),
+                    message.get("country_code"), timestamp if isinstance(timestamp, (int, float)) else None)
+
+    def _window(self, seconds: float = None) -> slice:
+        """Slice of the arrays with the ticks of the last `seconds`, oldest first."""
+        length = len(self)
+        end = self._next + self.capacity
+        start = end - length
+        if seconds is not None and length:
+            since = self.timestamps[end - 1] - seconds
+            start += int(np.searchsorted(self.timestamps[start:end], since, side="left"))
+        return slice(start, end)
+
+    def vwap(self, seconds: float = None) -> float | None:
+        """Volume weighted average price."""
+        window = self._window(seconds)
+        volume = self.quantities[window].sum()
+        if not volume:
+            return None
+        return float(np.dot(self.prices[window], self.quantities[window]) / volume)
+
+    def volatility(self, seconds: float = None) -> float | None:
+        """Standard deviation of the log returns between ticks."""
+        prices = self.prices[self._window(seconds)]
+        if len(prices) < 3 or (prices <= 0).any():
+            return None
+        return float(np.diff(np.log(prices)).std(ddof=1))
+
+    def volume(self, seconds: float = None) -> float:
+        return float(self.quantities[self._window(seconds)].sum())
+
+    def _volume_by(self, codes: np.ndarray, names: list, seconds: float = None) -> dict:
+        window = self._window(seconds)
+        volumes = np.bincount(codes[window], weights=self.quantities[window], minlength=len(names))
+        return {name: float(volume) for name, volume in zip(names, volumes) if volume}
+
+    def volume_by_slot(self, seconds: float = None) -> dict:
+        """Traded volume per (delivery_start, delivery_end) slot."""
+        return self._volume_by(self.slots, self.slot_codes.names, seconds)
+
+    def volume_by_country(self, seconds: float = None) -> dict:
+        """Traded volume per country code."""
+        return self._volume_by(self.countries, self.country_codes.names, seconds)
+
+    def summary(self, seconds: float = None) -> str:
+        vwap, volatility = self.vwap(seconds), self.volatility(seconds)
+        return (f"{len(self)} ticks, vwap {'-' if vwap is None else f'{vwap:.4f}'}, "
+                f"volatility {'-' if volatility is None else f'{volatility:.4f}'}, "
+                f"volume {self.volume(seconds):.0f}, by country {self.volume_by_country(seconds)}")
@@ -20,20 +20,38 @@ pip install websocket-client requests
 """
 
 import argparse
+import builtins
+import contextlib
 import json
-import multiprocessing
 import os
-import time
-import ssl
+import sys
 import threading
-from dataclasses import dataclass
-from time import sleep
-import requests
-import websocket
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING
+
+# token_cache.py and profiling.py are shared with rest_client.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+
+from message_store import MessageStore, SegmentWriter, DEFAULT_CAPACITY
+from consumer import MessageConsumer, DEFAULT_SUMMARY_INTERVAL
+from order_book import OrderBook
+from channels import channel_name, DEFAULT_PING_INTERVAL
+from reconnect import Backoff, ReconnectSupervisor, DEFAULT_BACKOFF_MAX
+from replay import FeedReplayer
+from token_cache import TokenCache, DEFAULT_TOKEN_CACHE, cache_key, is_fresh
+
+# the multiplex client (asyncio) and the ticker statistics (numpy) are
+# imported when they are used, they cost more at startup than the rest;
+# websocket with the first connection and requests with the first token
+# request, a cached token connects without it
+if TYPE_CHECKING:
+    import requests
 
 HOST = os.getenv("GFLEX_URL", "test.glocalflexmarket.com")
 USERNAME = os.getenv("GFLEX_USER", "<username>")
 PASSWORD = os.getenv("GFLEX_PASSWORD", "<password>")
+TOKEN_CACHE = os.getenv("GFLEX_TOKEN_CACHE", DEFAULT_TOKEN_CACHE)
 
 CLIENT_ID = "glocalflexmarket_public_api"
 AUTH_ENDPOINT = "/auth/oauth/v2/token"
@@ -42,20 +60,42 @@ AVAILALBLE_ENDPOINT = "/api/v1/ws/trade/ /api/v1/ws/ticker/ /api/v1/ws/orderbook
 SSL_VERIFY = False
 PORT = 443
 USER_MESSAGE = "Listen for messages, press Ctrl + c to quit): \n"
+CLOSE_TIMEOUT = 3  # seconds to wait for the close frame of the server
+IDLE_TIMEOUT = 3600  # seconds the receive thread sleeps without messages if pings are disabled
 
 class WebSocketClient:
-    def __init__(self, url, ssl_enabled=True, token=None):
+    def __init__(self, url, ssl_enabled=True, token=None, store=None, fast=False, summary_interval=DEFAULT_SUMMARY_INTERVAL, on_parsed=None,
+                 ping_interval=DEFAULT_PING_INTERVAL, recorder=None, connect=True):
         self.ws_url = url
         self.ssl_enabled = ssl_enabled
         self.token = token
-        self.received_messages = []
-        self.shutdown_pipe, self.shutdown_pipe2 = multiprocessing.Pipe()
-
+        # 0 disables the pings, otherwise run_forever starts a thread sending one every ping_interval seconds
+        self.ping_interval = ping_interval
+        self.channel = url.rstrip("/").rsplit("/", 1)[-1]
+        # bounded, see MessageStore for the capacity, age and spill settings
+        self.received_messages = store if store is not None else MessageStore()
+        # a store passed in outlives the connection, e.g. across reconnects, and is closed by the caller
+        self._owns_store = store is None
+        self.interrupted = False
+        # called with (channel, message) for every parsed message, e.g. OrderBook.on_message
+        self.on_parsed = on_parsed
+        # SegmentWriter the raw frames are recorded to, closed by the caller, see replay.py
+        self.recorder = recorder
+        # in fast mode the receive thread only enqueues frames, the consumer parses them
+        self.consumer = MessageConsumer(self.received_messages, summary_interval, on_parsed).start() if fast else None
+        # set by the receive thread once the connection is open and once it is closed, run() blocks on it
+        self.connected = threading.Event()
+        self.closed = threading.Event()
+
+        headers = {}
         if self.token:
             headers = {
                 "Authorization": f"Bearer {self.token}",
             }
 
+        import ssl
+        import websocket
+
         self.sslopt = (
             {
                 "cert_reqs": ssl.CERT_NONE,
@@ -69,30 +109,48 @@ class WebSocketClient:
         self.ws = websocket.WebSocketApp(
             url=self.ws_url,
             header=headers,
-            on_message=self.on_message,
+            on_message=self.enqueue_message if fast else self.on_message,
+            on_open=self.on_open,
             on_ping=self.on_ping,
             on_close=self.on_close,
         )
 
         self.receive_thread = threading.Thread(target=self.receive_message, daemon=True)
-        self.receive_thread.start()
+        # without connect the handlers are fed by a FeedReplayer
+        if connect:
+            self.receive_thread.start()
 
     def receive_message(self):
-        err = self.ws.run_forever(ping_interval=1, sslopt=self.sslopt)
-        if err:
-            # send exit message to shutdown the main thread
-            self.shutdown_pipe.send("exit")
-            print(f"WebSocket connection error: {err}\n")
-
-    def on_close(self, ws):
+        try:
+            # without pings websocket-client's selector would still wake up every 10 seconds
+            ping_timeout = self.ping_interval / 2 if self.ping_interval else IDLE_TIMEOUT
+            err = self.ws.run_forever(ping_interval=self.ping_interval, ping_timeout=ping_timeout, sslopt=self.sslopt)
+            if err:
+                print(f"WebSocket connection error: {err}\n")
+        finally:
+            # wakes up run() in the main thread
+            self.closed.set()
+
+    def on_open(self, ws):
+        self.connected.set()
+
+    def on_close(self, ws, close_status_code=None, close_msg=None):
         print("WebSocket closed by server")
-        self.shutdown_pipe.send("exit")
 
     def on_message(self, ws, message):
+        if self.recorder is not None:
+            self.recorder.write(time.time(), message.encode())
         parsed_message = json.loads(message)
         print(f"Received message:\n {json.dumps(parsed_message, indent=4)} \n")
         print(USER_MESSAGE)
         self.received_messages.append(parsed_message)
+        if self.on_parsed is not None:
+            self.on_parsed(self.channel, parsed_message)
+
+    def enqueue_message(self, ws, message):
+        if self.recorder is not None:
+            self.recorder.write(time.time(), message.encode())
+        self.consumer.put(message, self.channel)
 
     def on_ping(self, ws, data):
         ws.pong()
@@ -100,21 +158,34 @@ class WebSocketClient:
     def send_message(self, message):
         self.ws.send(message)
 
+    def stop(self):
+        """Close the connection from any thread, run() returns once the receive thread has ended.
+
+        Only the close frame is sent here, the receive thread reads the close
+        frame of the server and ends, instead of both threads reading the socket.
+        """
+        sock = self.ws.sock
+        if sock is not None and sock.connected:
+            sock.send_close()
+        else:
+            self.ws.close()
+
     def run(self):
         try:
             print(USER_MESSAGE)
-            while True:
-                # Check if shutdown signal is received from receive_message thread
-                if self.shutdown_pipe2.poll():
-                    if self.shutdown_pipe2.recv() == "exit":
-                        print("Exiting...")
-                        break
-                sleep(0.1)
-
+            # blocks without waking up until the receive thread has ended
+            self.closed.wait()
+            print("Exiting...")
         except KeyboardInterrupt:
-            pass
+            self.interrupted = True
         print("Closing connection...")
-        self.ws.close()
+        self.stop()
+        if not self.closed.wait(CLOSE_TIMEOUT):
+            self.ws.close()
+        if self.consumer is not None:
+            self.consumer.stop()
+        if self._owns_store:
+            self.received_messages.close()
 
 
 @dataclass
@@ -142,9 +213,87 @@ def request_token(
     return check_response(response)
 
 
+def request_refresh_token(
+    client_id: str,
+    refresh_token: str,
+    token_url: str,
+    ssl_verify: bool = True,
+) -> Token | None:
+
+    payload = {
+        "client_id": client_id,
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token,
+    }
+    response = request_access_token(token_url, payload, ssl_verify=ssl_verify)
+    return check_response(response)
+
+
+class TokenSource:
+    """Fresh access tokens for every (re)connect, refreshed with the refresh token if possible.
+
+    With a TokenCache the first connect reuses a valid token of an earlier
+    run, or of rest_client.py for the same user, and every token received
+    is stored for the next runs. A reconnect never gets the token of the
+    lost connection back from the cache.
+    """
+
+    def __init__(self, client_id: str, username: str, password: str, token_url: str, ssl_verify: bool = True,
+                 cache: TokenCache = None, cache_key: str = None):
+        self.client_id = client_id
+        self.username = username
+        self.password = password
+        self.token_url = token_url
+        self.ssl_verify = ssl_verify
+        self.cache = cache
+        self.cache_key = cache_key
+        self.token = None
+
+    def access_token(self) -> str | None:
+        with self.cache.lock() if self.cache is not None else contextlib.nullcontext():
+            token = self._cached_token()
+            if token is None:
+                granted_at = time.time()
+                token = self._requested_token()
+                if token is not None and self.cache is not None:
+                    self.cache.put(self.cache_key, asdict(token), granted_at)
+        self.token = token
+        return token.access_token if token is not None else None
+
+    def _requested_token(self) -> Token | None:
+        """Token refreshed with the refresh token of the current one, or a new one, None if the requests failed."""
+        import requests
+        try:
+            token = None
+            if self.token is not None and self.token.refresh_token:
+                token = request_refresh_token(self.client_id, self.token.refresh_token, self.token_url, self.ssl_verify)
+            if token is None:
+                token = request_token(self.client_id, self.username, self.password, self.token_url, self.ssl_verify)
+            return token
+        except requests.exceptions.RequestException as e:
+            print(f"Token request failed: {e}")
+            return None
+
+    def _cached_token(self) -> Token | None:
+        """Valid cached token other than the current one, a stale one only provides its refresh token."""
+        if self.cache is None:
+            return None
+        entry = self.cache.get(self.cache_key)
+        if entry is None or (self.token is not None and entry["access_token"] == self.token.access_token):
+            return None
+        token = Token(entry["access_token"], entry.get("refresh_token"), entry["expires_in"])
+        if is_fresh(entry):
+            print("Using cached access token")
+            return token
+        if self.token is None:
+            self.token = token
+        return None
+
+
 def request_access_token(
     token_url: str, payload: dict, ssl_verify=True
-) -> requests.Response:
+) -> "requests.Response":
+    import requests
     response = requests.post(
         token_url,
         data=payload,
@@ -175,41 +324,190 @@ def cli_args() -> argparse.Namespace:
     parser.add_argument("--port", default=PORT, dest="port", metavar="", help=f"Host port, DEFAULT: {PORT}")
     parser.add_argument("-u", "--username", dest="username", metavar="", default=USERNAME, help=f"Username for authentication, default: {USERNAME}")
     parser.add_argument("-p", "--password", dest="password", metavar="", default=PASSWORD, help=f"Password for authentication, default: {PASSWORD}")
-    parser.add_argument("-t", "--endpoint", dest="endpoint", default=ORDER_ENDPOINT, metavar="", help=f"Order API endpoint, default: {ORDER_ENDPOINT}, endpoints: {AVAILALBLE_ENDPOINT}")
+    parser.add_argument("-t", "--endpoint", dest="endpoint", nargs="+", default=[ORDER_ENDPOINT], metavar="", help=f"Order API endpoints, several endpoints are received on one connection each with a shared token, default: {ORDER_ENDPOINT}, endpoints: {AVAILALBLE_ENDPOINT}")
     parser.add_argument("-d", "--debug", dest="debug", action="store_true", help="Enable websocket debug mode")
+    parser.add_argument("-f", "--fast", dest="fast", action="store_true", help="High throughput mode, print a summary of messages per second instead of every message")
+    parser.add_argument("--summary-interval", dest="summary_interval", metavar="", type=float, default=DEFAULT_SUMMARY_INTERVAL, help=f"Seconds between the summaries of the message rates in fast mode and of the order book and ticker statistics, default: {DEFAULT_SUMMARY_INTERVAL}")
+    parser.add_argument("--ping-interval", dest="ping_interval", metavar="", type=float, default=DEFAULT_PING_INTERVAL, help=f"Seconds between websocket pings, 0 disables them, default: {DEFAULT_PING_INTERVAL}")
+    parser.add_argument("--max-backoff", dest="max_backoff", metavar="", type=float, default=DEFAULT_BACKOFF_MAX, help=f"Maximum seconds between reconnect attempts, default: {DEFAULT_BACKOFF_MAX}")
+    parser.add_argument("--record", dest="record", metavar="", default=None, help="Directory to record the received frames to, default: no recording")
+    parser.add_argument("--compress", dest="compress", action="store_true", help="Compress the recorded segment files")
+    parser.add_argument("--replay", dest="replay", metavar="", default=None, help="Replay the frames recorded to this directory instead of connecting")
+    parser.add_argument("--replay-speed", dest="replay_speed", metavar="", type=float, default=0, help="Replay speed relative to the recorded timing, default: 0, as fast as possible")
+    parser.add_argument("--max-messages", dest="max_messages", metavar="", type=int, default=DEFAULT_CAPACITY, help=f"Number of received messages kept in memory, default: {DEFAULT_CAPACITY}")
+    parser.add_argument("--max-age", dest="max_age", metavar="", type=float, default=None, help="Seconds received messages are kept in memory, default: no limit")
+    parser.add_argument("--token-cache", dest="token_cache", metavar="", default=TOKEN_CACHE, help=f"File caching the access token for later runs and other processes, default: {TOKEN_CACHE}")
+    parser.add_argument("--no-token-cache", dest="token_cache", action="store_const", const=None, help="Authenticate on every start without token cache")
+    parser.add_argument("--spill-dir", dest="spill_dir", metavar="", default=None, help="Directory to write evicted messages to, default: evicted messages are dropped")
+    parser.add_argument("--profile", dest="profile", action="store_true", help="Time the stages of the message path and print a per stage breakdown at the end")
+    parser.add_argument("--profile-file", dest="profile_file", metavar="", default=None, help="Write the collapsed stacks of the profile to this file for flamegraph.pl or speedscope, implies --profile")
     return parser.parse_args()
 
+
+def print_message(channel, message):
+    print(f"Received {channel} message:\n {json.dumps(message, indent=4)} \n")
+
+
+def channel_handler(channel: str, summary_interval: float = DEFAULT_SUMMARY_INTERVAL, print_messages: bool = False):
+    """Handler keeping a local order book of the orderbook feed or the statistics of the ticker feed.
+
+    Their summary is printed every summary_interval seconds, like the message
+    rates of the consumer in fast mode, not after every message.
+    """
+    state = label = None
+    last_summary = time.monotonic()
+    if channel == "orderbook":
+        state, label = OrderBook(), "Order book"
+    elif channel == "ticker":
+        # numpy is optional, the ticker statistics are computed when it is installed
+        try:
+            from ticker_analytics import TickerAnalytics
+            state, label = TickerAnalytics(), "Ticker"
+        except ImportError:
+            pass
+
+    def on_parsed(channel, message):
+        nonlocal last_summary
+        if print_messages:
+            print_message(channel, message)
+        if state is not None:
+            state.on_message(channel, message)
+            now = time.monotonic()
+            if now - last_summary >= summary_interval:
+                last_summary = now
+                print(f"{label} {state.summary()}\n")
+    return on_parsed if state is not None or print_messages else None
+
+
+def replay(args, ws_endpoints):
+    """Replay the recorded frames of the endpoints through the handlers of an unconnected client."""
+    for endpoint in ws_endpoints:
+        channel = channel_name(endpoint)
+        on_parsed = channel_handler(channel, args.summary_interval)
+        client = WebSocketClient(f"wss://{args.host}:{args.port}{endpoint}", fast=args.fast, summary_interval=args.summary_interval,
+                                 on_parsed=on_parsed, connect=False)
+        replayer = FeedReplayer(args.replay, channel, speed=args.replay_speed)
+        start = time.perf_counter()
+        try:
+            count = replayer.run(client.enqueue_message if args.fast else client.on_message)
+        except KeyboardInterrupt:
+            count = replayer.replayed
+        if client.consumer is not None:
+            client.consumer.stop()
+        elapsed = time.perf_counter() - start
+        print(f"Replayed {count} {channel} frames in {elapsed:.2f}s, {count / elapsed if elapsed else 0:.0f} frames/s")
+
+
+def start_profiler():
+    """Time the stages of the message path, from the token request to the handlers, see profiling.py."""
+    from profiling import Profiler
+    profiler = Profiler()
+    profiler.instrument(WebSocketClient, "on_message", "enqueue_message")
+    profiler.instrument(MessageConsumer, "_process")
+    profiler.instrument(MessageStore, "append")
+    profiler.instrument(SegmentWriter, "write")
+    profiler.instrument(OrderBook, "on_message")
+    try:
+        from ticker_analytics import TickerAnalytics
+        profiler.instrument(TickerAnalytics, "on_message")
+    except ImportError:
+        pass
+    profiler.instrument(TokenSource, "access_token")
+    # looked up in the module globals on every call, so the module functions are timed too
+    profiler.instrument(sys.modules[__name__], "request_token", "request_refresh_token", "request_access_token", label="auth")
+    profiler.instrument(json, "loads", "dumps")
+    profiler.instrument(builtins, "print")
+    return profiler
+
+
+def stop_profiler(profiler, path=None):
+    profiler.restore()
+    print(profiler.report())
+    if path:
+        print(f"Profile: {profiler.write_collapsed(path)} collapsed stacks written to {path}")
+
+
 def main():
 
     args = cli_args()
+    profiler = start_profiler() if args.profile or args.profile_file else None
+    try:
+        listen(args, profiler)
+    finally:
+        if profiler is not None:
+            stop_profiler(profiler, args.profile_file)
+
+
+def listen(args, profiler=None):
+    """Receive the endpoints of the command line, or replay their recorded frames."""
     host = args.host
     port = args.port
     user = args.username
     secret = args.password
-    ws_endpoint = args.endpoint
+    ws_endpoints = args.endpoint
 
     if args.debug:
+        import websocket
         websocket.enableTrace(True)
 
+    if args.replay:
+        replay(args, ws_endpoints)
+        return
+
     auth_url = f"https://{host}:{port}{AUTH_ENDPOINT}"
-    ws_url = f"wss://{host}:{port}{ws_endpoint}"
 
-    token = request_token(CLIENT_ID, user, secret, auth_url, ssl_verify=SSL_VERIFY)
+    # same key as rest_client.py, which has the port in the host
+    cache_host = host if int(port) == PORT else f"{host}:{port}"
+    tokens = TokenSource(CLIENT_ID, user, secret, auth_url, ssl_verify=SSL_VERIFY,
+                         cache=TokenCache(args.token_cache) if args.token_cache else None,
+                         cache_key=cache_key(cache_host, CLIENT_ID, user))
+    # token is used for authencation with the websocket endpoint
+    access_token = tokens.access_token()
 
-    if token is None:
+    if access_token is None:
         print("Failed to get token")
         return
-    # token is used for authencation with the websocket endpoint
-    access_token = token.access_token
 
     print("#############################################################")
-    print(f"Connecting to Websocket endpoint {ws_url}")
+    print(f"Connecting to Websocket endpoints {', '.join(f'wss://{host}:{port}{endpoint}' for endpoint in ws_endpoints)}")
     print("#############################################################")
 
-    ws_client = WebSocketClient(ws_url, token=access_token)
-    while True:
-        ws_client.run()
-        time.sleep(10)
+    store = MessageStore(capacity=args.max_messages, max_age=args.max_age, spill_dir=args.spill_dir)
+
+    if len(ws_endpoints) > 1:
+        import asyncio
+        from multiplex import MultiplexClient
+        if profiler is not None:
+            profiler.instrument(MultiplexClient, "dispatch", "handle")
+        # all endpoints on one event loop with the same token, every connection reconnects on its own
+        client = MultiplexClient(host, int(port), token=access_token, ping_interval=args.ping_interval, store=store, fast=args.fast,
+                                 summary_interval=args.summary_interval, record_dir=args.record, compress=args.compress,
+                                 renew_token=tokens.access_token, max_backoff=args.max_backoff)
+        for endpoint in ws_endpoints:
+            client.subscribe(endpoint, channel_handler(channel_name(endpoint), args.summary_interval, print_messages=not args.fast))
+        print(USER_MESSAGE)
+        try:
+            asyncio.run(client.run())
+        except KeyboardInterrupt:
+            pass
+        return
+
+    ws_endpoint = ws_endpoints[0]
+    ws_url = f"wss://{host}:{port}{ws_endpoint}"
+    on_parsed = channel_handler(channel_name(ws_endpoint), args.summary_interval)
+
+    recorder = SegmentWriter(args.record, prefix=channel_name(ws_endpoint), compress=args.compress) if args.record else None
+
+    def connect(token, on_parsed):
+        return WebSocketClient(ws_url, token=token, store=store, fast=args.fast, summary_interval=args.summary_interval, on_parsed=on_parsed,
+                               ping_interval=args.ping_interval, recorder=recorder)
+
+    # reconnects with a refreshed token when the connection is lost or the orderbook feed has a gap
+    supervisor = ReconnectSupervisor(connect, tokens.access_token, on_parsed, backoff=Backoff(maximum=args.max_backoff))
+    supervisor.run(access_token)
+    store.close()
+    if recorder is not None:
+        recorder.close()
 
 
 if __name__ == "__main__":